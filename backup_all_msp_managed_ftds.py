@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+from datetime import date
+from typing import List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from scc_firewall_manager_sdk import MspManagedTenantDto, Device
+
+from factories import async_api_client_factory
+from factories.async_api_client_factory import AsyncApiClient
+from models.fmc import DeviceBackupRequest
+from services import async_msp_managed_tenant_token_service, \
+    async_fmc_task_service, async_cdfmc_service
+
+
+async def _get_managed_tenants(api_client: AsyncApiClient) -> List[
+    MspManagedTenantDto]:
+    limit = 200
+    offset = 0
+    count = None
+    all_tenants: List[MspManagedTenantDto] = []
+
+    while count is None or len(all_tenants) < count:
+        tenant_page = await api_client.get(
+            "/v1/msp/tenants", params={"limit": str(limit), "offset": str(offset)})
+        if not tenant_page.get("items"):
+            break
+        all_tenants.extend(
+            [MspManagedTenantDto.from_dict(t) for t in tenant_page["items"]])
+        offset += limit
+        count = tenant_page["count"]
+
+    return [tenant for tenant in all_tenants if
+            tenant.cd_fmc_type != 'UNPROVISIONED']
+
+
+async def _get_online_cdfmc_managed_ftds(api_client: AsyncApiClient) -> List[
+    Device]:
+    limit = 200
+    offset = 0
+    count = None
+    all_devices: List[Device] = []
+
+    while count is None or len(all_devices) < count:
+        device_page = await api_client.get(
+            "/v1/inventory/devices",
+            params={"limit": str(limit), "offset": str(offset),
+                    "q": "deviceType:CDFMC_MANAGED_FTD AND connectivityState:ONLINE AND redundancyMode:STANDALONE"})
+        if not device_page.get("items"):
+            break
+        all_devices.extend([Device.from_dict(d) for d in device_page["items"]])
+        offset += limit
+        count = device_page["count"]
+
+    return all_devices
+
+
+async def _backup_tenant(tenant: MspManagedTenantDto,
+                         msp_api_client: AsyncApiClient,
+                         semaphore: asyncio.Semaphore) -> str:
+    async with semaphore:
+        token = await async_msp_managed_tenant_token_service.get_token_for_managed_tenant(
+            tenant, msp_api_client)
+
+    # Waiting for the backup task holds no semaphore slot, so thousands of
+    # tenants can be waited on at once
+    async with async_api_client_factory.build_async_api_client_for_managed_tenant(
+        tenant, token, connection_limit=4) as tenant_api_client:
+        async with semaphore:
+            domain_uid = await async_cdfmc_service.get_cdfmc_domain_uid(
+                tenant_api_client)
+            if not domain_uid:
+                return "No cdFMC found"
+            online_ftds = await _get_online_cdfmc_managed_ftds(tenant_api_client)
+            if not online_ftds:
+                return "No online cdFMC-managed FTDs found"
+
+            current_date = date.today().isoformat()
+            backup_response = await async_cdfmc_service.create_device_backup(
+                tenant_api_client, domain_uid, DeviceBackupRequest(
+                    name=f"backup-{current_date}",
+                    description=f"Backup on {current_date}",
+                    device_ids=[device.device_record_on_fmc.uid for device in
+                                online_ftds],
+                ).to_dict())
+
+        task_id = backup_response.get("metadata", {}).get("task", {}).get("id")
+        if not task_id:
+            return f"Backup of {len(online_ftds)} FTD(s) submitted"
+        task = await async_fmc_task_service.wait_for_task_completion(
+            domain_uid, task_id, tenant_api_client)
+        if task.status == "FAILED":
+            return f"Backup of {len(online_ftds)} FTD(s) failed: {task.message}"
+        return f"Backup of {len(online_ftds)} FTD(s) completed: {task.status}"
+
+
+async def backup_all_msp_managed_ftds(max_concurrent_requests: int = 20) -> None:
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+    async with async_api_client_factory.build_async_api_client() as msp_api_client:
+        tenants = await _get_managed_tenants(msp_api_client)
+        print(f"Backing up FTDs in {len(tenants)} managed tenant(s) with cdFMC...")
+        results = await asyncio.gather(
+            *[_backup_tenant(tenant, msp_api_client, semaphore) for tenant in
+              tenants], return_exceptions=True)
+
+    for tenant, result in zip(tenants, results):
+        print(f"  {tenant.display_name}: {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Back up all online cdFMC-managed FTDs in every managed tenant")
+    parser.add_argument("--max-concurrent-requests", type=int, default=20,
+                        help="Number of API calls to have in flight at once")
+    args = parser.parse_args()
+    asyncio.run(backup_all_msp_managed_ftds(args.max_concurrent_requests))
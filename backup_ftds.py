@@ -1,8 +1,7 @@
-import json
+import argparse
 from typing import List
 
 import questionary
-import requests
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,7 +14,9 @@ from scc_firewall_manager_sdk import MSPTenantManagementApi, \
     MspManagedTenantDto, InventoryApi, ApiClient, Configuration
 
 from factories import api_client_factory
-from services import msp_managed_tenant_token_service, fmc_task_service
+from factories.cdfmc_rest_client_factory import get_cdfmc_rest_client
+from services import msp_managed_tenant_token_service, fmc_task_service, \
+    profiling_service
 
 
 def _get_cdfmc_domain_uid(tenant_api_token: str, host: str):
@@ -51,22 +52,15 @@ def _get_online_cdfmc_managed_ftds(tenant_api_token: str, host: str) -> List:
 def _create_device_backup(tenant_api_token: str, host: str,
     cdfmc_domain_uid: str, fmc_device_uids: List[str]):
     current_date = date.today().isoformat()
-    url = (f"{host}/v1/cdfmc/api/fmc_config/v1/domain/{cdfmc_domain_uid}/backup/"
-           f"operational/devicebackup")
-    headers = {
-        "Authorization": f"Bearer {tenant_api_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-    payload = json.dumps(DeviceBackupRequest(
-        name=f"backup-{current_date}",
-        description=f"Backup on {current_date}",
-        device_ids=fmc_device_uids,
-    ).to_dict())
-
-    response = requests.post(url, headers=headers, data=payload)
-    response.raise_for_status()
-    return response.json()
+    rest_client = get_cdfmc_rest_client(host, tenant_api_token)
+    return rest_client.post(
+        rest_client.fmc_config_url(cdfmc_domain_uid,
+                                   "backup/operational/devicebackup"),
+        json=DeviceBackupRequest(
+            name=f"backup-{current_date}",
+            description=f"Backup on {current_date}",
+            device_ids=fmc_device_uids,
+        ).to_dict())
 
 
 def _create_device_backup_for_all_online_cdfmc_managed_ftds(
@@ -118,6 +112,7 @@ def _get_managed_tenants() -> List[MspManagedTenantDto]:
             tenant.cd_fmc_type != 'UNPROVISIONED']
 
 
+@profiling_service.traced("input")
 def _select_tenants(tenants: List[MspManagedTenantDto]) -> List[
     MspManagedTenantDto]:
     tenant_choices = [
@@ -139,6 +134,12 @@ def _select_tenants(tenants: List[MspManagedTenantDto]) -> List[
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Back up the online cdFMC-managed FTDs of selected tenants")
+    profiling_service.add_profile_argument(parser)
+    args = parser.parse_args()
+    profiling_service.enable_if_requested(args.profile)
+
     all_tenants = _get_managed_tenants()
     print(f"Found {len(all_tenants)} managed tenants")
 
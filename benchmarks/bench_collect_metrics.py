@@ -0,0 +1,326 @@
+"""Benchmark for the Telegraf collector (telegraf-grafana/collect_metrics.py)
+at fleet scale.
+
+API responses for a synthetic fleet (mock_server.fleet) are recorded once
+and then replayed through the SDK's REST layer, so every stage runs the real
+fetch_* functions, SDK deserialization and line protocol converters without
+a network. Wall time, API calls, items, lines per second and the process's
+peak RSS are reported per stage, followed by an end-to-end run of main().
+
+    python -m benchmarks.bench_collect_metrics --tenants 50 --asas-per-tenant 2000
+
+Exits with status 1 when the main() run exceeds --budget-seconds, which
+defaults to the Telegraf exec timeout.
+"""
+import argparse
+import gc
+import json
+import re
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager, redirect_stdout
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+from scc_firewall_manager_sdk import rest
+
+from mock_server.fleet import MockFleet, MockTenant, build_fleet, \
+    fmc_health_metrics, asa_health_metrics
+from mock_server.server import MockServerSettings, TENANT_TOKEN_PREFIX, \
+    TIME_RANGE_SECONDS, asa_window, parse_query
+from models import serialization
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent /
+                       "telegraf-grafana"))
+import collect_metrics  # noqa: E402
+
+TELEGRAF_EXEC_TIMEOUT_SECONDS = 120
+_UID_SEGMENT = re.compile(r"/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-"
+                          r"[0-9a-f]{12}")
+
+
+@dataclass
+class StageResult:
+    stage: str
+    seconds: float
+    api_calls: int
+    items: int
+    lines: int
+    peak_rss_mb: float
+
+    @property
+    def lines_per_second(self) -> float:
+        return self.lines / self.seconds if self.seconds else 0.0
+
+
+class _RecordedResponse:
+    def __init__(self, data: bytes):
+        self.status = 200
+        self.reason = "OK"
+        self.data = data
+        self.headers = {"content-type": "application/json"}
+
+
+class ReplayTransport:
+    """Stands in for RESTClientObject.request. A response is rendered from
+    the fleet the first time a request is seen and replayed from then on."""
+
+    def __init__(self, fleet: MockFleet, now: datetime,
+                 max_page_size: int = MockServerSettings.max_page_size):
+        self.now = now
+        self.max_page_size = max_page_size
+        self.tenants_by_token = {TENANT_TOKEN_PREFIX + tenant.uid: tenant for
+                                 tenant in fleet.tenants}
+        self.recordings: Dict[str, bytes] = {}
+        self.calls: Counter = Counter()
+        # Metrics for a whole tenant, which paged responses are sliced from
+        self._asa_metrics: Dict[Tuple[str, int], List[dict]] = {}
+
+    def request(self, method, url, headers=None, body=None, post_params=None,
+                _request_timeout=None) -> rest.RESTResponse:
+        token = headers["Authorization"].removeprefix("Bearer ")
+        parsed = urlsplit(url)
+        # Drop the regional host's path prefix, e.g. /firewall
+        path = parsed.path[parsed.path.index("/v1/"):]
+        self.calls[f"{method} {_UID_SEGMENT.sub('/{uid}', path)}"] += 1
+        key = f"{token} {method} {path}?{parsed.query}"
+        if key not in self.recordings:
+            self.recordings[key] = serialization.dumps(self._render(
+                self.tenants_by_token[token], path,
+                dict(parse_qsl(parsed.query))))
+        return rest.RESTResponse(_RecordedResponse(self.recordings[key]))
+
+    def _page(self, items: List[dict], query: Dict[str, str]) -> dict:
+        items = [item for item in items if parse_query(query.get("q"))(item)]
+        limit = min(int(query.get("limit", 50)), self.max_page_size)
+        offset = int(query.get("offset", 0))
+        return {"count": len(items), "limit": limit, "offset": offset,
+                "items": items[offset:offset + limit]}
+
+    def _render(self, tenant: MockTenant, path: str, query: Dict[str, str]):
+        if path == "/v1/inventory/managers":
+            return self._page([tenant.manager], query)
+        if path.startswith("/v1/inventory/managers/") and \
+            path.endswith("/health/metrics"):
+            return fmc_health_metrics(tenant, self.now, TIME_RANGE_SECONDS[
+                query.get("timeRange", "5m")])
+        if path == "/v1/inventory/devices/asas/health/metrics":
+            end, window = asa_window(query, self.now)
+            if (tenant.uid, window) not in self._asa_metrics:
+                self._asa_metrics[(tenant.uid, window)] = asa_health_metrics(
+                    tenant, end, window)
+            items = self._asa_metrics[(tenant.uid, window)]
+            limit = min(int(query.get("limit", 50)), self.max_page_size)
+            offset = int(query.get("offset", 0))
+            return {"items": items[offset:offset + limit],
+                    "total": len(items), "limit": limit, "offset": offset}
+        if path == "/v1/inventory/devices":
+            return self._page(tenant.devices, query)
+        raise ValueError(f"No recording for {path}")
+
+    def clear_rendered(self) -> None:
+        self._asa_metrics.clear()
+
+    @property
+    def recorded_bytes(self) -> int:
+        return sum(len(data) for data in self.recordings.values())
+
+
+@contextmanager
+def _replaying(transport: ReplayTransport):
+    original = rest.RESTClientObject.request
+    rest.RESTClientObject.request = \
+        lambda _, *args, **kwargs: transport.request(*args, **kwargs)
+    try:
+        yield
+    finally:
+        rest.RESTClientObject.request = original
+
+
+class _LineCounter:
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        self.lines += text.count("\n")
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def _reset_peak_rss() -> None:
+    # Linux can reset the peak so it is measured per stage; elsewhere the
+    # process-wide peak so far is reported
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _run_stage(name: str, transport: ReplayTransport,
+               func: Callable[[], Tuple[int, int]]) -> StageResult:
+    gc.collect()
+    _reset_peak_rss()
+    calls_before = sum(transport.calls.values())
+    start = time.perf_counter()
+    items, lines = func()
+    seconds = time.perf_counter() - start
+    return StageResult(stage=name, seconds=seconds,
+                       api_calls=sum(transport.calls.values()) - calls_before,
+                       items=items, lines=lines, peak_rss_mb=_peak_rss_mb())
+
+
+def _run_main(tenants: List[collect_metrics.Tenant]) -> Tuple[int, int]:
+    output = _LineCounter()
+    with tempfile.TemporaryDirectory() as directory:
+        tenants_file = Path(directory) / "tenants.json"
+        tenants_file.write_text(json.dumps([asdict(t) for t in tenants]))
+        original_tenants_file = collect_metrics.TENANTS_FILE
+        collect_metrics.TENANTS_FILE = tenants_file
+        try:
+            with redirect_stdout(output):
+                collect_metrics.main()
+        finally:
+            collect_metrics.TENANTS_FILE = original_tenants_file
+    return len(tenants), output.lines
+
+
+def run(tenant_count: int, ftds_per_tenant: int, asas_per_tenant: int,
+        budget_seconds: float, json_file: str = None) -> bool:
+    fleet = build_fleet(tenant_count, ftds_per_tenant, asas_per_tenant)
+    transport = ReplayTransport(fleet, datetime.now(timezone.utc))
+    tenants = [collect_metrics.Tenant(
+        name=tenant.tenant["name"], region="bench",
+        api_token=TENANT_TOKEN_PREFIX + tenant.uid) for tenant in
+        fleet.tenants if tenant.tenant["cdFmcType"] != "UNPROVISIONED"]
+    print(f"{len(tenants)} tenants, {ftds_per_tenant} FTDs and "
+          f"{asas_per_tenant} ASAs per tenant")
+
+    fmc_metrics = {}
+    asa_devices = {}
+    asa_metrics = {}
+
+    def fetch_fmc():
+        for tenant in tenants:
+            fmc_metrics[tenant.name] = collect_metrics.fetch_fmc_metrics(tenant)
+        return sum(len(m) for m in fmc_metrics.values()), 0
+
+    def fetch_asa_devices():
+        for tenant in tenants:
+            asa_devices[tenant.name] = collect_metrics.fetch_asa_devices(tenant)
+        return sum(len(d) for d in asa_devices.values()), 0
+
+    def fetch_asa_metrics():
+        for tenant in tenants:
+            asa_metrics[tenant.name] = collect_metrics.fetch_asa_metrics(tenant)
+        return sum(len(m) for m in asa_metrics.values()), 0
+
+    def convert_fmc():
+        lines = 0
+        for tenant_name, metrics in fmc_metrics.items():
+            for metric in metrics:
+                lines += len(collect_metrics.fmc_metrics_to_line_protocol(
+                    tenant_name, metric))
+        return sum(len(m) for m in fmc_metrics.values()), lines
+
+    def convert_asa():
+        lines = 0
+        for tenant_name, items in asa_metrics.items():
+            for item in items:
+                lines += len(collect_metrics.asa_metrics_to_line_protocol(
+                    tenant_name, item))
+        return sum(len(m) for m in asa_metrics.values()), lines
+
+    stages = [("fetch_fmc_metrics", fetch_fmc),
+              ("fetch_asa_devices", fetch_asa_devices),
+              ("fetch_asa_metrics", fetch_asa_metrics),
+              ("fmc_metrics_to_line_protocol", convert_fmc),
+              ("asa_metrics_to_line_protocol", convert_asa)]
+    with _replaying(transport):
+        # Record every response up front so stage timings only cover replay
+        start = time.perf_counter()
+        for _, stage in stages[:3]:
+            stage()
+        transport.clear_rendered()
+        fmc_metrics.clear()
+        asa_devices.clear()
+        asa_metrics.clear()
+        print(f"recorded {len(transport.recordings)} responses "
+              f"({transport.recorded_bytes / 1e6:.1f} MB) in "
+              f"{time.perf_counter() - start:.2f}s\n")
+
+        results = [_run_stage(name, transport, stage) for name, stage in
+                   stages]
+        fmc_metrics.clear()
+        asa_devices.clear()
+        asa_metrics.clear()
+        results.append(_run_stage("main", transport,
+                                  lambda: _run_main(tenants)))
+
+    print(f"{'stage':<30} {'seconds':>9} {'api calls':>10} {'items':>9} "
+          f"{'lines':>9} {'lines/s':>10} {'peak RSS':>10}")
+    for result in results:
+        print(f"{result.stage:<30} {result.seconds:>9.2f} "
+              f"{result.api_calls:>10} {result.items:>9} {result.lines:>9} "
+              f"{result.lines_per_second:>10.0f} "
+              f"{result.peak_rss_mb:>8.0f}MB")
+
+    expected_asas = sum(len(tenant.asas) for tenant in fleet.tenants if
+                        tenant.tenant["cdFmcType"] != "UNPROVISIONED")
+    fetched_asas = results[2].items
+    main_seconds = results[-1].seconds
+    print(f"\nASA metrics fetched for {fetched_asas} of {expected_asas} ASAs")
+    print(f"main: {main_seconds:.2f}s, budget {budget_seconds:.0f}s")
+    print("\napi calls per endpoint (all stages):")
+    for endpoint, count in transport.calls.most_common():
+        print(f"  {count:>8}  {endpoint}")
+
+    within_budget = main_seconds <= budget_seconds
+    if json_file:
+        with open(json_file, "w") as f:
+            json.dump({
+                "tenants": len(tenants), "ftds_per_tenant": ftds_per_tenant,
+                "asas_per_tenant": asas_per_tenant,
+                "stages": [dict(asdict(result),
+                                lines_per_second=result.lines_per_second) for
+                           result in results],
+                "main_seconds": main_seconds,
+                "budget_seconds": budget_seconds,
+                "within_budget": within_budget,
+                "api_calls": dict(transport.calls),
+            }, f, indent=2)
+    return within_budget
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--ftds-per-tenant", type=int, default=100)
+    parser.add_argument("--asas-per-tenant", type=int, default=2000)
+    parser.add_argument("--budget-seconds", type=float,
+                        default=TELEGRAF_EXEC_TIMEOUT_SECONDS)
+    parser.add_argument("--json", dest="json_file",
+                        help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    if not run(args.tenants, args.ftds_per_tenant, args.asas_per_tenant,
+               args.budget_seconds, args.json_file):
+        sys.exit(1)
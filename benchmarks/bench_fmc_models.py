@@ -0,0 +1,85 @@
+"""Microbenchmark for models.fmc: memory per access rule and the time to
+build, convert and encode a bulk payload of rules.
+
+    python -m benchmarks.bench_fmc_models --rules 10000
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from typing import Callable, List
+
+from models import serialization
+from models.fmc import CdFmcAccessRule, NetworkObject, SourceNetworks, \
+    UrlCategory, UrlCategoryWithReputation, Urls, network_object, \
+    url_category, url_category_with_reputation
+
+
+def _build_rules_unshared(count: int) -> List[CdFmcAccessRule]:
+    # Every rule gets its own copies of the referenced objects
+    return [CdFmcAccessRule(
+        name=f"Rule {i}", action="BLOCK", enabled=True,
+        urls=Urls([UrlCategoryWithReputation(
+            reputation="TRUSTED_AND_UNKNOWN",
+            category=UrlCategory(name="Gambling", id="gambling-id"))]),
+        source_networks=SourceNetworks([NetworkObject(
+            type="Network", overridable=False, id="any-ipv4-id",
+            name="any-ipv4")]))
+        for i in range(count)]
+
+
+def _build_rules_shared(count: int) -> List[CdFmcAccessRule]:
+    gambling = url_category_with_reputation(
+        "TRUSTED_AND_UNKNOWN", url_category("Gambling", "gambling-id"))
+    any_ipv4 = network_object("Network", False, "any-ipv4-id", "any-ipv4")
+    return [CdFmcAccessRule(
+        name=f"Rule {i}", action="BLOCK", enabled=True,
+        urls=Urls([gambling]), source_networks=SourceNetworks([any_ipv4]))
+        for i in range(count)]
+
+
+def _measure_memory(build: Callable[[int], list], count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    rules = build(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rules
+    return current / count
+
+
+def _time_per_rule(func: Callable[[], object], count: int,
+                   repeat: int) -> float:
+    best = min(_timed(func) for _ in range(repeat))
+    return best / count * 1_000_000
+
+
+def _timed(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(count: int, repeat: int) -> None:
+    print(f"{count} rules, best of {repeat}")
+    print(f"serializer: {'orjson' if serialization.orjson else 'json'}")
+    for label, build in [("unshared", _build_rules_unshared),
+                         ("shared", _build_rules_shared)]:
+        rules = build(count)
+        payload = [rule.to_dict() for rule in rules]
+        print(f"\n{label} sub-objects")
+        print(f"  memory:        {_measure_memory(build, count):8.0f} bytes/rule")
+        print(f"  build:         {_time_per_rule(lambda: build(count), count, repeat):8.2f} us/rule")
+        print(f"  to_dict:       {_time_per_rule(lambda: [r.to_dict() for r in rules], count, repeat):8.2f} us/rule")
+        print(f"  json.dumps:    {_time_per_rule(lambda: json.dumps(payload), count, repeat):8.2f} us/rule")
+        print(f"  fast dumps:    {_time_per_rule(lambda: serialization.dumps(payload), count, repeat):8.2f} us/rule")
+        print(f"  payload:       {len(serialization.dumps(payload)) / count:8.0f} bytes/rule")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.rules, args.repeat)
@@ -0,0 +1,219 @@
+"""Benchmark for the line protocol encoders in
+telegraf-grafana/collect_metrics.py against the previous encoder, on SDK
+objects built from a synthetic fleet.
+
+    python -m benchmarks.bench_line_protocol --tenants 50 --asas-per-tenant 2000
+
+The current encoder is timed with an empty tag prefix cache, as in one-shot
+exec mode, and with the cache left by a previous scrape, as in daemon mode.
+"""
+import argparse
+import gc
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from scc_firewall_manager_sdk import FmcHealthMetrics, MetricsItem
+
+from mock_server.fleet import build_fleet, fmc_health_metrics, \
+    asa_health_metrics
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent /
+                       "telegraf-grafana"))
+import collect_metrics  # noqa: E402
+
+
+# The encoder as it was before the tag prefix cache, kept as the baseline
+
+def _legacy_escape_tag_value(value: str) -> str:
+    return value.replace(" ", "\\ ").replace(",", "\\,").replace("=", "\\=")
+
+
+def _legacy_asa_metrics_to_line_protocol(tenant_name: str,
+                                         metrics_item: MetricsItem,
+                                         uid_to_name: Dict[str, str]) -> List[str]:
+    lines = []
+    device_uid = metrics_item.uid or "unknown"
+    device_name = uid_to_name.get(device_uid, "unknown")
+    tags = f"tenant={_legacy_escape_tag_value(tenant_name)},deviceName={_legacy_escape_tag_value(device_name)},deviceUid={_legacy_escape_tag_value(device_uid)}"
+    metrics = metrics_item.metrics
+    if not metrics:
+        return lines
+    timestamps = set()
+    cpu = metrics.get('cpu')
+    mem = metrics.get('mem')
+    disk = metrics.get('disk')
+    if cpu and cpu.series:
+        for s in cpu.series:
+            timestamps.add(s.timestamp)
+    if mem and mem.series:
+        for s in mem.series:
+            timestamps.add(s.timestamp)
+    if disk and disk.series:
+        for s in disk.series:
+            timestamps.add(s.timestamp)
+    cpu_values = {s.timestamp: s.value for s in cpu.series} if cpu and cpu.series else {}
+    mem_values = {s.timestamp: s.value for s in mem.series} if mem and mem.series else {}
+    disk_values = {s.timestamp: s.value for s in disk.series} if disk and disk.series else {}
+    for ts in sorted(timestamps):
+        fields = []
+        if ts in cpu_values:
+            fields.append(f"cpu_pct={cpu_values[ts]}")
+        if ts in mem_values:
+            fields.append(f"memory_pct={mem_values[ts]}")
+        if ts in disk_values:
+            fields.append(f"disk_pct={disk_values[ts]}")
+        if fields:
+            timestamp_ns = int(ts.timestamp() * 1_000_000_000)
+            lines.append(
+                f"asa_health_metrics,{tags} {','.join(fields)} {timestamp_ns}")
+    return lines
+
+
+def _legacy_fmc_metrics_to_line_protocol(tenant_name: str,
+                                         device_health_metric: FmcHealthMetrics) -> List[str]:
+    lines = []
+    timestamp = int(time.time() * 1_000_000_000)
+    device_uid = device_health_metric.device_uid or "unknown"
+    device_name = device_health_metric.device_name or "unknown"
+    tags = f"tenant={_legacy_escape_tag_value(tenant_name)},deviceName={_legacy_escape_tag_value(device_name)},deviceUid={_legacy_escape_tag_value(device_uid)}"
+    cpu = device_health_metric.cpu_health_metrics
+    if cpu:
+        fields = []
+        if cpu.lina_usage_avg is not None:
+            fields.append(f"cpu_lina_pct={cpu.lina_usage_avg}")
+        if cpu.snort_usage_avg is not None:
+            fields.append(f"cpu_snort_pct={cpu.snort_usage_avg}")
+        if cpu.system_usage_avg is not None:
+            fields.append(f"cpu_system_pct={cpu.system_usage_avg}")
+        if fields:
+            lines.append(
+                f"fmc_health_metrics,{tags} {','.join(fields)} {timestamp}")
+    memory = device_health_metric.memory_health_metrics
+    if memory:
+        fields = []
+        if memory.lina_usage_avg is not None:
+            fields.append(f"memory_lina_pct={memory.lina_usage_avg}")
+        if memory.snort_usage_avg is not None:
+            fields.append(f"memory_snort_pct={memory.snort_usage_avg}")
+        if memory.system_usage_avg is not None:
+            fields.append(f"memory_system_pct={memory.system_usage_avg}")
+        if fields:
+            lines.append(
+                f"fmc_health_metrics,{tags} {','.join(fields)} {timestamp}")
+    disk = device_health_metric.disk_health_metrics
+    if disk:
+        fields = []
+        if disk.total_disk_usage_avg is not None:
+            fields.append(f"disk_total_pct={disk.total_disk_usage_avg}")
+        if fields:
+            lines.append(
+                f"fmc_health_metrics,{tags} {','.join(fields)} {timestamp}")
+    return lines
+
+
+def _encode(fmc: Callable, asa: Callable, fleet_metrics: list) -> List[str]:
+    lines = []
+    for tenant_name, fmc_metrics, asa_items, uid_to_name in fleet_metrics:
+        for metric in fmc_metrics:
+            lines.extend(fmc(tenant_name, metric))
+        for item in asa_items:
+            lines.extend(asa(tenant_name, item, uid_to_name))
+    return lines
+
+
+_UNESCAPED_SPACE = re.compile(r"(?<!\\) ")
+_UNESCAPED_COMMA = re.compile(r"(?<!\\),")
+
+
+def _points(lines: List[str]) -> Dict[tuple, Dict[str, str]]:
+    """Fields per series and timestamp, so encoders that tag or split points
+    differently can be compared. The deviceName tag is dropped, as the
+    current schema keeps names in a lookup measurement, and FMC timestamps are
+    ignored, as the previous encoder stamped them with the time of
+    encoding."""
+    points: Dict[tuple, Dict[str, str]] = {}
+    for line in lines:
+        series, fields, timestamp = _UNESCAPED_SPACE.split(line)
+        measurement, *tags = _UNESCAPED_COMMA.split(series)
+        key = (measurement, tuple(tag for tag in tags if
+                                  not tag.startswith("deviceName=")),
+               None if measurement.startswith("fmc_") else timestamp)
+        points.setdefault(key, {}).update(
+            field.split("=", 1) for field in fields.split(","))
+    return points
+
+
+def _best_of(repeat: int, func: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(tenant_count: int, ftds_per_tenant: int, asas_per_tenant: int,
+        repeat: int) -> None:
+    fleet = build_fleet(tenant_count, ftds_per_tenant, asas_per_tenant)
+    now = datetime.now(timezone.utc)
+    fleet_metrics = []
+    for tenant in fleet.tenants:
+        # Names with characters that need escaping exercise the escapers
+        tenant_name = f"{tenant.tenant['displayName']}, Inc."
+        fleet_metrics.append((
+            tenant_name,
+            # The previous encoder only wrote CPU, memory and disk
+            [FmcHealthMetrics.from_dict(dict(
+                m, interfaceHealthMetrics=None, raVpnSessionHealthMetrics=None,
+                s2sVpnTunnelHealthMetrics=None)) for m in
+             fmc_health_metrics(tenant, now, 300)],
+            [MetricsItem.from_dict(m) for m in
+             asa_health_metrics(tenant, now, 600)],
+            {asa["uid"]: asa["name"] for asa in tenant.asas}))
+    print(f"{len(fleet.tenants)} tenants, {ftds_per_tenant} FTDs and "
+          f"{asas_per_tenant} ASAs per tenant")
+
+    legacy_lines = _encode(_legacy_fmc_metrics_to_line_protocol,
+                           _legacy_asa_metrics_to_line_protocol, fleet_metrics)
+    legacy_seconds = _best_of(repeat, lambda: _encode(
+        _legacy_fmc_metrics_to_line_protocol,
+        _legacy_asa_metrics_to_line_protocol, fleet_metrics))
+
+    def encode_current(cache: collect_metrics.TagPrefixCache):
+        return _encode(
+            lambda t, m: collect_metrics.fmc_metrics_to_line_protocol(
+                t, m, cache),
+            lambda t, i, _: collect_metrics.asa_metrics_to_line_protocol(
+                t, i, cache), fleet_metrics)
+
+    warm_cache = collect_metrics.TagPrefixCache()
+    current_lines = encode_current(warm_cache)
+    if _points(current_lines) != _points(legacy_lines):
+        raise AssertionError("Encoders produced different points")
+    cold_seconds = _best_of(repeat, lambda: encode_current(
+        collect_metrics.TagPrefixCache()))
+    warm_seconds = _best_of(repeat, lambda: encode_current(warm_cache))
+
+    print(f"{len(current_lines)} lines, same points, "
+          f"{len(warm_cache)} cached tag prefixes, best of {repeat}\n")
+    print(f"{'encoder':<28} {'seconds':>9} {'lines/s':>11} {'speedup':>8}")
+    for label, seconds in [("previous", legacy_seconds),
+                           ("current, cold cache", cold_seconds),
+                           ("current, warm cache", warm_seconds)]:
+        print(f"{label:<28} {seconds:>9.2f} {len(legacy_lines) / seconds:>11.0f} "
+              f"{legacy_seconds / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--ftds-per-tenant", type=int, default=100)
+    parser.add_argument("--asas-per-tenant", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.tenants, args.ftds_per_tenant, args.asas_per_tenant, args.repeat)
@@ -1,16 +1,29 @@
 import argparse
+import csv
+import fnmatch
 import sys
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from typing import List, Optional
 
-import requests
 from dotenv import load_dotenv
 
 load_dotenv()
 from scc_firewall_manager_sdk import InventoryApi, MSPUserManagementApi, \
-    MspAddUsersToTenantInput, MSPTenantManagementApi, ApiClient
+    MspAddUsersToTenantInput, MSPTenantManagementApi, ApiClient, \
+    MspManagedTenantDto
+from rich.console import Console
+from rich.table import Table
 
 from factories import api_client_factory
-from services import msp_managed_tenant_token_service
+from factories.cdfmc_rest_client_factory import \
+    get_cdfmc_rest_client_for_api_client
+from services import msp_managed_tenant_token_service, \
+    cdfmc_access_rule_service, cdfmc_object_cache_service, \
+    cdfmc_policy_sync_service
+from services.cdfmc_policy_sync_service import PolicyDefinition
 from models.fmc import CdFmcAccessPolicy, CdFmcAccessRule, \
     UrlCategoryWithReputation, UrlCategory, SourceNetworks, NetworkObject, Urls
 
@@ -25,57 +38,42 @@ def get_cdfmc_domain_uid(api_client: ApiClient):
         return None
 
 
-def _get_gambling_category_id(api_client: ApiClient,
+def _get_gambling_category_id(api_client: ApiClient, tenant_uid: str,
     cdfmc_domain_uid: str) -> str:
-    url = f"{api_client.configuration.host}/v1/cdfmc/api/fmc_config/v1/domain/{cdfmc_domain_uid}/object/urlcategories?limit=200"
-    headers = {
-        "Authorization": f"Bearer {api_client.configuration.access_token}",
-        "Content-Type": "application/json",
-    }
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    url_categories = response.json()["items"]
-
-    gambling_categories = [
-        category for category in url_categories if
-        category["name"] == "Gambling"
-    ]
-    return gambling_categories[0]["id"]
-
-
-def _get_any_ipv4_network_object(api_client, cdfmc_domain_uid: str) -> str:
-    url = f"{api_client.configuration.host}/v1/cdfmc/api/fmc_config/v1/domain/{cdfmc_domain_uid}/object/networks?filter=nameOrValue%3Aany-ipv4"
-    headers = {
-        "Authorization": f"Bearer {api_client.configuration.access_token}",
-        "Content-Type": "application/json",
-    }
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
-
-    if data["paging"]["count"] != 1:
+    object_cache = cdfmc_object_cache_service.get_object_cache(
+        get_cdfmc_rest_client_for_api_client(api_client), tenant_uid,
+        cdfmc_domain_uid)
+    gambling_category_id = object_cache.get_id(
+        cdfmc_object_cache_service.URL_CATEGORIES, "Gambling")
+    if gambling_category_id is None:
+        raise RuntimeError("Expected a URL category with name 'Gambling'")
+    return gambling_category_id
+
+
+def _get_any_ipv4_network_object(api_client, tenant_uid: str,
+                                 cdfmc_domain_uid: str) -> str:
+    object_cache = cdfmc_object_cache_service.get_object_cache(
+        get_cdfmc_rest_client_for_api_client(api_client), tenant_uid,
+        cdfmc_domain_uid)
+    any_ipv4_obj_id = object_cache.get_id(cdfmc_object_cache_service.NETWORKS,
+                                          "any-ipv4")
+    if any_ipv4_obj_id is None:
         raise RuntimeError(
             "Expected exactly one network object with name 'any-ipv4'"
         )
 
-    return data["items"][0]["id"]
+    return any_ipv4_obj_id
 
 
-def block_gambling(access_policy_uid: str, cdfmc_domain_uid: str,
-    api_client: ApiClient):
+def block_gambling(access_policy_uid: str, tenant_uid: str,
+    cdfmc_domain_uid: str, api_client: ApiClient):
     gambling_category_id: str = _get_gambling_category_id(api_client,
+                                                          tenant_uid,
                                                           cdfmc_domain_uid)
     any_ipv4_obj_id: str = _get_any_ipv4_network_object(api_client,
+                                                        tenant_uid,
                                                         cdfmc_domain_uid)
 
-    url = (
-        f"{api_client.configuration.host}/v1/cdfmc/api/fmc_config/v1/domain/"
-        f"{cdfmc_domain_uid}/policy/accesspolicies/{access_policy_uid}/accessrules"
-    )
-    headers = {
-        "Authorization": f"Bearer {api_client.configuration.access_token}",
-        "Content-Type": "application/json",
-    }
     access_rule = CdFmcAccessRule(
         name="Block Gambling",
         action="BLOCK",
@@ -103,10 +101,23 @@ def block_gambling(access_policy_uid: str, cdfmc_domain_uid: str,
         ),
     )
 
-    response = requests.post(url, headers=headers, json=access_rule.to_dict())
-    response.raise_for_status()
+    result = cdfmc_access_rule_service.create_access_rules(
+        get_cdfmc_rest_client_for_api_client(api_client), cdfmc_domain_uid,
+        access_policy_uid, [access_rule])[0]
+    if result.error:
+        raise RuntimeError(f"Failed to create access rule: {result.error}")
+    return result.id
+
 
-    return response.json()
+def _create_access_policy_in_domain(api_client: ApiClient,
+                                    domain_uid: str) -> str:
+    policy = CdFmcAccessPolicy(name="MSP Access Policy " + str(uuid.uuid1()),
+                               default_action="BLOCK")
+    rest_client = get_cdfmc_rest_client_for_api_client(api_client)
+    created_policy = rest_client.post(
+        rest_client.fmc_config_url(domain_uid, "policy/accesspolicies"),
+        json=policy.to_dict())
+    return created_policy["id"]
 
 
 def _create_cdfmc_access_policy(api_client: ApiClient) -> tuple[str, str]:
@@ -115,19 +126,7 @@ def _create_cdfmc_access_policy(api_client: ApiClient) -> tuple[str, str]:
         print("Tenant does not have a cdFMC")
         sys.exit(1)
 
-    policy = CdFmcAccessPolicy(name="MSP Access Policy " + str(uuid.uuid1()),
-                               default_action="BLOCK")
-    url = (
-        f"{api_client.configuration.host}/v1/cdfmc/api/fmc_config/v1/domain/"
-        f"{domain_uid}/policy/accesspolicies"
-    )
-    headers = {
-        "Authorization": f"Bearer {api_client.configuration.access_token}",
-        "Content-Type": "application/json",
-    }
-    response = requests.post(url, headers=headers, json=policy.__dict__)
-    response.raise_for_status()
-    return response.json()["id"], domain_uid
+    return _create_access_policy_in_domain(api_client, domain_uid), domain_uid
 
 
 def _create_api_only_user_in_managed_tenant(tenant_uid: str) -> None:
@@ -137,7 +136,22 @@ def _create_api_only_user_in_managed_tenant(tenant_uid: str) -> None:
                                                        msp_add_users_to_tenant_input=MspAddUsersToTenantInput())
 
 
-def create_cdfmc_access_policy_in_managed_tenant(tenant_name: str):
+def _sync_policy_definition(api_client: ApiClient, tenant_uid: str,
+                            domain_uid: str, definition: PolicyDefinition,
+                            dry_run: bool) -> tuple[Optional[str], str]:
+    plan, results = cdfmc_policy_sync_service.sync_access_policy(
+        get_cdfmc_rest_client_for_api_client(api_client), tenant_uid,
+        domain_uid, definition, dry_run)
+    failed_rules = [result for result in results if result.error]
+    if failed_rules:
+        raise RuntimeError("; ".join(
+            f"{result.rule.name}: {result.error}" for result in failed_rules))
+    return plan.access_policy_uid, plan.summary()
+
+
+def create_cdfmc_access_policy_in_managed_tenant(
+    tenant_name: str, definition: Optional[PolicyDefinition] = None,
+    dry_run: bool = False):
     with api_client_factory.build_api_client() as api_client:
         msp_tenant_mgmt_api = MSPTenantManagementApi(api_client=api_client)
         page = msp_tenant_mgmt_api.get_msp_managed_tenants(
@@ -151,22 +165,196 @@ def create_cdfmc_access_policy_in_managed_tenant(tenant_name: str):
             print(
                 f"Generating token for {tenant.display_name} with cdFMC type {tenant.cd_fmc_type}...")
             api_token = msp_managed_tenant_token_service.get_token_for_managed_tenant(
-                tenant)
+                tenant, api_client)
             print(f"Generated token")
+            tenant_api_client = api_client_factory.build_api_client_for_managed_tenant(
+                tenant, api_token)
+            if definition:
+                domain_uid = get_cdfmc_domain_uid(tenant_api_client)
+                if domain_uid is None:
+                    print("Tenant does not have a cdFMC")
+                    continue
+                print(f"Syncing access policy '{definition.policy.name}' for {tenant.display_name}...")
+                _, changes = _sync_policy_definition(
+                    tenant_api_client, tenant.uid, domain_uid, definition,
+                    dry_run)
+                print(f"{'Would ' if dry_run else ''}{changes}")
+                continue
             print(f"Creating access policy for {tenant.display_name}...")
             access_policy_uid, domain_uid = _create_cdfmc_access_policy(
-                api_client_factory.build_api_client_for_managed_tenant(tenant,
-                                                                       api_token))
+                tenant_api_client)
             print("Created access policy")
             print("Creating access rule to block Gambling...")
-            block_gambling(access_policy_uid, domain_uid,
-                           api_client_factory.build_api_client_for_managed_tenant(
-                               tenant, api_token))
+            block_gambling(access_policy_uid, tenant.uid, domain_uid,
+                           tenant_api_client)
             print("Created access rule to block Gambling")
 
 
+@dataclass
+class TenantRolloutResult:
+    tenant_name: str
+    tenant_display_name: str
+    access_policy_uid: Optional[str] = None
+    changes: Optional[str] = None
+    error: Optional[str] = None
+    duration_seconds: float = 0.0
+
+
+def _get_managed_tenants_with_cdfmc(api_client: ApiClient) -> List[
+    MspManagedTenantDto]:
+    limit = 200
+    offset = 0
+    count = None
+    all_tenants: List[MspManagedTenantDto] = []
+
+    msp_tenant_api = MSPTenantManagementApi(api_client)
+    while count is None or len(all_tenants) < count:
+        tenant_page = msp_tenant_api.get_msp_managed_tenants(
+            limit=str(limit), offset=str(offset))
+        if not tenant_page.items:
+            break
+        all_tenants.extend(tenant_page.items)
+        offset += limit
+        count = tenant_page.count
+
+    return [tenant for tenant in all_tenants if
+            tenant.cd_fmc_type != 'UNPROVISIONED']
+
+
+def _matches_tenant_filters(tenant: MspManagedTenantDto,
+                            tenant_filters: Optional[List[str]]) -> bool:
+    # Filters are case-insensitive shell-style patterns on name or display name
+    if not tenant_filters:
+        return True
+    names = [(tenant.name or "").lower(), (tenant.display_name or "").lower()]
+    return any(fnmatch.fnmatch(name, tenant_filter.lower())
+               for tenant_filter in tenant_filters for name in names)
+
+
+def _roll_out_to_tenant(tenant: MspManagedTenantDto,
+                        msp_api_client: ApiClient,
+                        definition: Optional[PolicyDefinition] = None,
+                        dry_run: bool = False) -> TenantRolloutResult:
+    result = TenantRolloutResult(tenant_name=tenant.name,
+                                 tenant_display_name=tenant.display_name)
+    start = time.monotonic()
+    try:
+        # One token and one client per tenant, shared by every step below
+        api_token = msp_managed_tenant_token_service.get_token_for_managed_tenant(
+            tenant, msp_api_client, show_progress=False)
+        with api_client_factory.build_api_client_for_managed_tenant(
+            tenant, api_token) as tenant_api_client:
+            domain_uid = get_cdfmc_domain_uid(tenant_api_client)
+            if domain_uid is None:
+                raise RuntimeError("Tenant does not have a cdFMC")
+            if definition:
+                result.access_policy_uid, result.changes = _sync_policy_definition(
+                    tenant_api_client, tenant.uid, domain_uid, definition,
+                    dry_run)
+            else:
+                result.access_policy_uid = _create_access_policy_in_domain(
+                    tenant_api_client, domain_uid)
+                block_gambling(result.access_policy_uid, tenant.uid,
+                               domain_uid, tenant_api_client)
+                result.changes = "create policy, create 1 rule(s)"
+    except Exception as e:
+        result.error = str(e)
+    result.duration_seconds = round(time.monotonic() - start, 2)
+    return result
+
+
+def _print_rollout_report(results: List[TenantRolloutResult]) -> None:
+    table = Table(title="Access policy rollout")
+    table.add_column("Tenant")
+    table.add_column("Result")
+    table.add_column("Access policy")
+    table.add_column("Changes")
+    table.add_column("Duration (s)", justify="right")
+    for result in sorted(results, key=lambda r: (r.error is None,
+                                                 r.tenant_display_name or "")):
+        table.add_row(
+            result.tenant_display_name,
+            f"[red]{result.error}" if result.error else "[green]OK",
+            result.access_policy_uid or "",
+            result.changes or "",
+            f"{result.duration_seconds:.1f}")
+    console = Console()
+    console.print(table)
+    failed = len([result for result in results if result.error])
+    console.print(f"{len(results) - failed} succeeded, {failed} failed")
+
+
+def _write_rollout_report(results: List[TenantRolloutResult],
+                          report_file: str) -> None:
+    with open(report_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(
+            TenantRolloutResult.__dataclass_fields__))
+        writer.writeheader()
+        writer.writerows(asdict(result) for result in results)
+
+
+def roll_out_cdfmc_access_policy(tenant_filters: Optional[List[str]] = None,
+                                 max_workers: int = 8,
+                                 report_file: Optional[str] = None,
+                                 definition: Optional[PolicyDefinition] = None,
+                                 dry_run: bool = False) -> List[
+    TenantRolloutResult]:
+    with api_client_factory.build_api_client() as msp_api_client:
+        tenants = [tenant for tenant in
+                   _get_managed_tenants_with_cdfmc(msp_api_client)
+                   if _matches_tenant_filters(tenant, tenant_filters)]
+        print(f"Rolling out access policy to {len(tenants)} tenant(s) with cdFMC...")
+
+        results: List[TenantRolloutResult] = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_roll_out_to_tenant, tenant,
+                                       msp_api_client, definition, dry_run)
+                       for tenant in tenants]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(f"  [{len(results)}/{len(tenants)}] "
+                      f"{result.tenant_display_name}: "
+                      f"{'failed' if result.error else 'done'}")
+
+    _print_rollout_report(results)
+    if report_file:
+        _write_rollout_report(results, report_file)
+    return results
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("-t", "--tenant-name", type=str)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("-t", "--tenant-name", type=str)
+    target.add_argument("--all-tenants", action="store_true",
+                        help="Roll the policy out to every tenant with a cdFMC")
+    target.add_argument("--tenant-filter", action="append",
+                        help="Roll the policy out to tenants whose name or "
+                             "display name matches this pattern (e.g. 'acme-*'); "
+                             "can be repeated")
+    parser.add_argument("--max-workers", type=int, default=8,
+                        help="Number of tenants to roll out to at once")
+    parser.add_argument("--report-file", type=str,
+                        help="Write the per-tenant results to this CSV file")
+    parser.add_argument("--definition", type=str,
+                        help="YAML or JSON access policy definition to sync "
+                             "instead of creating a new Block Gambling policy")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="With --definition, only report the changes "
+                             "that would be made")
     args = parser.parse_args()
-    create_cdfmc_access_policy_in_managed_tenant(args.tenant_name)
+    policy_definition = cdfmc_policy_sync_service.load_policy_definition(
+        args.definition) if args.definition else None
+    if args.tenant_name:
+        create_cdfmc_access_policy_in_managed_tenant(args.tenant_name,
+                                                     policy_definition,
+                                                     args.dry_run)
+    else:
+        results = roll_out_cdfmc_access_policy(args.tenant_filter,
+                                               args.max_workers,
+                                               args.report_file,
+                                               policy_definition,
+                                               args.dry_run)
+        if any(result.error for result in results):
+            sys.exit(1)
@@ -5,7 +5,10 @@ from scc_firewall_manager_sdk import ApiClient, Configuration, \
 
 # Change this to the region your tenant/MSSP portal is deployed in
 region = "int"
-base_url = f"https://api.{region}.security.cisco.com/firewall"
+# Set the environment variable SCCFM_BASE_URL to send every request, including
+# those for managed tenants, to another endpoint such as the local mock server
+base_url_override = os.getenv("SCCFM_BASE_URL")
+base_url = base_url_override or f"https://api.{region}.security.cisco.com/firewall"
 # Set the environment variable SCCFM_API_TOKEN to the API token for your tenant/MSSP portal
 api_token = os.getenv("SCCFM_API_TOKEN")
 
@@ -17,19 +20,22 @@ def build_api_client():
         )
     )
 
-def build_api_client_for_managed_tenant(msp_managed_tenant: MspManagedTenantDto, api_token: str) -> ApiClient:
-    if msp_managed_tenant.region == 'SCALE':
-        tenant_base_url = "https://scale.manage.security.cisco.com"
+def get_base_url_for_managed_tenant(msp_managed_tenant: MspManagedTenantDto) -> str:
+    if base_url_override:
+        return base_url_override
+    elif msp_managed_tenant.region == 'SCALE':
+        return "https://scale.manage.security.cisco.com"
     elif msp_managed_tenant.region == 'STAGING':
         api_region = 'int'
-        tenant_base_url = f"https://api.{api_region}.security.cisco.com/firewall"
+        return f"https://api.{api_region}.security.cisco.com/firewall"
     else:
         api_region = msp_managed_tenant.region.lower()
-        tenant_base_url = f"https://api.{api_region}.security.cisco.com/firewall"
-    
+        return f"https://api.{api_region}.security.cisco.com/firewall"
+
+def build_api_client_for_managed_tenant(msp_managed_tenant: MspManagedTenantDto, api_token: str) -> ApiClient:
     return ApiClient(
         Configuration(
-            host=tenant_base_url,
+            host=get_base_url_for_managed_tenant(msp_managed_tenant),
             access_token=api_token
         )
     )
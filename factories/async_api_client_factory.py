@@ -0,0 +1,85 @@
+import asyncio
+from typing import Optional
+
+import aiohttp
+from scc_firewall_manager_sdk import MspManagedTenantDto
+
+from factories import api_client_factory
+
+# Upper bound on open connections per client; requests beyond this queue for a free connection
+DEFAULT_CONNECTION_LIMIT = 100
+RETRY_STATUSES = [429, 502, 503, 504]
+# A 5xx can come after a non-idempotent request was carried out, so those are
+# only retried on 429, which guarantees it was not
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+MAX_RETRIES = 3
+
+
+def _is_retry(method: str, status: int) -> bool:
+    if method.upper() in IDEMPOTENT_METHODS:
+        return status in RETRY_STATUSES
+    return status == 429
+
+
+class AsyncApiClient:
+    """Minimal asyncio counterpart of the SDK ApiClient, backed by one pooled
+    aiohttp session. Use it as an async context manager."""
+
+    def __init__(self, host: str, access_token: str,
+                 connection_limit: int = DEFAULT_CONNECTION_LIMIT):
+        self.host = host
+        self.access_token = access_token
+        self.connection_limit = connection_limit
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "AsyncApiClient":
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connection_limit),
+            headers={
+                "Authorization": f"Bearer {self.access_token}",
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            })
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+
+    async def request(self, method: str, path: str, params: dict | None = None,
+                      json: dict | list | None = None) -> dict:
+        for attempt in range(MAX_RETRIES + 1):
+            async with self._session.request(method, f"{self.host}{path}",
+                                             params=params,
+                                             json=json) as response:
+                if _is_retry(method, response.status) and attempt < MAX_RETRIES:
+                    retry_after = response.headers.get("Retry-After")
+                    await asyncio.sleep(
+                        float(retry_after) if retry_after and retry_after.isdigit()
+                        else 2 ** attempt)
+                    continue
+                response.raise_for_status()
+                if response.content_length == 0:
+                    return {}
+                return await response.json()
+
+    async def get(self, path: str, params: dict | None = None) -> dict:
+        return await self.request("GET", path, params=params)
+
+    async def post(self, path: str, json: dict | list | None = None,
+                   params: dict | None = None) -> dict:
+        return await self.request("POST", path, params=params, json=json)
+
+
+def build_async_api_client(
+    connection_limit: int = DEFAULT_CONNECTION_LIMIT) -> AsyncApiClient:
+    return AsyncApiClient(api_client_factory.base_url,
+                          api_client_factory.api_token,
+                          connection_limit=connection_limit)
+
+
+def build_async_api_client_for_managed_tenant(
+    msp_managed_tenant: MspManagedTenantDto, api_token: str,
+    connection_limit: int = DEFAULT_CONNECTION_LIMIT) -> AsyncApiClient:
+    return AsyncApiClient(
+        api_client_factory.get_base_url_for_managed_tenant(msp_managed_tenant),
+        api_token, connection_limit=connection_limit)
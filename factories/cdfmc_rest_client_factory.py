@@ -0,0 +1,94 @@
+import threading
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from scc_firewall_manager_sdk import ApiClient
+from urllib3.util.retry import Retry
+
+from models import serialization
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+# (connect, read) timeout in seconds for requests that do not pass their own
+DEFAULT_TIMEOUT = (10, 120)
+
+
+class _CdFmcRetry(Retry):
+    # A POST that failed with a 5xx or a read error may have been applied, so
+    # non-idempotent methods are left out of allowed_methods, which stops read
+    # retries, and are only retried on 429
+    def is_retry(self, method: str, status_code: int,
+                 has_retry_after: bool = False) -> bool:
+        if not self._is_method_retryable(method):
+            return status_code == 429
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class CdFmcRestClient:
+    """Raw cdFMC REST client for one (host, token) pair, backed by a pooled
+    keep-alive session."""
+
+    def __init__(self, host: str, api_token: str, pool_size: int = 10,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT):
+        self.host = host
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+        })
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size,
+            max_retries=_CdFmcRetry(
+                total=5, backoff_factor=1, status_forcelist=RETRY_STATUSES,
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                respect_retry_after_header=True,
+                raise_on_status=False))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def fmc_config_url(self, domain_uid: str, path: str) -> str:
+        return f"{self.host}/v1/cdfmc/api/fmc_config/v1/domain/{domain_uid}/{path}"
+
+    def request(self, method: str, url: str,
+                json: Optional[Union[dict, list]] = None, **kwargs) -> dict:
+        if json is not None:
+            kwargs["data"] = serialization.dumps(json)
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, url, **kwargs)
+        response.raise_for_status()
+        if not response.content:
+            return {}
+        return response.json()
+
+    def get(self, url: str, params: Optional[dict] = None) -> dict:
+        return self.request("GET", url, params=params)
+
+    def post(self, url: str, json: Optional[Union[dict, list]] = None,
+             params: Optional[dict] = None) -> dict:
+        return self.request("POST", url, json=json, params=params)
+
+    def put(self, url: str, json: Optional[Union[dict, list]] = None,
+            params: Optional[dict] = None) -> dict:
+        return self.request("PUT", url, json=json, params=params)
+
+    def delete(self, url: str, params: Optional[dict] = None) -> dict:
+        return self.request("DELETE", url, params=params)
+
+
+_clients: Dict[Tuple[str, str], CdFmcRestClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_cdfmc_rest_client(host: str, api_token: str) -> CdFmcRestClient:
+    with _clients_lock:
+        if (host, api_token) not in _clients:
+            _clients[(host, api_token)] = CdFmcRestClient(host, api_token)
+        return _clients[(host, api_token)]
+
+
+def get_cdfmc_rest_client_for_api_client(api_client: ApiClient) -> CdFmcRestClient:
+    return get_cdfmc_rest_client(api_client.configuration.host,
+                                 api_client.configuration.access_token)
@@ -1,10 +1,23 @@
-from typing import List
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Tuple, Callable, Optional
 
 from dotenv import load_dotenv
+from rich.console import Console
+from rich.table import Table
 from webexpythonsdk.models.cards import Container, TextBlock, ColumnSet, Column, \
     FontWeight, Colors, FontSize, Spacing, ContainerStyle, AdaptiveCard
 
-from services import webex_notification_service
+from services import webex_notification_service, compliance_alert_state_service, \
+    profiling_service
+from services.compliance_alert_state_service import AlertedLicense
 
 load_dotenv()
 
@@ -14,83 +27,321 @@ from scc_firewall_manager_sdk import MSPLicensingApi, MspVirtualAccountDto, \
 from factories import api_client_factory
 
 
-# TODO for simplicity, I have not implemented pagination. That is fairly straighforward but I don't want to overcomplicate the demo code
+# Webex rejects messages whose card attachment is larger than about 28 KB
+MAX_CARD_BYTES = 24_000
+MAX_CARDS = 5
 
-def build_license_card(
-    out_of_compliance_licenses: List[MspLicenseDto]) -> AdaptiveCard:
-    card_body: list = [
+
+@dataclass
+class AccountTiming:
+    account_type: str
+    name: str
+    duration_seconds: float
+    item_count: int
+
+
+def _build_license_card_header(license_count: int, part: str = "") -> list:
+    return [
         TextBlock("⚠️ Smart License Compliance Alert", weight=FontWeight.BOLDER,
                   size=FontSize.LARGE, color=Colors.ATTENTION),
         TextBlock(
-            f"{len(out_of_compliance_licenses)} license(s) out of compliance",
+            f"{license_count} license(s) out of compliance{part}",
             spacing=Spacing.NONE, isSubtle=True),
     ]
 
+
+def _build_license_container(license: MspLicenseDto,
+                             max_tenants: Optional[int] = None) -> Container:
+    tenant_names = [mt.display_name for mt in license.managed_tenants or []]
+    tenants = ", ".join(tenant_names[:max_tenants])
+    if max_tenants is not None and len(tenant_names) > max_tenants:
+        tenants += f" and {len(tenant_names) - max_tenants} more"
+
+    container_items = [
+        TextBlock(f"📋 {license.name}", weight=FontWeight.BOLDER,
+                  color=Colors.ATTENTION),
+        ColumnSet(columns=[
+            Column(items=[TextBlock("Purchased", isSubtle=True),
+                          TextBlock(str(license.num_purchased),
+                                    weight=FontWeight.BOLDER)],
+                   width="auto"),
+            Column(items=[TextBlock("In Use", isSubtle=True),
+                          TextBlock(str(license.num_in_use),
+                                    weight=FontWeight.BOLDER,
+                                    color=Colors.ATTENTION)], width="auto"),
+        ]),
+    ]
+    if license.type == 'TERM':
+        container_items.append(
+            TextBlock(f"Expiry: {license.expiry_date}", isSubtle=True))
+    container_items.append(TextBlock(f"**Tenants:** {tenants}", wrap=True))
+
+    return Container(
+        items=container_items,
+        style=ContainerStyle.EMPHASIS,
+        separator=True
+    )
+
+
+def build_license_card(
+    out_of_compliance_licenses: List[MspLicenseDto]) -> AdaptiveCard:
+    card_body: list = _build_license_card_header(len(out_of_compliance_licenses))
     for license in out_of_compliance_licenses:
-        tenants = ", ".join([mt.display_name for mt in license.managed_tenants])
-
-        container_items = [
-            TextBlock(f"📋 {license.name}", weight=FontWeight.BOLDER,
-                      color=Colors.ATTENTION),
-            ColumnSet(columns=[
-                Column(items=[TextBlock("Purchased", isSubtle=True),
-                              TextBlock(str(license.num_purchased),
-                                        weight=FontWeight.BOLDER)],
-                       width="auto"),
-                Column(items=[TextBlock("In Use", isSubtle=True),
-                              TextBlock(str(license.num_in_use),
-                                        weight=FontWeight.BOLDER,
-                                        color=Colors.ATTENTION)], width="auto"),
-            ]),
-        ]
-        if license.type == 'TERM':
-            container_items.append(
-                TextBlock(f"Expiry: {license.expiry_date}", isSubtle=True))
-        container_items.append(TextBlock(f"**Tenants:** {tenants}", wrap=True))
-
-        license_container = Container(
-            items=container_items,
-            style=ContainerStyle.EMPHASIS,
-            separator=True
-        )
-        card_body.append(license_container)
+        card_body.append(_build_license_container(license))
 
     return AdaptiveCard(body=[item for item in card_body if item is not None])
 
 
-def notify(out_of_compliance_licenses: List[MspLicenseDto]) -> None:
+def _serialized_size(card_element) -> int:
+    return len(json.dumps(card_element.to_dict()).encode("utf-8"))
+
+
+def _build_fitting_license_container(license: MspLicenseDto,
+                                     max_bytes: int) -> Tuple[Container, int]:
+    container = _build_license_container(license)
+    size = _serialized_size(container)
+    max_tenants = len(license.managed_tenants or [])
+    # Licenses used by very many tenants get their tenant list shortened
+    while size > max_bytes and max_tenants > 0:
+        max_tenants //= 2
+        container = _build_license_container(license, max_tenants=max_tenants)
+        size = _serialized_size(container)
+    return container, size
+
+
+@profiling_service.traced("render")
+def build_license_cards(out_of_compliance_licenses: List[MspLicenseDto],
+                        max_card_bytes: int = MAX_CARD_BYTES,
+                        max_cards: int = MAX_CARDS) -> Tuple[
+    List[AdaptiveCard], List[MspLicenseDto]]:
+    """Packs the licenses into as few cards as fit Webex's card size limit.
+
+    If they need more than max_cards cards, the licenses with the largest
+    overage are kept and the rest are returned as overflow."""
+    licenses = sorted(out_of_compliance_licenses,
+                      key=lambda l: (l.num_in_use or 0) - (l.num_purchased or 0),
+                      reverse=True)
+    header_bytes = _serialized_size(
+        AdaptiveCard(body=_build_license_card_header(len(licenses), " (part 10 of 10)")))
+    body_budget = max_card_bytes - header_bytes
+
+    card_bodies: List[list] = [[]]
+    body_bytes = 0
+    overflow: List[MspLicenseDto] = []
+    for index, license in enumerate(licenses):
+        container, size = _build_fitting_license_container(license, body_budget)
+        if card_bodies[-1] and body_bytes + size > body_budget:
+            if len(card_bodies) == max_cards:
+                overflow = licenses[index:]
+                break
+            card_bodies.append([])
+            body_bytes = 0
+        card_bodies[-1].append(container)
+        body_bytes += size + 1
+
+    cards = []
+    for index, body in enumerate(card_bodies):
+        part = f" (part {index + 1} of {len(card_bodies)})" if len(card_bodies) > 1 else ""
+        card_body = _build_license_card_header(len(licenses), part) + body
+        if overflow and index == len(card_bodies) - 1:
+            card_body.append(TextBlock(
+                f"{len(overflow)} more license(s) out of compliance are listed "
+                f"in the attached report", wrap=True, isSubtle=True))
+        cards.append(AdaptiveCard(body=card_body))
+    return cards, overflow
+
+
+def _write_overflow_report(licenses: List[MspLicenseDto]) -> str:
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="",
+                                     prefix="license-compliance-",
+                                     delete=False) as f:
+        writer = csv.writer(f)
+        writer.writerow(["License", "Virtual account UID", "Purchased",
+                         "In use", "Expiry", "Tenants"])
+        for license in licenses:
+            writer.writerow([
+                license.name, license.virtual_account_uid,
+                license.num_purchased, license.num_in_use,
+                license.expiry_date if license.type == 'TERM' else "",
+                "; ".join([mt.display_name for mt in
+                           license.managed_tenants or []])])
+        return f.name
+
+
+def build_recovery_card(resolved_licenses: List[AlertedLicense]) -> AdaptiveCard:
+    card_body: list = [
+        TextBlock("✅ Smart License Compliance Restored",
+                  weight=FontWeight.BOLDER, size=FontSize.LARGE,
+                  color=Colors.GOOD),
+        TextBlock(
+            f"{len(resolved_licenses)} license(s) back in compliance",
+            spacing=Spacing.NONE, isSubtle=True),
+    ]
+    for license in resolved_licenses:
+        card_body.append(Container(
+            items=[TextBlock(f"📋 {license.name}", weight=FontWeight.BOLDER,
+                             color=Colors.GOOD)],
+            separator=True
+        ))
+    return AdaptiveCard(body=card_body)
+
+
+def notify(out_of_compliance_licenses: List[MspLicenseDto],
+           resolved_licenses: Optional[List[AlertedLicense]] = None) -> bool:
+    """Returns whether every alert was delivered to every room."""
+    delivered = True
+    if resolved_licenses:
+        fallback_msg = f"License Compliance Restored: {len(resolved_licenses)} license(s) back in compliance"
+        delivered &= webex_notification_service.send_card(
+            build_recovery_card(resolved_licenses), fallback_msg)
+
     if not out_of_compliance_licenses:
-        print("No out-of-compliance licenses found.")
-        return
+        print("No new out-of-compliance licenses found.")
+        return delivered
 
-    card = build_license_card(out_of_compliance_licenses)
+    cards, overflow = build_license_cards(out_of_compliance_licenses)
     fallback_msg = f"License Compliance Alert: {len(out_of_compliance_licenses)} license(s) out of compliance"
-    webex_notification_service.send_card(card, fallback_msg)
+    for card in cards:
+        delivered &= webex_notification_service.send_card(card, fallback_msg)
+    if overflow:
+        report_file = _write_overflow_report(overflow)
+        try:
+            delivered &= webex_notification_service.send_file(
+                report_file,
+                f"{len(overflow)} more license(s) out of compliance")
+        finally:
+            os.remove(report_file)
+    return delivered
+
+
+def _get_all_pages(get_page: Callable) -> list:
+    limit = 200
+    offset = 0
+    count = None
+    all_items = []
+
+    while count is None or len(all_items) < count:
+        page = get_page(limit=str(limit), offset=str(offset))
+        if not page.items:
+            break
+        all_items.extend(page.items)
+        offset += limit
+        count = page.count
+
+    return all_items
+
 
+def _get_virtual_accounts(msp_licensing_api: MSPLicensingApi,
+    smart_account: MspSmartAccountDto) -> Tuple[
+    List[MspVirtualAccountDto], AccountTiming]:
+    start = time.perf_counter()
+    virtual_accounts = _get_all_pages(
+        lambda limit, offset: msp_licensing_api.get_msp_virtual_accounts(
+            smart_account_uid=smart_account.uid, limit=limit, offset=offset))
+    return virtual_accounts, AccountTiming(
+        account_type="Smart account", name=smart_account.name,
+        duration_seconds=time.perf_counter() - start,
+        item_count=len(virtual_accounts))
 
-def check_msp_smart_licensing() -> None:
-    with api_client_factory.build_api_client() as api_client:
+
+def _get_out_of_compliance_licenses(msp_licensing_api: MSPLicensingApi,
+    virtual_account: MspVirtualAccountDto) -> Tuple[
+    List[MspLicenseDto], AccountTiming]:
+    start = time.perf_counter()
+    licenses = _get_all_pages(
+        lambda limit, offset: msp_licensing_api.get_msp_virtual_account_licenses(
+            smart_account_uid=virtual_account.smart_account_uid,
+            virtual_account_uid=virtual_account.uid,
+            limit=limit, offset=offset,
+            q='complianceStatus:OUT_OF_COMPLIANCE'))
+    return licenses, AccountTiming(
+        account_type="Virtual account", name=virtual_account.name,
+        duration_seconds=time.perf_counter() - start,
+        item_count=len(licenses))
+
+
+def _print_account_timings(account_timings: List[AccountTiming],
+                           limit: int = 20) -> None:
+    slowest = sorted(account_timings, key=lambda t: t.duration_seconds,
+                     reverse=True)[:limit]
+    table = Table(
+        title=f"Slowest {len(slowest)} of {len(account_timings)} account queries")
+    table.add_column("Account type", style="magenta")
+    table.add_column("Account", style="cyan")
+    table.add_column("Items", justify="right")
+    table.add_column("Duration (s)", justify="right")
+    for timing in slowest:
+        table.add_row(timing.account_type, timing.name or "-",
+                      str(timing.item_count),
+                      f"{timing.duration_seconds:.2f}")
+    Console().print(table)
+
+
+def check_msp_smart_licensing(max_workers: int = 8,
+                              state_file: Optional[Path] = compliance_alert_state_service.DEFAULT_STATE_FILE) -> None:
+    sweep_start = time.perf_counter()
+    account_timings: List[AccountTiming] = []
+    with api_client_factory.build_api_client() as api_client, \
+        ThreadPoolExecutor(max_workers=max_workers) as executor:
         msp_licensing_apis = MSPLicensingApi(api_client)
-        customer_smart_accounts: List[
-            MspSmartAccountDto] = msp_licensing_apis.get_msp_smart_accounts().items
+        customer_smart_accounts: List[MspSmartAccountDto] = _get_all_pages(
+            msp_licensing_apis.get_msp_smart_accounts)
+
         customer_virtual_accounts: List[MspVirtualAccountDto] = []
-        for customer_smart_account in customer_smart_accounts:
-            customer_virtual_accounts.extend(
-                msp_licensing_apis.get_msp_virtual_accounts(
-                    smart_account_uid=customer_smart_account.uid).items)
+        for virtual_accounts, timing in executor.map(
+            lambda sa: _get_virtual_accounts(msp_licensing_apis, sa),
+            customer_smart_accounts):
+            customer_virtual_accounts.extend(virtual_accounts)
+            account_timings.append(timing)
         print(f"Across customer base, {len(customer_smart_accounts)} smart accounts and {len(customer_virtual_accounts)} virtual accounts are being used")
+
+        # Virtual accounts that report no out-of-compliance licenses need no further calls
+        virtual_accounts_to_check = [
+            va for va in customer_virtual_accounts if
+            va.licenses_out_of_compliance_count != 0]
         out_of_compliance_licenses: List[MspLicenseDto] = []
-        for customer_virtual_account in customer_virtual_accounts:
-            out_of_compliance_licenses.extend(
-                msp_licensing_apis.get_msp_virtual_account_licenses(
-                    smart_account_uid=customer_virtual_account.smart_account_uid,
-                    virtual_account_uid=customer_virtual_account.uid,
-                    q='complianceStatus:OUT_OF_COMPLIANCE').items)
-
-        if len(out_of_compliance_licenses) != 0:
-            print(f"Across customer base, {len(out_of_compliance_licenses)} smart licenses are out of compliance")
+        for licenses, timing in executor.map(
+            lambda va: _get_out_of_compliance_licenses(msp_licensing_apis, va),
+            virtual_accounts_to_check):
+            out_of_compliance_licenses.extend(licenses)
+            account_timings.append(timing)
+
+    _print_account_timings(account_timings)
+    print(f"Compliance sweep took {time.perf_counter() - sweep_start:.2f}s")
+
+    if len(out_of_compliance_licenses) != 0:
+        print(f"Across customer base, {len(out_of_compliance_licenses)} smart licenses are out of compliance")
+
+    if state_file is None:
+        if out_of_compliance_licenses:
             notify(out_of_compliance_licenses)
+        return
+
+    # Only alert on violations that are new or whose usage changed since the last run
+    new_or_changed, resolved = compliance_alert_state_service.diff_alert_state(
+        compliance_alert_state_service.load_alert_state(state_file),
+        out_of_compliance_licenses)
+    print(f"{len(new_or_changed)} new or changed violation(s), {len(resolved)} resolved")
+    if (new_or_changed or resolved) and not notify(new_or_changed, resolved):
+        # Keep the previous state, so the undelivered alerts are sent again
+        # on the next run
+        print("Not all alerts were delivered; alert state left unchanged")
+        return
+    compliance_alert_state_service.save_alert_state(out_of_compliance_licenses,
+                                                    state_file)
 
 
 if __name__ == "__main__":
-    check_msp_smart_licensing()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-workers", type=int, default=8,
+                        help="Number of smart/virtual accounts to query concurrently")
+    parser.add_argument("--state-file", type=Path,
+                        default=compliance_alert_state_service.DEFAULT_STATE_FILE,
+                        help="File recording previously alerted violations")
+    parser.add_argument("--no-state", action="store_true",
+                        help="Alert on every out-of-compliance license, ignoring previous alerts")
+    profiling_service.add_profile_argument(parser)
+    args = parser.parse_args()
+    profiling_service.enable_if_requested(args.profile)
+    check_msp_smart_licensing(max_workers=args.max_workers,
+                              state_file=None if args.no_state else args.state_file)
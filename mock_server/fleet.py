@@ -0,0 +1,228 @@
+"""Deterministic synthetic MSP fleet used by the mock API server and the
+benchmarks: managed tenants, their FTDs and ASAs, cdFMC managers, smart
+licensing accounts and health metrics. All objects are plain dicts in the
+JSON shape the API returns, so they can be served as-is or deserialized
+with the SDK models' from_dict."""
+import random
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+FTD_MODELS = ["Cisco Firepower 1120 Threat Defense",
+              "Cisco Firepower 2130 Threat Defense",
+              "Cisco Secure Firewall 3110 Threat Defense",
+              "Cisco Secure Firewall Threat Defense for VMware"]
+FTD_VERSIONS = ["7.2.5", "7.2.8", "7.4.1", "7.4.2", "7.6.0"]
+ASA_VERSIONS = ["9.18.4", "9.20.2", "9.22.1"]
+UPGRADE_TARGET_VERSIONS = ["7.4.2", "7.6.0", "7.6.1"]
+URL_CATEGORIES = ["Adult", "Alcohol", "Auctions", "Chat", "Cryptomining",
+                  "Dating", "Filter Avoidance", "Gambling", "Games",
+                  "Hacking", "Malware Sites", "News", "Peer File Transfer",
+                  "Phishing", "Social Networking", "Streaming Media",
+                  "Weapons"]
+SYSTEM_NETWORKS = ["any", "any-ipv4", "any-ipv6", "IPv4-Private-All-RFC1918",
+                   "IPv4-Link-Local", "IPv6-Link-Local"]
+
+
+def _uid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def iso(timestamp: datetime) -> str:
+    return timestamp.astimezone(timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+@dataclass
+class MockTenant:
+    tenant: dict
+    manager: dict
+    domain_uid: str
+    ftds: List[dict] = field(default_factory=list)
+    asas: List[dict] = field(default_factory=list)
+
+    @property
+    def uid(self) -> str:
+        return self.tenant["uid"]
+
+    @property
+    def devices(self) -> List[dict]:
+        return self.ftds + self.asas
+
+
+@dataclass
+class MockFleet:
+    tenants: List[MockTenant]
+    smart_accounts: List[dict]
+    virtual_accounts: Dict[str, List[dict]]
+    licenses: Dict[str, List[dict]]
+
+    def __post_init__(self):
+        self.tenants_by_uid = {tenant.uid: tenant for tenant in self.tenants}
+        self.devices_by_uid = {device["uid"]: (tenant, device) for tenant in
+                               self.tenants for device in tenant.devices}
+
+
+def build_fleet(tenant_count: int = 100, ftds_per_tenant: int = 20,
+                asas_per_tenant: int = 5, offline_ratio: float = 0.02,
+                unprovisioned_ratio: float = 0.05,
+                seed: int = 1) -> MockFleet:
+    rng = random.Random(seed)
+    tenants = []
+    for t in range(tenant_count):
+        name = f"tenant-{t:05d}"
+        tenant_uid = _uid(rng)
+        cd_fmc_type = "UNPROVISIONED" if rng.random() < unprovisioned_ratio \
+            else "SHARED"
+        domain_uid = _uid(rng)
+        mock_tenant = MockTenant(
+            tenant={"uid": tenant_uid, "name": name,
+                    "displayName": f"Tenant {t:05d}", "region": "US",
+                    "cdFmcType": cd_fmc_type, "apiTokenValid": True,
+                    "deviceCount": ftds_per_tenant + asas_per_tenant},
+            manager={"uid": _uid(rng), "name": f"{name}-cdfmc",
+                     "deviceType": "CDFMC", "fmcDomainUid": domain_uid,
+                     "softwareVersion": "7.6.0",
+                     "connectivityState": "ONLINE"},
+            domain_uid=domain_uid)
+
+        for d in range(ftds_per_tenant if cd_fmc_type != "UNPROVISIONED" else 0):
+            mock_tenant.ftds.append({
+                "uid": _uid(rng), "name": f"{name}-ftd-{d:04d}",
+                "deviceType": "CDFMC_MANAGED_FTD",
+                "connectivityState": "UNREACHABLE"
+                if rng.random() < offline_ratio else "ONLINE",
+                "redundancyMode": "STANDALONE",
+                "hardwareModel": rng.choice(FTD_MODELS),
+                "softwareVersion": rng.choice(FTD_VERSIONS),
+                "deviceRecordOnFmc": {"uid": _uid(rng)},
+                "managedTenantUid": tenant_uid,
+                "managedTenantName": name,
+                "managedTenantDisplayName": mock_tenant.tenant["displayName"],
+                "managedTenantRegion": "US",
+            })
+        for d in range(asas_per_tenant):
+            mock_tenant.asas.append({
+                "uid": _uid(rng), "name": f"{name}-asa-{d:04d}",
+                "deviceType": "ASA", "connectivityState": "ONLINE",
+                "softwareVersion": rng.choice(ASA_VERSIONS),
+                "hardwareModel": "ASA5516",
+                "optedInToAsaHealthMetrics": True,
+                "managedTenantUid": tenant_uid,
+                "managedTenantName": name,
+                "managedTenantDisplayName": mock_tenant.tenant["displayName"],
+                "managedTenantRegion": "US",
+            })
+        tenants.append(mock_tenant)
+
+    smart_accounts, virtual_accounts, licenses = _build_licensing(rng,
+                                                                  tenants)
+    return MockFleet(tenants=tenants, smart_accounts=smart_accounts,
+                     virtual_accounts=virtual_accounts, licenses=licenses)
+
+
+def _build_licensing(rng: random.Random, tenants: List[MockTenant]):
+    smart_accounts = []
+    virtual_accounts: Dict[str, List[dict]] = {}
+    licenses: Dict[str, List[dict]] = {}
+    # One smart account per 10 tenants and one virtual account per tenant
+    for start in range(0, len(tenants), 10):
+        smart_account_uid = _uid(rng)
+        smart_accounts.append({"uid": smart_account_uid,
+                               "name": f"Smart Account {start // 10:04d}",
+                               "domain": f"sa{start // 10}.example.com"})
+        virtual_accounts[smart_account_uid] = []
+        for tenant in tenants[start:start + 10]:
+            va_uid = _uid(rng)
+            va_licenses = []
+            for license_name in ["FPR-Threat", "FPR-Malware", "FPR-URL",
+                                 "FPR-Essentials", "Secure Client Advantage"]:
+                purchased = rng.randint(10, 200)
+                in_use = purchased + rng.randint(1, 20) \
+                    if rng.random() < 0.05 else rng.randint(0, purchased)
+                va_licenses.append({
+                    "uid": _uid(rng), "name": license_name,
+                    "virtualAccountUid": va_uid,
+                    "numPurchased": purchased, "numInUse": in_use,
+                    "numAvailable": max(purchased - in_use, 0),
+                    "complianceStatus": "OUT_OF_COMPLIANCE"
+                    if in_use > purchased else "IN_COMPLIANCE",
+                    "managedTenants": [{"uid": tenant.uid,
+                                        "name": tenant.tenant["name"],
+                                        "displayName": tenant.tenant[
+                                            "displayName"]}],
+                })
+            licenses[va_uid] = va_licenses
+            out_of_compliance = len([license for license in va_licenses if
+                                     license["complianceStatus"] ==
+                                     "OUT_OF_COMPLIANCE"])
+            virtual_accounts[smart_account_uid].append({
+                "uid": va_uid, "name": f"{tenant.tenant['name']}-va",
+                "smartAccountUid": smart_account_uid,
+                "licensesOutOfComplianceCount": out_of_compliance,
+                "licensesInComplianceCount": len(va_licenses) - out_of_compliance,
+                "complianceStatus": "OUT_OF_COMPLIANCE" if out_of_compliance
+                else "IN_COMPLIANCE",
+            })
+    return smart_accounts, virtual_accounts, licenses
+
+
+def _usage(rng: random.Random) -> float:
+    return round(rng.uniform(2, 95), 2)
+
+
+def fmc_health_metrics(tenant: MockTenant, now: datetime, window_seconds: int,
+                       seed: int = 0) -> List[dict]:
+    """One FmcHealthMetrics per FTD, averaged over the window ending now."""
+    rng = random.Random(f"{tenant.uid}-{int(now.timestamp()) // 60}-{seed}")
+    start = now - timedelta(seconds=window_seconds)
+    metrics = []
+    for ftd in tenant.ftds:
+        metrics.append({
+            "deviceUid": ftd["uid"], "deviceName": ftd["name"],
+            "startTime": iso(start), "endTime": iso(now),
+            "cpuHealthMetrics": {"linaUsageAvg": _usage(rng),
+                                 "snortUsageAvg": _usage(rng),
+                                 "systemUsageAvg": _usage(rng)},
+            "memoryHealthMetrics": {"linaUsageAvg": _usage(rng),
+                                    "snortUsageAvg": _usage(rng),
+                                    "systemUsageAvg": _usage(rng)},
+            "diskHealthMetrics": {"totalDiskUsageAvg": _usage(rng)},
+            "interfaceHealthMetrics": [{
+                "interface": f"Ethernet1/{i}",
+                "interfaceName": ["outside", "inside", "dmz"][i - 1],
+                "linkStatus": "UP", "operationalStatus": "UP",
+                "inputBytesAvg": round(rng.uniform(1e3, 1e8), 1),
+                "outputBytesAvg": round(rng.uniform(1e3, 1e8), 1),
+                "inputErrorsAvg": round(rng.uniform(0, 5), 1),
+                "outputErrorsAvg": round(rng.uniform(0, 5), 1),
+                "dropPacketsAvg": round(rng.uniform(0, 50), 1),
+            } for i in range(1, 4)],
+            "raVpnSessionHealthMetrics": {
+                "activeRavpnSessionsAvg": round(rng.uniform(0, 500), 1),
+                "inactiveRavpnSessionsAvg": round(rng.uniform(0, 50), 1),
+                "peakConcurRavpnSessions": rng.randint(0, 800)},
+            "s2sVpnTunnelHealthMetrics": [{
+                "tunnelId": f"tunnel-{i}", "tunnelName": f"branch-{i}",
+                "tunnelState": "TUNNEL_UP" if rng.random() > 0.05
+                else "TUNNEL_DOWN"}
+                for i in range(2)],
+        })
+    return metrics
+
+
+def asa_health_metrics(tenant: MockTenant, now: datetime,
+                       window_seconds: int, seed: int = 0) -> List[dict]:
+    """One MetricsItem per ASA with a cpu/mem/disk sample per minute."""
+    rng = random.Random(f"{tenant.uid}-{int(now.timestamp()) // 60}-{seed}")
+    end = now.replace(second=0, microsecond=0)
+    timestamps = [iso(end - timedelta(minutes=m)) for m in
+                  reversed(range(max(window_seconds // 60, 1)))]
+    return [{
+        "uid": asa["uid"], "name": asa["name"],
+        "metrics": {
+            metric: {"series": [{"timestamp": ts, "value": _usage(rng)} for
+                                ts in timestamps]}
+            for metric in ["cpu", "mem", "disk"]},
+    } for asa in tenant.asas]
@@ -0,0 +1,769 @@
+"""Local stand-in for the Security Cloud Control Firewall Manager and cdFMC
+APIs used by the scripts in this repository, backed by a synthetic fleet.
+
+    python -m mock_server.server --tenants 1000 --ftds-per-tenant 20 \\
+        --latency-ms 50 --rate-limit-rps 10
+
+Point the scripts at it with SCCFM_BASE_URL=http://localhost:8080 and
+SCCFM_API_TOKEN=mock-msp-token. Managed tenant tokens are
+mock-tenant-token-<tenant uid>; GET /mock/tenants.json returns a telegraf
+tenants.json for every tenant, and GET /mock/stats the request counts.
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from mock_server.fleet import MockFleet, MockTenant, build_fleet, iso, \
+    fmc_health_metrics, asa_health_metrics, URL_CATEGORIES, \
+    SYSTEM_NETWORKS, UPGRADE_TARGET_VERSIONS
+
+MSP_TOKEN = "mock-msp-token"
+TENANT_TOKEN_PREFIX = "mock-tenant-token-"
+FMC_CONFIG = "/v1/cdfmc/api/fmc_config/v1/domain/{domain}"
+TIME_RANGE_SECONDS = {"5m": 300, "10m": 600, "15m": 900, "30m": 1800,
+                      "1h": 3600}
+
+
+@dataclass
+class MockServerSettings:
+    latency_ms: float = 0
+    latency_jitter_ms: float = 0
+    rate_limit_rps: float = 0
+    throttle_probability: float = 0
+    max_page_size: int = 200
+    transaction_seconds: float = 2
+    upgrade_seconds: float = 30
+    upgrade_failure_rate: float = 0.02
+    task_seconds: float = 5
+
+
+@dataclass
+class _TokenBucket:
+    tokens: float
+    updated_at: float
+
+
+@dataclass
+class _Transaction:
+    uid: str
+    transaction_type: str
+    entity_uid: Optional[str]
+    submitted_at: float
+    duration: float
+    tenant_uid: Optional[str] = None
+
+
+@dataclass
+class _UpgradeRun:
+    uid: str
+    name: str
+    software_version: str
+    stage_upgrade_only: bool
+    submitted_at: float
+    # device uid -> (duration seconds, fails)
+    devices: Dict[str, tuple] = field(default_factory=dict)
+
+
+@dataclass
+class _CdFmcDomain:
+    access_policies: Dict[str, dict] = field(default_factory=dict)
+    access_rules: Dict[str, List[dict]] = field(default_factory=dict)
+    objects: Dict[str, List[dict]] = field(default_factory=dict)
+    tasks: Dict[str, float] = field(default_factory=dict)
+
+
+class MockApiState:
+    def __init__(self, fleet: MockFleet, settings: MockServerSettings,
+                 seed: int = 1):
+        self.fleet = fleet
+        self.settings = settings
+        self.rng = random.Random(seed)
+        self.transactions: Dict[str, _Transaction] = {}
+        self.upgrade_runs: Dict[str, _UpgradeRun] = {}
+        self.compatibility: Dict[str, List[str]] = {}
+        self.users: Dict[str, List[dict]] = {}
+        self.domains: Dict[str, _CdFmcDomain] = {}
+        self.buckets: Dict[str, _TokenBucket] = {}
+        self.request_counts: Counter = Counter()
+        self.throttled_counts: Counter = Counter()
+
+    def domain(self, domain_uid: str) -> _CdFmcDomain:
+        if domain_uid not in self.domains:
+            domain = _CdFmcDomain()
+            domain.objects["urlcategories"] = [
+                {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{domain_uid}/{n}")),
+                 "name": n, "type": "URLCategory"} for n in URL_CATEGORIES]
+            domain.objects["networks"] = [
+                {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{domain_uid}/{n}")),
+                 "name": n, "type": "Network"} for n in SYSTEM_NETWORKS]
+            self.domains[domain_uid] = domain
+        return self.domains[domain_uid]
+
+    def create_transaction(self, transaction_type: str,
+                           entity_uid: Optional[str] = None,
+                           tenant_uid: Optional[str] = None) -> dict:
+        transaction = _Transaction(
+            uid=str(uuid.uuid4()), transaction_type=transaction_type,
+            entity_uid=entity_uid, submitted_at=time.time(),
+            duration=self.settings.transaction_seconds, tenant_uid=tenant_uid)
+        self.transactions[transaction.uid] = transaction
+        return self.transaction_dto(transaction)
+
+    def transaction_dto(self, transaction: _Transaction) -> dict:
+        elapsed = time.time() - transaction.submitted_at
+        done = elapsed >= transaction.duration
+        updated_at = transaction.submitted_at + min(elapsed,
+                                                    transaction.duration)
+        return {
+            "transactionUid": transaction.uid,
+            "transactionType": transaction.transaction_type,
+            "entityUid": transaction.entity_uid,
+            "tenantUid": transaction.tenant_uid,
+            "cdoTransactionStatus": "DONE" if done else "IN_PROGRESS",
+            "submissionTime": iso(datetime.fromtimestamp(
+                transaction.submitted_at, timezone.utc)),
+            "lastUpdatedTime": iso(datetime.fromtimestamp(updated_at,
+                                                          timezone.utc)),
+            "cancellable": False,
+        }
+
+    def upgrade_run_dto(self, run: _UpgradeRun) -> dict:
+        now = time.time()
+        elapsed = now - run.submitted_at
+        in_progress = "UPLOADING_IMAGE" if run.stage_upgrade_only \
+            else "PERFORMING_UPGRADE"
+        succeeded = "UPGRADE_STAGED" if run.stage_upgrade_only \
+            else "UPGRADE_COMPLETED"
+        failed = "UPGRADE_STAGING_FAILED" if run.stage_upgrade_only \
+            else "UPGRADE_FAILED"
+        devices = []
+        last_change = run.submitted_at
+        for device_uid, (duration, fails) in run.devices.items():
+            tenant, device = self.fleet.devices_by_uid[device_uid]
+            if elapsed < duration * 0.1:
+                status, message = "PERFORMING_READINESS_CHECK", \
+                    "Checking readiness"
+            elif elapsed < duration:
+                status, message = in_progress, "Upgrading"
+                last_change = max(last_change,
+                                  run.submitted_at + duration * 0.1)
+            else:
+                status = failed if fails else succeeded
+                message = "Upgrade package verification failed" if fails \
+                    else "Done"
+                last_change = max(last_change, run.submitted_at + duration)
+            devices.append({
+                "uid": device_uid, "name": device["name"],
+                "hardwareModel": device.get("hardwareModel"),
+                "managedTenantUid": tenant.uid,
+                "managedTenantName": tenant.tenant["name"],
+                "managedTenantDisplayName": tenant.tenant["displayName"],
+                "softwareVersionBeforeUpgrade": device.get("softwareVersion"),
+                "upgradeRunStatus": status,
+                "completionStatuses": [{"message": message}],
+            })
+        statuses = {device["upgradeRunStatus"] for device in devices}
+        if statuses <= {succeeded, failed}:
+            run_status = failed if failed in statuses else succeeded
+        else:
+            run_status = "IN_PROGRESS"
+        return {
+            "uid": run.uid, "name": run.name,
+            "softwareVersion": run.software_version,
+            "stageUpgradeOnly": run.stage_upgrade_only,
+            "upgradeRunStatus": run_status, "upgradeRunType": "FTD_DEVICE_UPGRADE",
+            "submissionTime": iso(datetime.fromtimestamp(run.submitted_at,
+                                                         timezone.utc)),
+            "lastUpdatedTime": iso(datetime.fromtimestamp(last_change,
+                                                          timezone.utc)),
+            "metadata": {"devices": devices},
+        }
+
+
+# ---- Query filtering and paging -------------------------------------------
+
+_TOKEN_PATTERN = re.compile(r"\(|\)|\bAND\b|\bOR\b|[^\s()]+")
+
+
+def parse_query(q: Optional[str]) -> Callable[[dict], bool]:
+    """Supports the subset of the query syntax the scripts use:
+    field:value terms combined with AND, OR and parentheses."""
+    if not q:
+        return lambda item: True
+    tokens = _TOKEN_PATTERN.findall(q)
+    position = 0
+
+    def parse_or():
+        nonlocal position
+        terms = [parse_and()]
+        while position < len(tokens) and tokens[position] == "OR":
+            position += 1
+            terms.append(parse_and())
+        return lambda item: any(term(item) for term in terms)
+
+    def parse_and():
+        nonlocal position
+        factors = [parse_factor()]
+        while position < len(tokens) and tokens[position] == "AND":
+            position += 1
+            factors.append(parse_factor())
+        return lambda item: all(factor(item) for factor in factors)
+
+    def parse_factor():
+        nonlocal position
+        token = tokens[position]
+        position += 1
+        if token == "(":
+            expression = parse_or()
+            position += 1
+            return expression
+        key, _, value = token.partition(":")
+        value = value.strip('"')
+        if value.endswith("*"):
+            return lambda item: str(item.get(key, "")).startswith(value[:-1])
+        return lambda item: str(item.get(key, "")) == value
+
+    return parse_or()
+
+
+def _paging_params(request: web.Request, settings: MockServerSettings) -> tuple:
+    limit = min(int(request.query.get("limit", 50)), settings.max_page_size)
+    offset = int(request.query.get("offset", 0))
+    return limit, offset
+
+
+def _page(request: web.Request, items: List[dict],
+          settings: MockServerSettings) -> dict:
+    items = [item for item in items if parse_query(request.query.get("q"))(item)]
+    limit, offset = _paging_params(request, settings)
+    return {"count": len(items), "limit": limit, "offset": offset,
+            "items": items[offset:offset + limit]}
+
+
+def _fmc_page(request: web.Request, items: List[dict]) -> dict:
+    # cdFMC allows up to 1000 items per page
+    limit = min(int(request.query.get("limit", 25)), 1000)
+    offset = int(request.query.get("offset", 0))
+    return {"items": items[offset:offset + limit],
+            "paging": {"count": len(items), "offset": offset,
+                       "limit": limit}}
+
+
+# ---- Middleware ---------------------------------------------------------
+
+def _route_name(request: web.Request) -> str:
+    resource = request.match_info.route.resource
+    return f"{request.method} {resource.canonical if resource else request.path}"
+
+
+@web.middleware
+async def _simulation_middleware(request: web.Request, handler):
+    state: MockApiState = request.app["state"]
+    settings = state.settings
+    if request.path.startswith("/mock/"):
+        return await handler(request)
+
+    route = _route_name(request)
+    state.request_counts[route] += 1
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    request["tenant"] = None
+    if token.startswith(TENANT_TOKEN_PREFIX):
+        request["tenant"] = state.fleet.tenants_by_uid.get(
+            token.removeprefix(TENANT_TOKEN_PREFIX))
+        if request["tenant"] is None:
+            return web.json_response({"error": "Unknown tenant token"},
+                                     status=401)
+    elif token != MSP_TOKEN:
+        return web.json_response({"error": "Invalid token"}, status=401)
+
+    if settings.rate_limit_rps:
+        now = time.monotonic()
+        bucket = state.buckets.setdefault(
+            token, _TokenBucket(settings.rate_limit_rps, now))
+        bucket.tokens = min(settings.rate_limit_rps, bucket.tokens + (
+            now - bucket.updated_at) * settings.rate_limit_rps)
+        bucket.updated_at = now
+        if bucket.tokens < 1:
+            state.throttled_counts[route] += 1
+            return web.json_response({"error": "Too many requests"},
+                                     status=429, headers={"Retry-After": "1"})
+        bucket.tokens -= 1
+    if settings.throttle_probability and \
+        state.rng.random() < settings.throttle_probability:
+        state.throttled_counts[route] += 1
+        return web.json_response({"error": "Too many requests"}, status=429,
+                                 headers={"Retry-After": "1"})
+
+    if settings.latency_ms or settings.latency_jitter_ms:
+        await asyncio.sleep(max(0.0, settings.latency_ms + state.rng.uniform(
+            -settings.latency_jitter_ms, settings.latency_jitter_ms)) / 1000)
+    return await handler(request)
+
+
+def _state(request: web.Request) -> MockApiState:
+    return request.app["state"]
+
+
+def _tenant(request: web.Request) -> MockTenant:
+    tenant = request["tenant"]
+    if tenant is None:
+        raise web.HTTPForbidden(text="Managed tenant token required")
+    return tenant
+
+
+# ---- MSP portal ---------------------------------------------------------
+
+async def get_msp_tenants(request):
+    state = _state(request)
+    return web.json_response(_page(
+        request, [tenant.tenant for tenant in state.fleet.tenants],
+        state.settings))
+
+
+async def create_tenant(request):
+    return web.json_response(_state(request).create_transaction(
+        "MSP_CREATE_TENANT", str(uuid.uuid4())), status=202)
+
+
+async def provision_cdfmc(request):
+    return web.json_response(_state(request).create_transaction(
+        "MSP_PROVISION_CDFMC", request.match_info["tenantUid"],
+        request.match_info["tenantUid"]), status=202)
+
+
+async def get_api_only_users(request):
+    state = _state(request)
+    return web.json_response(_page(
+        request, state.users.get(request.match_info["tenantUid"], []),
+        state.settings))
+
+
+async def add_users(request):
+    state = _state(request)
+    tenant = state.fleet.tenants_by_uid[request.match_info["tenantUid"]]
+    body = await request.json()
+    for user in body.get("users") or []:
+        state.users.setdefault(tenant.uid, []).append({
+            "uid": str(uuid.uuid4()),
+            "name": f"{user['username']}@{tenant.tenant['name']}",
+            "apiOnlyUser": user.get("apiOnlyUser", False),
+            "roles": [user.get("role", "ROLE_ADMIN")]})
+    return web.json_response(state.create_transaction(
+        "MSP_ADD_USERS_TO_TENANT", tenant.uid, tenant.uid), status=202)
+
+
+async def generate_api_token(request):
+    return web.json_response({
+        "apiToken": TENANT_TOKEN_PREFIX + request.match_info["tenantUid"]},
+        status=201)
+
+
+async def get_msp_devices(request):
+    state = _state(request)
+    return web.json_response(_page(
+        request, [device for tenant in state.fleet.tenants for device in
+                  tenant.devices], state.settings))
+
+
+async def calculate_compatible_versions(request):
+    state = _state(request)
+    body = await request.json()
+    compatibility_uid = str(uuid.uuid4())
+    state.compatibility[compatibility_uid] = body["deviceUids"]
+    return web.json_response(state.create_transaction(
+        "MSP_GET_COMPATIBLE_FTD_UPGRADE_PACKAGES", compatibility_uid), status=202)
+
+
+async def get_compatible_versions(request):
+    state = _state(request)
+    device_uids = state.compatibility.get(request.match_info["uid"], [])
+    devices = [state.fleet.devices_by_uid[uid] for uid in device_uids if
+               uid in state.fleet.devices_by_uid]
+    versions = []
+    for version in UPGRADE_TARGET_VERSIONS:
+        compatible = [(tenant, device) for tenant, device in devices if
+                      device.get("softwareVersion", "") < version]
+        if compatible:
+            versions.append({
+                "softwareVersion": version, "upgradeType": "UPGRADE",
+                "isSuggestedVersion": version == UPGRADE_TARGET_VERSIONS[1],
+                "compatibleDevices": [{
+                    "uid": device["uid"], "name": device["name"],
+                    "hardwareModel": device.get("hardwareModel") or "",
+                    "currentSoftwareVersion": device.get("softwareVersion"),
+                    "managedTenantUid": tenant.uid,
+                    "managedTenantName": tenant.tenant["name"],
+                    "managedTenantDisplayName": tenant.tenant["displayName"],
+                } for tenant, device in compatible]})
+    return web.json_response({"uid": request.match_info["uid"],
+                              "status": "DONE",
+                              "compatibleVersions": versions})
+
+
+async def trigger_upgrade(request):
+    state = _state(request)
+    body = await request.json()
+    run = _UpgradeRun(uid=str(uuid.uuid4()),
+                      name=body.get("name") or "Upgrade run",
+                      software_version=body["softwareVersion"],
+                      stage_upgrade_only=body.get("stageUpgradeOnly", False),
+                      submitted_at=time.time())
+    for device_uid in body["deviceUids"]:
+        run.devices[device_uid] = (
+            state.settings.upgrade_seconds * state.rng.uniform(0.5, 1.5),
+            state.rng.random() < state.settings.upgrade_failure_rate)
+    state.upgrade_runs[run.uid] = run
+    return web.json_response(state.create_transaction("MSP_UPGRADE_FTDS",
+                                                      run.uid), status=202)
+
+
+async def get_upgrade_run(request):
+    state = _state(request)
+    run = state.upgrade_runs.get(request.match_info["uid"])
+    if run is None:
+        raise web.HTTPNotFound()
+    return web.json_response(state.upgrade_run_dto(run))
+
+
+async def get_smart_accounts(request):
+    state = _state(request)
+    return web.json_response(_page(request, state.fleet.smart_accounts,
+                                   state.settings))
+
+
+async def get_virtual_accounts(request):
+    state = _state(request)
+    return web.json_response(_page(
+        request, state.fleet.virtual_accounts.get(
+            request.match_info["smartAccountUid"], []), state.settings))
+
+
+async def get_virtual_account_licenses(request):
+    state = _state(request)
+    return web.json_response(_page(
+        request, state.fleet.licenses.get(
+            request.match_info["virtualAccountUid"], []), state.settings))
+
+
+async def get_transaction(request):
+    state = _state(request)
+    transaction = state.transactions.get(request.match_info["uid"])
+    if transaction is None:
+        raise web.HTTPNotFound()
+    return web.json_response(state.transaction_dto(transaction))
+
+
+# ---- Managed tenant inventory and health ---------------------------------
+
+async def get_devices(request):
+    return web.json_response(_page(request, _tenant(request).devices,
+                                   _state(request).settings))
+
+
+async def get_device(request):
+    for device in _tenant(request).devices:
+        if device["uid"] == request.match_info["uid"]:
+            return web.json_response(device)
+    raise web.HTTPNotFound()
+
+
+async def get_managers(request):
+    tenant = _tenant(request)
+    managers = [tenant.manager] if tenant.tenant["cdFmcType"] != \
+        "UNPROVISIONED" else []
+    return web.json_response(_page(request, managers,
+                                   _state(request).settings))
+
+
+async def get_fmc_health(request):
+    tenant = _tenant(request)
+    window = TIME_RANGE_SECONDS.get(request.query.get("timeRange", "5m"), 300)
+    return web.json_response(fmc_health_metrics(
+        tenant, datetime.now(timezone.utc), window))
+
+
+def asa_window(query, now: datetime) -> Tuple[datetime, int]:
+    """End and length in seconds of the window asked for with either
+    timeRange or start and end."""
+    if "start" in query and "end" in query:
+        start = datetime.fromisoformat(query["start"])
+        end = min(datetime.fromisoformat(query["end"]), now)
+        return end, max(int((end - start).total_seconds()), 0)
+    return now, TIME_RANGE_SECONDS.get(query.get("timeRange", "10m"), 600)
+
+
+async def get_asa_health(request):
+    state = _state(request)
+    tenant = _tenant(request)
+    end, window = asa_window(request.query, datetime.now(timezone.utc))
+    items = asa_health_metrics(tenant, end, window)
+    limit, offset = _paging_params(request, state.settings)
+    return web.json_response({"items": items[offset:offset + limit],
+                              "total": len(items), "limit": limit,
+                              "offset": offset})
+
+
+# ---- cdFMC fmc_config --------------------------------------------------
+
+def _domain(request: web.Request) -> _CdFmcDomain:
+    tenant = _tenant(request)
+    if request.match_info["domain"] != tenant.domain_uid:
+        raise web.HTTPNotFound(text="Unknown domain")
+    return _state(request).domain(tenant.domain_uid)
+
+
+async def get_access_policies(request):
+    policies = list(_domain(request).access_policies.values())
+    if "name" in request.query:
+        policies = [p for p in policies if p["name"] == request.query["name"]]
+    return web.json_response(_fmc_page(request, policies))
+
+
+async def create_access_policy(request):
+    domain = _domain(request)
+    body = await request.json()
+    if any(p["name"] == body["name"] for p in domain.access_policies.values()):
+        return web.json_response({"error": {"messages": [{
+            "description": f"Policy name {body['name']} already exists"}]}},
+            status=400)
+    policy_uid = str(uuid.uuid4())
+    policy = dict(body, id=policy_uid, type="AccessPolicy",
+                  defaultAction=dict(body.get("defaultAction", {}),
+                                     id=str(uuid.uuid4())))
+    domain.access_policies[policy_uid] = policy
+    domain.access_rules[policy_uid] = []
+    return web.json_response(policy, status=201)
+
+
+async def get_access_policy(request):
+    policy = _domain(request).access_policies.get(request.match_info["id"])
+    if policy is None:
+        raise web.HTTPNotFound()
+    return web.json_response(policy)
+
+
+async def update_access_policy(request):
+    domain = _domain(request)
+    if request.match_info["id"] not in domain.access_policies:
+        raise web.HTTPNotFound()
+    domain.access_policies[request.match_info["id"]].update(await request.json())
+    return web.json_response(domain.access_policies[request.match_info["id"]])
+
+
+def _policy_rules(request: web.Request) -> List[dict]:
+    rules = _domain(request).access_rules.get(request.match_info["id"])
+    if rules is None:
+        raise web.HTTPNotFound()
+    return rules
+
+
+def _rule_error(description: str) -> web.Response:
+    return web.json_response(
+        {"error": {"messages": [{"description": description}]}}, status=422)
+
+
+async def get_access_rules(request):
+    return web.json_response(_fmc_page(request, _policy_rules(request)))
+
+
+async def create_access_rules(request):
+    rules = _policy_rules(request)
+    body = await request.json()
+    new_rules = body if isinstance(body, list) else [body]
+    names = {rule["name"] for rule in rules}
+    for rule in new_rules:
+        if rule["name"] in names:
+            return _rule_error(f"Rule name {rule['name']} already exists")
+        names.add(rule["name"])
+    created = [dict(rule, id=str(uuid.uuid4()), type="AccessRule") for rule in
+               new_rules]
+    rules.extend(created)
+    if isinstance(body, list):
+        return web.json_response({"items": created}, status=201)
+    return web.json_response(created[0], status=201)
+
+
+async def update_access_rules(request):
+    rules = _policy_rules(request)
+    positions = {rule["id"]: i for i, rule in enumerate(rules)}
+    body = await request.json()
+    for rule in body:
+        if rule.get("id") not in positions:
+            return _rule_error(f"Rule {rule.get('id')} not found")
+    for rule in body:
+        rules[positions[rule["id"]]] = dict(rule, type="AccessRule")
+    return web.json_response({"items": body})
+
+
+async def delete_access_rules(request):
+    rules = _policy_rules(request)
+    ids = set(request.query.get("filter", "").removeprefix("ids:").split(","))
+    rules[:] = [rule for rule in rules if rule["id"] not in ids]
+    return web.json_response({})
+
+
+async def get_objects(request):
+    objects = _domain(request).objects.get(request.match_info["type"], [])
+    filter_value = request.query.get("filter", "")
+    if filter_value.startswith("nameOrValue:"):
+        name = filter_value.removeprefix("nameOrValue:")
+        objects = [obj for obj in objects if obj["name"] == name]
+    return web.json_response(_fmc_page(request, objects))
+
+
+async def create_device_backup(request):
+    domain = _domain(request)
+    task_id = str(uuid.uuid4())
+    domain.tasks[task_id] = time.time()
+    return web.json_response({"metadata": {"task": {"id": task_id}}},
+                             status=202)
+
+
+async def get_task_status(request):
+    state = _state(request)
+    submitted_at = _domain(request).tasks.get(request.match_info["id"])
+    if submitted_at is None:
+        raise web.HTTPNotFound()
+    elapsed = time.time() - submitted_at
+    status = "SUCCESS" if elapsed >= state.settings.task_seconds else \
+        "RUNNING" if elapsed >= state.settings.task_seconds / 5 else "PENDING"
+    return web.json_response({"id": request.match_info["id"],
+                              "taskType": "DEVICE_BACKUP", "status": status,
+                              "message": f"Backup {status.lower()}"})
+
+
+# ---- Mock control -----------------------------------------------------
+
+async def get_stats(request):
+    state = _state(request)
+    return web.json_response({
+        "requests": dict(state.request_counts),
+        "throttled": dict(state.throttled_counts),
+        "total_requests": sum(state.request_counts.values()),
+        "total_throttled": sum(state.throttled_counts.values())})
+
+
+async def reset_stats(request):
+    state = _state(request)
+    state.request_counts.clear()
+    state.throttled_counts.clear()
+    return web.json_response({})
+
+
+async def get_tenants_file(request):
+    state = _state(request)
+    return web.json_response([{
+        "name": tenant.tenant["name"], "region": "mock",
+        "api_token": TENANT_TOKEN_PREFIX + tenant.uid}
+        for tenant in state.fleet.tenants
+        if tenant.tenant["cdFmcType"] != "UNPROVISIONED"])
+
+
+def build_app(fleet: MockFleet,
+              settings: MockServerSettings = MockServerSettings(),
+              seed: int = 1) -> web.Application:
+    app = web.Application(middlewares=[_simulation_middleware])
+    app["state"] = MockApiState(fleet, settings, seed)
+    fmc_config = FMC_CONFIG
+    app.add_routes([
+        web.get("/v1/msp/tenants", get_msp_tenants),
+        web.post("/v1/msp/tenants/create", create_tenant),
+        web.post("/v1/msp/tenants/{tenantUid}/cdfmc", provision_cdfmc),
+        web.get("/v1/msp/tenants/{tenantUid}/users/api-only",
+                get_api_only_users),
+        web.post("/v1/msp/tenants/{tenantUid}/users", add_users),
+        web.post("/v1/msp/tenants/{tenantUid}/users/{apiUserUid}/token",
+                 generate_api_token),
+        web.get("/v1/msp/inventory/devices", get_msp_devices),
+        web.post("/v1/msp/inventory/devices/ftds/upgrades/versions",
+                 calculate_compatible_versions),
+        web.get("/v1/msp/inventory/devices/ftds/upgrades/versions/{uid}",
+                get_compatible_versions),
+        web.post("/v1/msp/inventory/devices/ftds/upgrades/trigger",
+                 trigger_upgrade),
+        web.get("/v1/msp/inventory/devices/upgrades/runs/{uid}",
+                get_upgrade_run),
+        web.get("/v1/msp/licenses/smart-accounts", get_smart_accounts),
+        web.get("/v1/msp/licenses/smart-accounts/{smartAccountUid}/virtual-accounts",
+                get_virtual_accounts),
+        web.get("/v1/msp/licenses/smart-accounts/{smartAccountUid}/virtual-accounts/{virtualAccountUid}/licenses",
+                get_virtual_account_licenses),
+        web.get("/v1/transactions/{uid}", get_transaction),
+        web.get("/v1/inventory/devices", get_devices),
+        web.get("/v1/inventory/devices/asas/health/metrics", get_asa_health),
+        web.get("/v1/inventory/devices/{uid}", get_device),
+        web.get("/v1/inventory/managers", get_managers),
+        web.get("/v1/inventory/managers/{fmcUid}/health/metrics",
+                get_fmc_health),
+        web.get(f"{fmc_config}/policy/accesspolicies", get_access_policies),
+        web.post(f"{fmc_config}/policy/accesspolicies", create_access_policy),
+        web.get(f"{fmc_config}/policy/accesspolicies/{{id}}",
+                get_access_policy),
+        web.put(f"{fmc_config}/policy/accesspolicies/{{id}}",
+                update_access_policy),
+        web.get(f"{fmc_config}/policy/accesspolicies/{{id}}/accessrules",
+                get_access_rules),
+        web.post(f"{fmc_config}/policy/accesspolicies/{{id}}/accessrules",
+                 create_access_rules),
+        web.put(f"{fmc_config}/policy/accesspolicies/{{id}}/accessrules",
+                update_access_rules),
+        web.delete(f"{fmc_config}/policy/accesspolicies/{{id}}/accessrules",
+                   delete_access_rules),
+        web.get(f"{fmc_config}/object/{{type}}", get_objects),
+        web.post(f"{fmc_config}/backup/operational/devicebackup",
+                 create_device_backup),
+        web.get(f"{fmc_config}/job/taskstatuses/{{id}}", get_task_status),
+        web.get("/mock/stats", get_stats),
+        web.post("/mock/stats/reset", reset_stats),
+        web.get("/mock/tenants.json", get_tenants_file),
+    ])
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a mock SCC Firewall Manager / cdFMC API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--tenants", type=int, default=100)
+    parser.add_argument("--ftds-per-tenant", type=int, default=20)
+    parser.add_argument("--asas-per-tenant", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0,
+                        help="Added to every API response")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-limit-rps", type=float, default=0,
+                        help="Requests per second allowed per token before "
+                             "429s are returned; 0 disables rate limiting")
+    parser.add_argument("--throttle-probability", type=float, default=0,
+                        help="Probability of a random 429 on any request")
+    parser.add_argument("--max-page-size", type=int, default=200)
+    parser.add_argument("--transaction-seconds", type=float, default=2)
+    parser.add_argument("--upgrade-seconds", type=float, default=30)
+    parser.add_argument("--upgrade-failure-rate", type=float, default=0.02)
+    parser.add_argument("--task-seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    mock_fleet = build_fleet(args.tenants, args.ftds_per_tenant,
+                             args.asas_per_tenant, seed=args.seed)
+    print(f"Serving {len(mock_fleet.tenants)} tenants and "
+          f"{len(mock_fleet.devices_by_uid)} devices")
+    web.run_app(build_app(mock_fleet, MockServerSettings(
+        latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms,
+        rate_limit_rps=args.rate_limit_rps,
+        throttle_probability=args.throttle_probability,
+        max_page_size=args.max_page_size,
+        transaction_seconds=args.transaction_seconds,
+        upgrade_seconds=args.upgrade_seconds,
+        upgrade_failure_rate=args.upgrade_failure_rate,
+        task_seconds=args.task_seconds), args.seed),
+        host=args.host, port=args.port)
@@ -1,122 +1,204 @@
-from typing import List
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import ClassVar, List, Optional
 
 
-class CdFmcAccessPolicy:
-    def __init__(self, name: str, default_action: str = "BLOCK"):
-        self.type = "AccessPolicy"
-        self.name = name
-        self.defaultAction = {"action": default_action}
+# Objects such as URL categories and network objects are referenced by many
+# rules, so they are immutable and interned: every rule referencing
+# "Gambling" shares one UrlCategory and one serialized dict. Treat the output
+# of to_dict as read-only.
 
 
-class UrlCategory:
-    def __init__(self, name: str, id: str):
-        self.name = name
-        self.id = id
-        self.type = "URLCategory"
+@dataclass(slots=True)
+class CdFmcAccessPolicy:
+    type: ClassVar[str] = "AccessPolicy"
+    name: str
+    default_action: str = "BLOCK"
 
     def to_dict(self):
         return {
-            "name": self.name,
-            "id": self.id,
             "type": self.type,
+            "name": self.name,
+            "defaultAction": {"action": self.default_action},
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "CdFmcAccessPolicy":
+        return cls(name=data["name"],
+                   default_action=data.get("defaultAction", {}).get("action",
+                                                                    "BLOCK"))
+
+
+@dataclass(slots=True, frozen=True)
+class UrlCategory:
+    type: ClassVar[str] = "URLCategory"
+    name: str
+    id: Optional[str] = None
+
+    def to_dict(self):
+        return _url_category_dict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UrlCategory":
+        return url_category(data["name"], data.get("id"))
 
+
+@lru_cache(maxsize=None)
+def url_category(name: str, id: Optional[str] = None) -> UrlCategory:
+    return UrlCategory(name=name, id=id)
+
+
+@lru_cache(maxsize=None)
+def _url_category_dict(category: UrlCategory) -> dict:
+    return {
+        "name": category.name,
+        "id": category.id,
+        "type": category.type,
+    }
+
+
+@dataclass(slots=True, frozen=True)
 class UrlCategoryWithReputation:
-    def __init__(self, reputation: str, category: UrlCategory):
-        self.reputation = reputation
-        self.category = category
-        self.type = "UrlCategoryAndReputation"
+    type: ClassVar[str] = "UrlCategoryAndReputation"
+    reputation: str
+    category: UrlCategory
 
     def to_dict(self):
-        return {
-            "reputation": self.reputation,
-            "category": self.category.to_dict(),
-            "type": self.type,
-        }
+        return _url_category_with_reputation_dict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UrlCategoryWithReputation":
+        return url_category_with_reputation(
+            data.get("reputation"), UrlCategory.from_dict(data["category"]))
+
+
+@lru_cache(maxsize=None)
+def url_category_with_reputation(reputation: str,
+                                 category: UrlCategory) -> UrlCategoryWithReputation:
+    return UrlCategoryWithReputation(reputation=reputation, category=category)
 
 
+@lru_cache(maxsize=None)
+def _url_category_with_reputation_dict(ucr: UrlCategoryWithReputation) -> dict:
+    return {
+        "reputation": ucr.reputation,
+        "category": ucr.category.to_dict(),
+        "type": ucr.type,
+    }
+
+
+@dataclass(slots=True)
 class Urls:
-    def __init__(self, url_categories_with_reputation: list[UrlCategoryWithReputation]):
-        self.urlCategoriesWithReputation = url_categories_with_reputation
+    url_categories_with_reputation: List[UrlCategoryWithReputation]
 
     def to_dict(self):
         return {
             "urlCategoriesWithReputation": [
-                ucr.to_dict() for ucr in self.urlCategoriesWithReputation
+                ucr.to_dict() for ucr in self.url_categories_with_reputation
             ],
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "Urls":
+        return cls([UrlCategoryWithReputation.from_dict(ucr) for ucr in
+                    data.get("urlCategoriesWithReputation", [])])
+
 
+@dataclass(slots=True, frozen=True)
 class NetworkObject:
-    def __init__(self, type: str, overridable: bool, id: str, name: str):
-        self.type = type
-        self.overridable = overridable
-        self.id = id
-        self.name = name
+    type: Optional[str]
+    overridable: bool
+    id: Optional[str]
+    name: str
 
     def to_dict(self):
-        return {
-            "type": self.type,
-            "overridable": self.overridable,
-            "id": self.id,
-            "name": self.name,
-        }
+        return _network_object_dict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NetworkObject":
+        return network_object(type=data.get("type"),
+                              overridable=data.get("overridable", False),
+                              id=data.get("id"), name=data["name"])
+
+
+@lru_cache(maxsize=None)
+def network_object(type: Optional[str], overridable: bool, id: Optional[str],
+                   name: str) -> NetworkObject:
+    return NetworkObject(type=type, overridable=overridable, id=id, name=name)
+
 
+@lru_cache(maxsize=None)
+def _network_object_dict(obj: NetworkObject) -> dict:
+    return {
+        "type": obj.type,
+        "overridable": obj.overridable,
+        "id": obj.id,
+        "name": obj.name,
+    }
 
+
+@dataclass(slots=True)
 class SourceNetworks:
-    def __init__(self, objects: list[NetworkObject]):
-        self.objects = objects
+    objects: List[NetworkObject]
 
     def to_dict(self):
         return {
             "objects": [obj.to_dict() for obj in self.objects],
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "SourceNetworks":
+        return cls([NetworkObject.from_dict(obj) for obj in
+                    data.get("objects", [])])
+
+
+@dataclass(slots=True)
 class DeviceBackupRequest:
-    def __init__(self, name: str, description: str, device_ids: List[str]):
-        self.name = name
-        self.description = description
-        self.devices = [DeviceBackupRequestDevice(device_id) for device_id in device_ids]
+    name: str
+    description: str
+    device_ids: List[str]
 
     def to_dict(self):
         return {
             "name": self.name,
             "description": self.description,
-            "devices": [device.to_dict() for device in self.devices],
+            "devices": [{"id": device_id, "type": "Device"} for device_id in
+                        self.device_ids],
         }
 
-class DeviceBackupRequestDevice:
-    def __init__(self, device_id: str,  type:str = "Device"):
-        self.id = device_id
-        self.type = type
-
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "type": self.type,
-        }
 
+@dataclass(slots=True)
 class CdFmcAccessRule:
-    def __init__(
-        self,
-        name: str,
-        action: str,
-        enabled: bool,
-        urls: Urls,
-        source_networks: SourceNetworks,
-    ):
-        self.name = name
-        self.action = action
-        self.enabled = enabled
-        self.urls = urls
-        self.source_networks = source_networks
+    name: str
+    action: str
+    enabled: bool
+    urls: Optional[Urls] = None
+    source_networks: Optional[SourceNetworks] = None
+    id: Optional[str] = None
 
     def to_dict(self):
-        return {
+        rule = {
             "name": self.name,
             "action": self.action,
             "enabled": self.enabled,
-            "urls": self.urls.to_dict(),
-            "sourceNetworks": self.source_networks.to_dict(),
-        }
\ No newline at end of file
+        }
+        if self.id:
+            rule["id"] = self.id
+            rule["type"] = "AccessRule"
+        if self.urls:
+            rule["urls"] = self.urls.to_dict()
+        if self.source_networks:
+            rule["sourceNetworks"] = self.source_networks.to_dict()
+        return rule
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CdFmcAccessRule":
+        return cls(
+            name=data["name"],
+            action=data["action"],
+            enabled=data.get("enabled", True),
+            urls=Urls.from_dict(data["urls"]) if data.get("urls") else None,
+            source_networks=SourceNetworks.from_dict(data["sourceNetworks"])
+            if data.get("sourceNetworks") else None,
+            id=data.get("id"),
+        )
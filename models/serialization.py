@@ -0,0 +1,15 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    """Serializes a JSON-compatible object (e.g. the output of a model's
+    to_dict) with orjson when it is installed, and compact stdlib json
+    otherwise."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
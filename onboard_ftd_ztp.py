@@ -4,11 +4,12 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import questionary
-import requests
 from scc_firewall_manager_sdk import MspManagedTenantDto, \
     MSPTenantManagementApi, ApiClient, InventoryApi, ZtpOnboardingInput
 
 from factories import api_client_factory
+from factories.cdfmc_rest_client_factory import \
+    get_cdfmc_rest_client_for_api_client
 from services import msp_managed_tenant_token_service, transaction_service
 
 
@@ -29,17 +30,10 @@ def _get_cdfmc_access_policies_in_managed_tenant(tenant: MspManagedTenantDto) ->
     with api_client_factory.build_api_client_for_managed_tenant(tenant,
                                                                 api_token) as managed_tenant_api_client:
         domain_uid = _get_cdfmc_domain_uid(managed_tenant_api_client)
-        url = (
-            f"{managed_tenant_api_client.configuration.host}/v1/cdfmc/api/fmc_config/v1/domain/"
-            f"{domain_uid}/policy/accesspolicies"
-        )
-        headers = {
-            "Authorization": f"Bearer {managed_tenant_api_client.configuration.access_token}",
-            "Content-Type": "application/json",
-        }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        access_policies = response.json()["items"]
+        rest_client = get_cdfmc_rest_client_for_api_client(
+            managed_tenant_api_client)
+        access_policies = rest_client.get(rest_client.fmc_config_url(
+            domain_uid, "policy/accesspolicies"))["items"]
 
         return [(access_policy['id'], access_policy['name']) for access_policy
                 in access_policies]
@@ -6,13 +6,15 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import questionary
-import requests
 from scc_firewall_manager_sdk import InventoryApi, MspManagedTenantDto, \
     MSPTenantManagementApi, ApiClient, FtdCreateOrUpdateInput, \
     FtdRegistrationInput
 
 from factories import api_client_factory
-from services import msp_managed_tenant_token_service, transaction_service
+from factories.cdfmc_rest_client_factory import \
+    get_cdfmc_rest_client_for_api_client
+from services import msp_managed_tenant_token_service, transaction_service, \
+    profiling_service
 from services.ssh_service import SshConnectionInfo, send_cli_key_via_ssh
 
 
@@ -71,17 +73,10 @@ def _get_cdfmc_access_policies_in_managed_tenant(tenant: MspManagedTenantDto) ->
     with api_client_factory.build_api_client_for_managed_tenant(tenant,
                                                                 api_token) as managed_tenant_api_client:
         domain_uid = _get_cdfmc_domain_uid(managed_tenant_api_client)
-        url = (
-            f"{managed_tenant_api_client.configuration.host}/v1/cdfmc/api/fmc_config/v1/domain/"
-            f"{domain_uid}/policy/accesspolicies"
-        )
-        headers = {
-            "Authorization": f"Bearer {managed_tenant_api_client.configuration.access_token}",
-            "Content-Type": "application/json",
-        }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        access_policies = response.json()["items"]
+        rest_client = get_cdfmc_rest_client_for_api_client(
+            managed_tenant_api_client)
+        access_policies = rest_client.get(rest_client.fmc_config_url(
+            domain_uid, "policy/accesspolicies"))["items"]
 
         return [(access_policy['id'], access_policy['name']) for access_policy
                 in access_policies]
@@ -149,6 +144,7 @@ def _get_ssh_info_interactive() -> Optional[SshConnectionInfo]:
                                  password=password)
 
 
+@profiling_service.traced("input")
 def _get_ftd_onboarding_inputs_interactive() -> List[Tuple[
     MspManagedTenantDto, FtdCreateOrUpdateInput, Optional[SshConnectionInfo]]]:
     ftd_inputs: List[Tuple[
@@ -315,10 +311,11 @@ def onboard_ftds(ftd_inputs: List[Tuple[
                 send_cli_key_via_ssh(ssh_info, cli_key)
                 print(f"CLI key sent successfully to '{ftd_input.name}'.")
             else:
-                questionary.press_any_key_to_continue(
-                    f"Please paste the CLI key: {cli_key} into your device, "
-                    f"and then press any key to continue..."
-                ).ask()
+                with profiling_service.span("paste CLI key", "input"):
+                    questionary.press_any_key_to_continue(
+                        f"Please paste the CLI key: {cli_key} into your device, "
+                        f"and then press any key to continue..."
+                    ).ask()
 
             registration_transaction = inventory_api.finish_onboarding_ftd_device(
                 ftd_registration_input=FtdRegistrationInput(
@@ -333,7 +330,9 @@ if __name__ == "__main__":
                         help="Run in non-interactive mode using a CSV file")
     parser.add_argument("--csv-file", type=str,
                         help="Path to CSV file (required for non-interactive mode)")
+    profiling_service.add_profile_argument(parser)
     args = parser.parse_args()
+    profiling_service.enable_if_requested(args.profile)
 
     if args.non_interactive:
         if not args.csv_file:
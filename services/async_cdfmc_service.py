@@ -0,0 +1,52 @@
+from typing import List
+
+from factories.async_api_client_factory import AsyncApiClient
+
+
+def _fmc_config_path(domain_uid: str, path: str) -> str:
+    return f"/v1/cdfmc/api/fmc_config/v1/domain/{domain_uid}/{path}"
+
+
+async def get_cdfmc_domain_uid(api_client: AsyncApiClient) -> str | None:
+    managers_page = await api_client.get("/v1/inventory/managers",
+                                         params={"q": "deviceType:CDFMC"})
+    if managers_page.get("items"):
+        return managers_page["items"][0]["fmcDomainUid"]
+    return None
+
+
+async def get_access_policies(api_client: AsyncApiClient,
+                              domain_uid: str) -> List[dict]:
+    limit = 1000
+    offset = 0
+    access_policies = []
+    while True:
+        page = await api_client.get(
+            _fmc_config_path(domain_uid, "policy/accesspolicies"),
+            params={"limit": str(limit), "offset": str(offset)})
+        access_policies.extend(page.get("items", []))
+        offset += limit
+        if offset >= page.get("paging", {}).get("count", 0):
+            return access_policies
+
+
+async def create_access_policy(api_client: AsyncApiClient, domain_uid: str,
+                               access_policy: dict) -> dict:
+    return await api_client.post(
+        _fmc_config_path(domain_uid, "policy/accesspolicies"),
+        json=access_policy)
+
+
+async def create_access_rule(api_client: AsyncApiClient, domain_uid: str,
+                             access_policy_uid: str, access_rule: dict) -> dict:
+    return await api_client.post(
+        _fmc_config_path(domain_uid,
+                         f"policy/accesspolicies/{access_policy_uid}/accessrules"),
+        json=access_rule)
+
+
+async def create_device_backup(api_client: AsyncApiClient, domain_uid: str,
+                               device_backup_request: dict) -> dict:
+    return await api_client.post(
+        _fmc_config_path(domain_uid, "backup/operational/devicebackup"),
+        json=device_backup_request)
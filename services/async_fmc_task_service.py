@@ -0,0 +1,21 @@
+import asyncio
+
+from factories.async_api_client_factory import AsyncApiClient
+from services.fmc_task_service import FmcTask, TERMINAL_STATUSES, \
+    parse_task_response
+
+
+async def get_task(domain_uid: str, task_id: str,
+                   api_client: AsyncApiClient) -> FmcTask:
+    return parse_task_response(await api_client.get(
+        f"/v1/cdfmc/api/fmc_config/v1/domain/{domain_uid}/job/taskstatuses/{task_id}"))
+
+
+async def wait_for_task_completion(domain_uid: str, task_id: str,
+                                   api_client: AsyncApiClient,
+                                   poll_interval_seconds: int = 5) -> FmcTask:
+    task = await get_task(domain_uid, task_id, api_client)
+    while task.status not in TERMINAL_STATUSES:
+        await asyncio.sleep(poll_interval_seconds)
+        task = await get_task(domain_uid, task_id, api_client)
+    return task
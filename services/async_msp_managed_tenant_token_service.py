@@ -0,0 +1,39 @@
+from scc_firewall_manager_sdk import MspManagedTenantDto, User, CdoTransaction
+
+from factories.async_api_client_factory import AsyncApiClient
+from services import async_transaction_service
+from services.msp_managed_tenant_token_service import username
+
+
+async def _get_user(msp_managed_tenant: MspManagedTenantDto,
+                    api_client: AsyncApiClient) -> User | None:
+    user_page = await api_client.get(
+        f"/v1/msp/tenants/{msp_managed_tenant.uid}/users/api-only",
+        params={"limit": "1", "offset": "0",
+                "q": f"name:{username}@{msp_managed_tenant.name}"})
+    if user_page.get("count") == 1:
+        return User.from_dict(user_page["items"][0])
+    return None
+
+
+async def _create_user_in_tenant(msp_managed_tenant: MspManagedTenantDto,
+                                 api_client: AsyncApiClient) -> User:
+    user = await _get_user(msp_managed_tenant, api_client)
+    if user is not None:
+        return user
+
+    transaction = CdoTransaction.from_dict(await api_client.post(
+        f"/v1/msp/tenants/{msp_managed_tenant.uid}/users",
+        json={"users": [{"apiOnlyUser": True, "role": "ROLE_ADMIN",
+                         "username": username}]}))
+    await async_transaction_service.wait_for_transaction_to_finish(
+        transaction, api_client)
+    return await _get_user(msp_managed_tenant, api_client)
+
+
+async def get_token_for_managed_tenant(msp_managed_tenant: MspManagedTenantDto,
+                                       api_client: AsyncApiClient) -> str:
+    user = await _create_user_in_tenant(msp_managed_tenant, api_client)
+    api_token_info = await api_client.post(
+        f"/v1/msp/tenants/{msp_managed_tenant.uid}/users/{user.uid}/token")
+    return api_token_info["apiToken"]
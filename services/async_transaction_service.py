@@ -0,0 +1,25 @@
+import asyncio
+
+from scc_firewall_manager_sdk import CdoTransaction
+
+from factories.async_api_client_factory import AsyncApiClient
+
+
+async def get_transaction(transaction_uid: str,
+                          api_client: AsyncApiClient) -> CdoTransaction:
+    return CdoTransaction.from_dict(
+        await api_client.get(f"/v1/transactions/{transaction_uid}"))
+
+
+async def wait_for_transaction_to_finish(transaction: CdoTransaction,
+                                         api_client: AsyncApiClient,
+                                         poll_interval_seconds: int = 3) -> CdoTransaction:
+    while transaction.cdo_transaction_status not in ["DONE", "ERROR",
+                                                     "CANCELLED"]:
+        await asyncio.sleep(poll_interval_seconds)
+        transaction = await get_transaction(transaction.transaction_uid,
+                                            api_client)
+    if transaction.cdo_transaction_status != 'DONE':
+        raise Exception(
+            f"Transaction {transaction.transaction_uid} failed with status {transaction.cdo_transaction_status}")
+    return transaction
@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+import requests
+
+from factories.cdfmc_rest_client_factory import CdFmcRestClient
+from models.fmc import CdFmcAccessRule
+
+# FMC accepts at most 1000 objects per bulk POST
+BULK_RULE_CHUNK_SIZE = 1000
+# Statuses FMC returns for invalid rules in a bulk request; any other error
+# applies to the whole request, so splitting the chunk would not help
+RULE_REJECTED_STATUSES = (400, 422)
+
+
+@dataclass
+class AccessRuleResult:
+    rule: CdFmcAccessRule
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+def _error_message(e: Exception) -> str:
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        try:
+            messages = e.response.json()["error"]["messages"]
+            return "; ".join(message.get("description", "") for message in
+                             messages)
+        except (ValueError, KeyError, TypeError):
+            return f"{e.response.status_code}: {e.response.text[:200]}"
+    return str(e)
+
+
+def _submit_chunk(rest_client: CdFmcRestClient, method: str, url: str,
+                  results: List[AccessRuleResult]) -> None:
+    try:
+        response = rest_client.request(
+            method, url, json=[result.rule.to_dict() for result in results],
+            params={"bulk": "true"})
+    except requests.HTTPError as e:
+        if e.response is None or \
+            e.response.status_code not in RULE_REJECTED_STATUSES:
+            raise
+        # A bulk request is all-or-nothing, so split the chunk to find the
+        # rules that were rejected and still submit the rest
+        if len(results) > 1:
+            middle = len(results) // 2
+            _submit_chunk(rest_client, method, url, results[:middle])
+            _submit_chunk(rest_client, method, url, results[middle:])
+            return
+        for result in results:
+            result.error = _error_message(e)
+        return
+    except requests.RequestException as e:
+        for result in results:
+            result.error = _error_message(e)
+        return
+
+    # Rule names are unique within a policy, so match the rules back by name
+    # rather than relying on response order
+    returned_ids = {item["name"]: item["id"] for item in
+                    response.get("items", [])}
+    for result in results:
+        result.id = returned_ids.get(result.rule.name)
+        if result.id is None:
+            result.error = "Rule missing from bulk response"
+
+
+def _accessrules_url(rest_client: CdFmcRestClient, domain_uid: str,
+                     access_policy_uid: str) -> str:
+    return rest_client.fmc_config_url(
+        domain_uid, f"policy/accesspolicies/{access_policy_uid}/accessrules")
+
+
+def get_access_rules(rest_client: CdFmcRestClient, domain_uid: str,
+                     access_policy_uid: str) -> List[dict]:
+    """Returns the expanded rules of the policy in rule order."""
+    url = _accessrules_url(rest_client, domain_uid, access_policy_uid)
+    offset = 0
+    count = None
+    rules: List[dict] = []
+
+    while count is None or len(rules) < count:
+        page = rest_client.get(url, params={"expanded": "true",
+                                            "limit": BULK_RULE_CHUNK_SIZE,
+                                            "offset": offset})
+        if not page.get("items"):
+            break
+        rules.extend(page["items"])
+        offset += BULK_RULE_CHUNK_SIZE
+        count = page["paging"]["count"]
+
+    return rules
+
+
+def create_access_rules(rest_client: CdFmcRestClient, domain_uid: str,
+                        access_policy_uid: str,
+                        rules: List[CdFmcAccessRule],
+                        chunk_size: int = BULK_RULE_CHUNK_SIZE) -> List[
+    AccessRuleResult]:
+    """Creates the rules in order using the bulk endpoint. Returns one result
+    per input rule, holding either the created rule id or the error. Errors
+    that are not about the rules themselves, such as 401 or 429, are
+    raised."""
+    url = _accessrules_url(rest_client, domain_uid, access_policy_uid)
+    results = [AccessRuleResult(rule=rule) for rule in rules]
+    for start in range(0, len(results), chunk_size):
+        _submit_chunk(rest_client, "POST", url,
+                      results[start:start + chunk_size])
+    return results
+
+
+def update_access_rules(rest_client: CdFmcRestClient, domain_uid: str,
+                        access_policy_uid: str,
+                        rules: List[CdFmcAccessRule],
+                        chunk_size: int = BULK_RULE_CHUNK_SIZE) -> List[
+    AccessRuleResult]:
+    """Replaces existing rules, which must have their id set, using the bulk
+    endpoint. Returns one result per input rule."""
+    url = _accessrules_url(rest_client, domain_uid, access_policy_uid)
+    results = [AccessRuleResult(rule=rule) for rule in rules]
+    for start in range(0, len(results), chunk_size):
+        _submit_chunk(rest_client, "PUT", url,
+                      results[start:start + chunk_size])
+    return results
+
+
+def delete_access_rules(rest_client: CdFmcRestClient, domain_uid: str,
+                        access_policy_uid: str, rule_ids: List[str],
+                        chunk_size: int = BULK_RULE_CHUNK_SIZE) -> None:
+    url = _accessrules_url(rest_client, domain_uid, access_policy_uid)
+    for start in range(0, len(rule_ids), chunk_size):
+        rest_client.delete(url, params={
+            "bulk": "true",
+            "filter": "ids:" + ",".join(rule_ids[start:start + chunk_size])})
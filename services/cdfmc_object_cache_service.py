@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from factories.cdfmc_rest_client_factory import CdFmcRestClient
+
+CACHE_DIR = Path(os.getenv("SCCFM_CACHE_DIR", Path.home() / ".cache" / "sccfm")) \
+            / "cdfmc_objects"
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+PAGE_LIMIT = 1000
+
+# Object types commonly referenced by access rules; any other type under
+# object/ can be looked up too
+URL_CATEGORIES = "urlcategories"
+NETWORKS = "networks"
+HOSTS = "hosts"
+NETWORK_GROUPS = "networkgroups"
+PORTS = "protocolportobjects"
+APPLICATIONS = "applications"
+
+
+class CdFmcObjectIndex:
+    """All objects of one type in a domain, indexed by name and id."""
+
+    def __init__(self, object_type: str, items: List[dict]):
+        self.object_type = object_type
+        self.items = items
+        self._by_name = {item["name"]: item for item in items}
+        self._by_id = {item["id"]: item for item in items}
+
+    def get(self, name: str) -> Optional[dict]:
+        return self._by_name.get(name)
+
+    def get_id(self, name: str) -> Optional[str]:
+        item = self._by_name.get(name)
+        return item["id"] if item else None
+
+    def get_by_id(self, object_id: str) -> Optional[dict]:
+        return self._by_id.get(object_id)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+def _fetch_all_objects(rest_client: CdFmcRestClient, domain_uid: str,
+                       object_type: str) -> List[dict]:
+    url = rest_client.fmc_config_url(domain_uid, f"object/{object_type}")
+    offset = 0
+    count = None
+    items: List[dict] = []
+
+    while count is None or len(items) < count:
+        page = rest_client.get(url, params={"limit": PAGE_LIMIT,
+                                            "offset": offset})
+        if not page.get("items"):
+            break
+        # Only what is needed to reference an object, to keep the cache small
+        items.extend({"id": item["id"], "name": item["name"],
+                      "type": item.get("type")} for item in page["items"])
+        offset += PAGE_LIMIT
+        count = page["paging"]["count"]
+
+    return items
+
+
+class CdFmcObjectCache:
+    """Name to id lookups for the objects in one tenant's cdFMC domain. Each
+    object type is fetched in full on first use and persisted for
+    ttl_seconds, so later runs do not call the API again. cdFMC tenants
+    share the regional host and usually the Global domain uid, so caches are
+    kept per tenant. A name that is not found is looked up again in a fresh
+    fetch, once per object type, as it may have been created since the
+    objects were cached."""
+
+    def __init__(self, rest_client: CdFmcRestClient, tenant_uid: str,
+                 domain_uid: str, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.rest_client = rest_client
+        self.tenant_uid = tenant_uid
+        self.domain_uid = domain_uid
+        self.ttl_seconds = ttl_seconds
+        self.cache_file = CACHE_DIR / tenant_uid / f"{domain_uid}.json"
+        self._indexes: Dict[str, CdFmcObjectIndex] = {}
+        # Object types fetched from the API by this process
+        self._fetched: set = set()
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, dict]:
+        if not self.cache_file.exists():
+            return {}
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, cache: Dict[str, dict]) -> None:
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(cache, f)
+        tmp_file.replace(self.cache_file)
+
+    def _save(self, object_type: str, items: List[dict]) -> None:
+        cache = self._load()
+        cache[object_type] = {"cached_at": time.time(), "items": items}
+        self._write(cache)
+
+    def get_index(self, object_type: str,
+                  refresh: bool = False) -> CdFmcObjectIndex:
+        with self._lock:
+            if not refresh and object_type in self._indexes:
+                return self._indexes[object_type]
+
+            entry = None if refresh else self._load().get(object_type)
+            if entry and time.time() - entry["cached_at"] <= self.ttl_seconds:
+                items = entry["items"]
+            else:
+                items = _fetch_all_objects(self.rest_client, self.domain_uid,
+                                           object_type)
+                self._save(object_type, items)
+                self._fetched.add(object_type)
+
+            self._indexes[object_type] = CdFmcObjectIndex(object_type, items)
+            return self._indexes[object_type]
+
+    def get(self, object_type: str, name: str) -> Optional[dict]:
+        item = self.get_index(object_type).get(name)
+        if item is None and object_type not in self._fetched:
+            item = self.get_index(object_type, refresh=True).get(name)
+        return item
+
+    def get_id(self, object_type: str, name: str) -> Optional[str]:
+        item = self.get(object_type, name)
+        return item["id"] if item else None
+
+    def invalidate(self, object_type: Optional[str] = None) -> None:
+        """Drops cached objects, e.g. after creating or deleting objects of
+        that type."""
+        with self._lock:
+            if object_type is None:
+                self._indexes.clear()
+                self._write({})
+                return
+            self._indexes.pop(object_type, None)
+            cache = self._load()
+            cache.pop(object_type, None)
+            self._write(cache)
+
+
+_caches: Dict[Tuple[str, str, str], CdFmcObjectCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_object_cache(rest_client: CdFmcRestClient, tenant_uid: str,
+                     domain_uid: str,
+                     ttl_seconds: int = DEFAULT_TTL_SECONDS) -> CdFmcObjectCache:
+    with _caches_lock:
+        key = (rest_client.host, tenant_uid, domain_uid)
+        if key not in _caches:
+            _caches[key] = CdFmcObjectCache(rest_client, tenant_uid,
+                                            domain_uid, ttl_seconds)
+        # The token may have been re-minted since the cache was created
+        _caches[key].rest_client = rest_client
+        return _caches[key]
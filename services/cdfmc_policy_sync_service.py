@@ -0,0 +1,242 @@
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import yaml
+
+from factories.cdfmc_rest_client_factory import CdFmcRestClient
+from models.fmc import CdFmcAccessPolicy, CdFmcAccessRule, url_category, \
+    url_category_with_reputation, network_object
+from services import cdfmc_access_rule_service, cdfmc_object_cache_service
+from services.cdfmc_object_cache_service import CdFmcObjectCache
+
+# Object types searched, in order, for a source network referenced by name only
+NETWORK_OBJECT_TYPES = [cdfmc_object_cache_service.NETWORKS,
+                        cdfmc_object_cache_service.HOSTS,
+                        cdfmc_object_cache_service.NETWORK_GROUPS]
+
+
+@dataclass
+class PolicyDefinition:
+    policy: CdFmcAccessPolicy
+    rules: List[CdFmcAccessRule]
+
+
+@dataclass
+class PolicySyncPlan:
+    policy_name: str
+    access_policy_uid: Optional[str] = None
+    # Set when planning rather than derived from access_policy_uid, which is
+    # filled in once the policy has been created
+    create_policy: bool = False
+    update_default_action: bool = False
+    rules_to_create: List[CdFmcAccessRule] = field(default_factory=list)
+    rules_to_update: List[CdFmcAccessRule] = field(default_factory=list)
+    rule_ids_to_delete: List[str] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.create_policy or self.update_default_action or
+                    self.rules_to_create or self.rules_to_update or
+                    self.rule_ids_to_delete)
+
+    def summary(self) -> str:
+        if self.is_empty:
+            return "up to date"
+        changes = []
+        if self.create_policy:
+            changes.append("create policy")
+        if self.update_default_action:
+            changes.append("update default action")
+        for count, action in [(len(self.rules_to_create), "create"),
+                              (len(self.rules_to_update), "update"),
+                              (len(self.rule_ids_to_delete), "delete")]:
+            if count:
+                changes.append(f"{action} {count} rule(s)")
+        return ", ".join(changes)
+
+
+def load_policy_definition(definition_file: str) -> PolicyDefinition:
+    """Loads a YAML or JSON policy definition. It uses the same shape as the
+    FMC API (name, defaultAction and a list of rules), except that referenced
+    objects may be given by name only and are resolved per domain."""
+    with open(definition_file) as f:
+        if Path(definition_file).suffix in [".yaml", ".yml"]:
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    return PolicyDefinition(
+        policy=CdFmcAccessPolicy.from_dict(data),
+        rules=[CdFmcAccessRule.from_dict(rule) for rule in
+               data.get("rules", [])])
+
+
+def _resolve_object_references(rules: List[CdFmcAccessRule],
+                               object_cache: CdFmcObjectCache) -> None:
+    for rule in rules:
+        if rule.urls:
+            resolved = []
+            for ucr in rule.urls.url_categories_with_reputation:
+                if ucr.category.id is None:
+                    category_id = object_cache.get_id(
+                        cdfmc_object_cache_service.URL_CATEGORIES,
+                        ucr.category.name)
+                    if category_id is None:
+                        raise ValueError(
+                            f"Rule '{rule.name}': unknown URL category "
+                            f"'{ucr.category.name}'")
+                    ucr = url_category_with_reputation(
+                        ucr.reputation,
+                        url_category(ucr.category.name, category_id))
+                resolved.append(ucr)
+            rule.urls.url_categories_with_reputation = resolved
+        if rule.source_networks:
+            resolved = []
+            for network in rule.source_networks.objects:
+                if network.id is None:
+                    matches = [object_cache.get(object_type, network.name) for
+                               object_type in NETWORK_OBJECT_TYPES]
+                    match = next((m for m in matches if m), None)
+                    if match is None:
+                        raise ValueError(f"Rule '{rule.name}': unknown network "
+                                         f"object '{network.name}'")
+                    network = network_object(network.type or match["type"],
+                                             network.overridable, match["id"],
+                                             network.name)
+                resolved.append(network)
+            rule.source_networks.objects = resolved
+
+
+def _comparable(rule: dict) -> tuple:
+    # Only the fields the models describe are compared, and referenced
+    # objects are compared by id regardless of order
+    url_categories = sorted(
+        (ucr["category"]["id"], ucr.get("reputation")) for ucr in
+        rule.get("urls", {}).get("urlCategoriesWithReputation", []))
+    source_networks = sorted(
+        obj["id"] for obj in rule.get("sourceNetworks", {}).get("objects", []))
+    return (rule.get("action"), rule.get("enabled", False), url_categories,
+            source_networks)
+
+
+def _find_access_policy(rest_client: CdFmcRestClient, domain_uid: str,
+                        name: str) -> Optional[dict]:
+    url = rest_client.fmc_config_url(domain_uid, "policy/accesspolicies")
+    offset = 0
+    count = None
+    fetched = 0
+
+    while count is None or fetched < count:
+        page = rest_client.get(url, params={
+            "name": name, "expanded": "true",
+            "limit": cdfmc_object_cache_service.PAGE_LIMIT,
+            "offset": offset})
+        policies = page.get("items", [])
+        if not policies:
+            break
+        policy = next((policy for policy in policies if
+                       policy["name"] == name), None)
+        if policy is not None:
+            return policy
+        fetched += len(policies)
+        offset += cdfmc_object_cache_service.PAGE_LIMIT
+        count = page["paging"]["count"]
+
+    return None
+
+
+def plan_policy_sync(rest_client: CdFmcRestClient, tenant_uid: str,
+                     domain_uid: str,
+                     definition: PolicyDefinition) -> PolicySyncPlan:
+    desired_rules = [CdFmcAccessRule.from_dict(rule.to_dict()) for rule in
+                     definition.rules]
+    _resolve_object_references(desired_rules,
+                               cdfmc_object_cache_service.get_object_cache(
+                                   rest_client, tenant_uid, domain_uid))
+
+    plan = PolicySyncPlan(policy_name=definition.policy.name)
+    existing_policy = _find_access_policy(rest_client, domain_uid,
+                                          definition.policy.name)
+    if existing_policy is None:
+        plan.create_policy = True
+        plan.rules_to_create = desired_rules
+        return plan
+
+    plan.access_policy_uid = existing_policy["id"]
+    plan.update_default_action = \
+        existing_policy.get("defaultAction", {}).get("action") != \
+        definition.policy.default_action
+
+    desired_names = {rule.name for rule in desired_rules}
+    existing_rules = []
+    for rule in cdfmc_access_rule_service.get_access_rules(
+        rest_client, domain_uid, plan.access_policy_uid):
+        if rule["name"] in desired_names:
+            existing_rules.append(rule)
+        else:
+            plan.rule_ids_to_delete.append(rule["id"])
+
+    # Rules are evaluated in order, so rules are updated in place only while
+    # the existing order matches the definition. From the first mismatch on,
+    # the remaining rules are deleted and recreated in the desired order.
+    in_order = 0
+    while in_order < min(len(existing_rules), len(desired_rules)) and \
+        existing_rules[in_order]["name"] == desired_rules[in_order].name:
+        existing_rule = existing_rules[in_order]
+        desired_rule = desired_rules[in_order]
+        if _comparable(existing_rule) != _comparable(desired_rule.to_dict()):
+            desired_rule.id = existing_rule["id"]
+            plan.rules_to_update.append(desired_rule)
+        in_order += 1
+
+    plan.rule_ids_to_delete.extend(rule["id"] for rule in
+                                   existing_rules[in_order:])
+    plan.rules_to_create = desired_rules[in_order:]
+    return plan
+
+
+def apply_policy_sync(rest_client: CdFmcRestClient, domain_uid: str,
+                      definition: PolicyDefinition,
+                      plan: PolicySyncPlan) -> Tuple[str, List[
+    cdfmc_access_rule_service.AccessRuleResult]]:
+    """Applies the plan and returns the access policy id and the result of
+    every rule that was created or updated."""
+    policies_url = rest_client.fmc_config_url(domain_uid,
+                                              "policy/accesspolicies")
+    if plan.create_policy:
+        plan.access_policy_uid = rest_client.post(
+            policies_url, json=definition.policy.to_dict())["id"]
+    elif plan.update_default_action:
+        policy = rest_client.get(f"{policies_url}/{plan.access_policy_uid}")
+        policy["defaultAction"]["action"] = \
+            definition.policy.default_action
+        rest_client.put(f"{policies_url}/{plan.access_policy_uid}", json={
+            "id": policy["id"], "type": policy["type"],
+            "name": policy["name"], "defaultAction": policy["defaultAction"]})
+
+    if plan.rule_ids_to_delete:
+        cdfmc_access_rule_service.delete_access_rules(
+            rest_client, domain_uid, plan.access_policy_uid,
+            plan.rule_ids_to_delete)
+    results = []
+    if plan.rules_to_update:
+        results.extend(cdfmc_access_rule_service.update_access_rules(
+            rest_client, domain_uid, plan.access_policy_uid,
+            plan.rules_to_update))
+    if plan.rules_to_create:
+        results.extend(cdfmc_access_rule_service.create_access_rules(
+            rest_client, domain_uid, plan.access_policy_uid,
+            plan.rules_to_create))
+    return plan.access_policy_uid, results
+
+
+def sync_access_policy(rest_client: CdFmcRestClient, tenant_uid: str,
+                       domain_uid: str, definition: PolicyDefinition,
+                       dry_run: bool = False) -> Tuple[PolicySyncPlan, List[
+    cdfmc_access_rule_service.AccessRuleResult]]:
+    plan = plan_policy_sync(rest_client, tenant_uid, domain_uid, definition)
+    if dry_run or plan.is_empty:
+        return plan, []
+    _, results = apply_policy_sync(rest_client, domain_uid, definition, plan)
+    return plan, results
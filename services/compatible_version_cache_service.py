@@ -0,0 +1,150 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+from scc_firewall_manager_sdk import MSPDeviceUpgradesApi, \
+    MspCalculateCompatibleUpgradeVersionsInput
+
+from factories import api_client_factory
+from services import transaction_service
+
+CACHE_FILE = Path(os.getenv("SCCFM_CACHE_DIR", Path.home() / ".cache" / "sccfm")) \
+             / "compatible_upgrade_versions.json"
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+@dataclass
+class CompatibleVersion:
+    software_version: str
+    is_suggested_version: bool
+
+
+def get_cohort(device) -> Tuple[str, str]:
+    return device.hardware_model or "unknown", device.software_version or "unknown"
+
+
+def _cohort_key(cohort: Tuple[str, str]) -> str:
+    # Regions release versions separately, so the same cohort can have other
+    # compatible versions in another region
+    return f"{api_client_factory.base_url}|{cohort[0]}|{cohort[1]}"
+
+
+def _load_cache() -> Dict[str, dict]:
+    if not CACHE_FILE.exists():
+        return {}
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache: Dict[str, dict]) -> None:
+    CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = CACHE_FILE.with_suffix(".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(cache, f)
+    tmp_file.replace(CACHE_FILE)
+
+
+def _calculate_compatible_versions(device_uid: str) -> List[CompatibleVersion]:
+    with api_client_factory.build_api_client() as api_client:
+        device_upgrades_api = MSPDeviceUpgradesApi(api_client)
+        transaction = device_upgrades_api.calculate_msp_ftd_compatible_upgrade_versions(
+            MspCalculateCompatibleUpgradeVersionsInput(deviceUids=[device_uid]))
+        transaction = transaction_service.poll_until_transaction_finished(
+            transaction, api_client)
+        compatible_versions = device_upgrades_api.get_msp_ftd_compatible_upgrade_versions(
+            transaction.entity_uid).compatible_versions
+        return [CompatibleVersion(software_version=v.software_version,
+                                  is_suggested_version=v.is_suggested_version)
+                for v in compatible_versions]
+
+
+def get_compatible_versions_by_cohort(devices: List,
+                                      ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                                      refresh: bool = False,
+                                      max_workers: int = 8) -> Dict[
+    Tuple[str, str], List[CompatibleVersion]]:
+    # Refreshing only recalculates this run's cohorts; the other cached
+    # cohorts are kept
+    cache = _load_cache()
+    now = time.time()
+
+    # Devices with the same model and software version always have the same
+    # compatible versions, so one representative device per cohort is enough
+    representatives: Dict[Tuple[str, str], str] = {}
+    for device in devices:
+        representatives.setdefault(get_cohort(device), device.uid)
+
+    versions_by_cohort: Dict[Tuple[str, str], List[CompatibleVersion]] = {}
+    uncached_cohorts = []
+    for cohort in representatives:
+        entry = cache.get(_cohort_key(cohort))
+        if entry and not refresh and now - entry["cached_at"] < ttl_seconds:
+            versions_by_cohort[cohort] = [CompatibleVersion(**v) for v in
+                                          entry["versions"]]
+        else:
+            uncached_cohorts.append(cohort)
+
+    if uncached_cohorts:
+        print(f"Calculating compatible upgrade versions for "
+              f"{len(uncached_cohorts)} of {len(representatives)} cohort(s)...")
+        error: Optional[Exception] = None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {cohort: executor.submit(_calculate_compatible_versions,
+                                               representatives[cohort])
+                       for cohort in uncached_cohorts}
+            for cohort, future in futures.items():
+                try:
+                    versions = future.result()
+                except Exception as e:
+                    print(f"Failed to calculate compatible upgrade versions "
+                          f"for {cohort[0]} on {cohort[1]}: {e}")
+                    error = error or e
+                    continue
+                versions_by_cohort[cohort] = versions
+                cache[_cohort_key(cohort)] = {
+                    "cached_at": now,
+                    "versions": [asdict(v) for v in versions],
+                }
+        # Keep the cohorts that were calculated, so a retry only repeats the
+        # failed ones
+        _save_cache(cache)
+        if error is not None:
+            # Leaving a cohort out would widen the versions common to all
+            raise error
+
+    return versions_by_cohort
+
+
+def intersect_compatible_versions(
+    versions_by_cohort: Dict[Tuple[str, str], List[CompatibleVersion]]) -> List[
+    CompatibleVersion]:
+    # A single upgrade run targets one version, so it must suit every cohort
+    common_versions: Dict[str, CompatibleVersion] = {}
+    for index, versions in enumerate(versions_by_cohort.values()):
+        cohort_versions = {v.software_version: v for v in versions}
+        if index == 0:
+            common_versions = cohort_versions
+            continue
+        common_versions = {
+            software_version: CompatibleVersion(
+                software_version=software_version,
+                is_suggested_version=version.is_suggested_version and
+                                     cohort_versions[software_version].is_suggested_version)
+            for software_version, version in common_versions.items()
+            if software_version in cohort_versions
+        }
+    return list(common_versions.values())
+
+
+def get_compatible_versions(devices: List,
+                            ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                            refresh: bool = False) -> List[CompatibleVersion]:
+    return intersect_compatible_versions(get_compatible_versions_by_cohort(
+        devices, ttl_seconds=ttl_seconds, refresh=refresh))
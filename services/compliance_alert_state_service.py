@@ -0,0 +1,70 @@
+import json
+import os
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+from scc_firewall_manager_sdk import MspLicenseDto
+
+DEFAULT_STATE_FILE = Path(
+    os.getenv("SCCFM_CACHE_DIR", Path.home() / ".cache" / "sccfm")) \
+                     / "compliance_alert_state.json"
+
+
+@dataclass
+class AlertedLicense:
+    name: str
+    virtual_account_uid: str
+    num_in_use: int
+    num_purchased: int
+
+
+def _alert_key(license: MspLicenseDto) -> str:
+    return f"{license.virtual_account_uid}|{license.uid or license.name}"
+
+
+def load_alert_state(state_file: Path = DEFAULT_STATE_FILE) -> Dict[
+    str, AlertedLicense]:
+    if not state_file.exists():
+        return {}
+    try:
+        with open(state_file) as f:
+            return {key: AlertedLicense(**value) for key, value in
+                    json.load(f).items()}
+    except (OSError, ValueError, TypeError):
+        return {}
+
+
+def save_alert_state(out_of_compliance_licenses: List[MspLicenseDto],
+                     state_file: Path = DEFAULT_STATE_FILE) -> None:
+    state = {
+        _alert_key(license): asdict(AlertedLicense(
+            name=license.name,
+            virtual_account_uid=license.virtual_account_uid,
+            num_in_use=license.num_in_use,
+            num_purchased=license.num_purchased))
+        for license in out_of_compliance_licenses
+    }
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = state_file.with_suffix(".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(state, f)
+    tmp_file.replace(state_file)
+
+
+def diff_alert_state(previous_state: Dict[str, AlertedLicense],
+                     out_of_compliance_licenses: List[MspLicenseDto]) -> Tuple[
+    List[MspLicenseDto], List[AlertedLicense]]:
+    """Returns the licenses that are newly out of compliance or whose usage
+    changed since the last alert, and the previously alerted licenses that
+    are back in compliance."""
+    new_or_changed = [
+        license for license in out_of_compliance_licenses
+        if _alert_key(license) not in previous_state or
+           previous_state[_alert_key(license)].num_in_use != license.num_in_use
+    ]
+    current_keys = {_alert_key(license) for license in
+                    out_of_compliance_licenses}
+    resolved = [alerted for key, alerted in previous_state.items() if
+                key not in current_keys]
+    return new_or_changed, resolved
@@ -2,9 +2,11 @@ from dataclasses import dataclass
 from time import sleep
 from typing import Optional
 
-import requests
 from rich.console import Console
 
+from factories.cdfmc_rest_client_factory import get_cdfmc_rest_client
+from services import profiling_service
+
 
 TERMINAL_STATUSES = ["SUCCEEDED", "SUCCESS", "COMPLETED", "Deployed", "FAILED"]
 
@@ -17,7 +19,7 @@ class FmcTask:
     status: str
 
 
-def _parse_task_response(response_json: dict) -> FmcTask:
+def parse_task_response(response_json: dict) -> FmcTask:
     return FmcTask(
         id=response_json.get("id"),
         task_type=response_json.get("taskType"),
@@ -28,17 +30,12 @@ def _parse_task_response(response_json: dict) -> FmcTask:
 
 def get_task(host: str, domain_uid: str, task_id: str,
              api_token: str) -> FmcTask:
-    url = f"{host}/v1/cdfmc/api/fmc_config/v1/domain/{domain_uid}/job/taskstatuses/{task_id}"
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "Content-Type": "application/json",
-    }
-
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return _parse_task_response(response.json())
+    rest_client = get_cdfmc_rest_client(host, api_token)
+    return parse_task_response(rest_client.get(
+        rest_client.fmc_config_url(domain_uid, f"job/taskstatuses/{task_id}")))
 
 
+@profiling_service.traced("wait")
 def wait_for_task_completion(host: str, domain_uid: str, task_id: str,
                              api_token: str,
                              poll_interval_seconds: int = 5) -> FmcTask:
@@ -1,6 +1,8 @@
+from typing import Optional
+
 from scc_firewall_manager_sdk import MSPUserManagementApi, \
     MspAddUsersToTenantInput, UserInput, UserRole, CdoTransaction, User, \
-    MSPTenantManagementApi, MspManagedTenantDto
+    MSPTenantManagementApi, MspManagedTenantDto, ApiClient
 
 from factories import api_client_factory
 from services import transaction_service
@@ -8,53 +10,65 @@ from services import transaction_service
 username = 'msp-automation-test-user'
 
 
-def _get_user(msp_managed_tenant: MspManagedTenantDto) -> User | None:
-    with api_client_factory.build_api_client() as api_client:
-        msp_user_mgmt_api = MSPUserManagementApi(api_client=api_client)
-        user_page = msp_user_mgmt_api.get_api_only_users_in_msp_managed_tenant(
-            tenant_uid=msp_managed_tenant.uid, limit='1', offset='0',
-            q=f"name:{username}@{msp_managed_tenant.name}")
-        if user_page.count == 1:
-            return user_page.items[0]
-        return None
-
-
-def _does_user_exist(managed_tenant_uid: str) -> bool:
-    return _get_user(managed_tenant_uid) is not None
+def _get_user(msp_managed_tenant: MspManagedTenantDto,
+              api_client: ApiClient) -> Optional[User]:
+    msp_user_mgmt_api = MSPUserManagementApi(api_client=api_client)
+    user_page = msp_user_mgmt_api.get_api_only_users_in_msp_managed_tenant(
+        tenant_uid=msp_managed_tenant.uid, limit='1', offset='0',
+        q=f"name:{username}@{msp_managed_tenant.name}")
+    if user_page.count == 1:
+        return user_page.items[0]
+    return None
 
 
 def _create_user_in_tenant(
-    msp_managed_tenant: MspManagedTenantDto
+    msp_managed_tenant: MspManagedTenantDto, api_client: ApiClient,
+    show_progress: bool = True
 ) -> User:
-    with api_client_factory.build_api_client() as api_client:
-        if not _does_user_exist(msp_managed_tenant):
-            msp_user_mgmt_api = MSPUserManagementApi(api_client=api_client)
-            transaction = msp_user_mgmt_api.add_users_to_tenant_in_msp_portal(
-                tenant_uid=msp_managed_tenant.uid,
-                msp_add_users_to_tenant_input=MspAddUsersToTenantInput(
-                    users=[
-                        UserInput(
-                            apiOnlyUser=True,
-                            role=UserRole.ROLE_ADMIN,
-                            username=username,
-                        )
-                    ]
-                ))
-            print(f"Creating user {username}...")
-            updated_transaction: CdoTransaction = transaction_service.wait_for_transaction_to_finish(
-                transaction)
-            if updated_transaction.cdo_transaction_status != "DONE":
-                raise Exception(
-                    f"Transaction failed with status {updated_transaction.cdo_transaction_status}")
-        return _get_user(msp_managed_tenant)
+    user = _get_user(msp_managed_tenant, api_client)
+    if user is not None:
+        return user
+
+    msp_user_mgmt_api = MSPUserManagementApi(api_client=api_client)
+    transaction = msp_user_mgmt_api.add_users_to_tenant_in_msp_portal(
+        tenant_uid=msp_managed_tenant.uid,
+        msp_add_users_to_tenant_input=MspAddUsersToTenantInput(
+            users=[
+                UserInput(
+                    apiOnlyUser=True,
+                    role=UserRole.ROLE_ADMIN,
+                    username=username,
+                )
+            ]
+        ))
+    if show_progress:
+        print(f"Creating user {username}...")
+        updated_transaction: CdoTransaction = transaction_service.wait_for_transaction_to_finish_with_api_client(
+            transaction, api_client)
+    else:
+        updated_transaction = transaction_service.poll_until_transaction_finished(
+            transaction, api_client)
+    if updated_transaction.cdo_transaction_status != "DONE":
+        raise Exception(
+            f"Transaction failed with status {updated_transaction.cdo_transaction_status}")
+    return _get_user(msp_managed_tenant, api_client)
 
 
 def get_token_for_managed_tenant(
-    msp_managed_tenant: MspManagedTenantDto) -> str:
-    user = _create_user_in_tenant(msp_managed_tenant)
-    with api_client_factory.build_api_client() as api_client:
-        tenant_mgmt_api = MSPTenantManagementApi(api_client=api_client)
-        api_token_info = tenant_mgmt_api.generate_api_token_for_user_in_tenant(
-            tenant_uid=msp_managed_tenant.uid, api_user_uid=user.uid)
+    msp_managed_tenant: MspManagedTenantDto,
+    api_client: Optional[ApiClient] = None,
+    show_progress: bool = True) -> str:
+    """Pass an existing MSP api_client to reuse its connection pool, and
+    show_progress=False when calling from several threads at once."""
+    if api_client is None:
+        with api_client_factory.build_api_client() as api_client:
+            return get_token_for_managed_tenant(msp_managed_tenant, api_client,
+                                                show_progress)
+
+    user = _create_user_in_tenant(msp_managed_tenant, api_client,
+                                  show_progress)
+    tenant_mgmt_api = MSPTenantManagementApi(api_client=api_client)
+    api_token_info = tenant_mgmt_api.generate_api_token_for_user_in_tenant(
+        tenant_uid=msp_managed_tenant.uid, api_user_uid=user.uid)
 
     return api_token_info.api_token
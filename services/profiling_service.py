@@ -0,0 +1,333 @@
+import argparse
+import atexit
+import functools
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from scc_firewall_manager_sdk import ApiClient
+
+from models import serialization
+
+# Set to an output path prefix, a directory ending in / or 1 for the working
+# directory, to profile a script without passing --profile
+PROFILE_ENV = "SCCFM_PROFILE"
+# Spans beyond this are counted in the histogram but left out of the trace, so
+# long-running collectors do not grow without bound
+MAX_TRACE_EVENTS = 1_000_000
+# Upper bounds of the latency histogram buckets in milliseconds; slower calls
+# fall in a last, unbounded bucket
+LATENCY_BUCKETS_MS = [25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Path segments that identify an object rather than an endpoint: UUIDs, and
+# numeric or long hexadecimal cdFMC object ids
+_ID_SEGMENT = re.compile(
+    r"^([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-"
+    r"[0-9a-fA-F]{12}|[0-9]+|[0-9a-fA-F]{16,})$")
+
+
+class _EndpointLatency:
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        milliseconds = seconds * 1000
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if milliseconds <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def to_dict(self) -> dict:
+        return {"count": self.count,
+                "mean_ms": round(self.total_seconds / self.count * 1000, 3),
+                "max_ms": round(self.max_seconds * 1000, 3),
+                "buckets": {f"le_{bound}ms": count for bound, count in
+                            zip(LATENCY_BUCKETS_MS, self.buckets)} |
+                           {"inf": self.buckets[-1]}}
+
+
+class _Recorder:
+    """Spans in Chrome trace event format, per-category totals and latency
+    histograms per endpoint. Spans are recorded from any thread."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._events: List[dict] = []
+        self._dropped = 0
+        self._threads: Dict[int, int] = {}
+        self._categories: Dict[str, List[float]] = {}
+        self._endpoints: Dict[str, _EndpointLatency] = {}
+
+    def record(self, name: str, category: str, start: float, end: float,
+               endpoint: Optional[str] = None,
+               args: Optional[dict] = None) -> None:
+        thread_id = threading.get_ident()
+        with self._lock:
+            tid = self._threads.setdefault(thread_id, len(self._threads) + 1)
+            totals = self._categories.setdefault(category, [0, 0.0])
+            totals[0] += 1
+            totals[1] += end - start
+            if endpoint is not None:
+                self._endpoints.setdefault(endpoint,
+                                           _EndpointLatency()).add(end - start)
+            if len(self._events) >= MAX_TRACE_EVENTS:
+                self._dropped += 1
+                return
+            event = {"name": name, "cat": category, "ph": "X",
+                     "ts": round((start - self._origin) * 1e6, 1),
+                     "dur": round((end - start) * 1e6, 1),
+                     "pid": os.getpid(), "tid": tid}
+            if args:
+                event["args"] = args
+            self._events.append(event)
+
+    def export(self) -> None:
+        with self._lock:
+            names = {thread.ident: thread.name for thread in
+                     threading.enumerate()}
+            metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(),
+                         "tid": tid,
+                         "args": {"name": names.get(thread_id,
+                                                    f"thread-{tid}")}}
+                        for thread_id, tid in self._threads.items()]
+            trace = {"traceEvents": metadata + self._events,
+                     "displayTimeUnit": "ms",
+                     "otherData": {"droppedEvents": self._dropped}}
+            latencies = {endpoint: latency.to_dict() for endpoint, latency in
+                         sorted(self._endpoints.items())}
+            categories = dict(self._categories)
+
+        trace_file = Path(f"{self.prefix}.trace.json")
+        latency_file = Path(f"{self.prefix}.latency.json")
+        try:
+            trace_file.parent.mkdir(parents=True, exist_ok=True)
+            trace_file.write_bytes(serialization.dumps(trace))
+            latency_file.write_bytes(serialization.dumps(latencies))
+        except OSError as e:
+            print(f"Failed to write profile to {self.prefix}: {e}",
+                  file=sys.stderr)
+            return
+        # stderr, as collect_metrics.py writes line protocol to stdout
+        print(_format_report(categories, latencies, time.perf_counter() -
+                             self._origin), file=sys.stderr)
+        print(f"Trace written to {trace_file} (open it in "
+              f"https://ui.perfetto.dev or chrome://tracing), latency "
+              f"histograms to {latency_file}", file=sys.stderr)
+
+
+def _format_report(categories: Dict[str, List[float]],
+                   latencies: Dict[str, dict], elapsed_seconds: float) -> str:
+    lines = [f"Profile of {elapsed_seconds:.1f}s, time spent per span category "
+             f"(spans nest and run on several threads, so they can add up to "
+             f"more):"]
+    for category, (count, seconds) in sorted(
+        categories.items(), key=lambda item: -item[1][1]):
+        lines.append(f"  {category:<10} {count:>8} spans {seconds:>10.2f}s")
+    if latencies:
+        headers = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + ["more"]
+        width = max(len(endpoint) for endpoint in latencies)
+        lines.append("Latency per endpoint (ms), calls per bucket:")
+        lines.append(f"  {'endpoint':<{width}} {'calls':>7} {'mean':>8} "
+                     f"{'max':>8} " + " ".join(f"{h:>7}" for h in headers))
+        for endpoint, latency in latencies.items():
+            lines.append(
+                f"  {endpoint:<{width}} {latency['count']:>7} "
+                f"{latency['mean_ms']:>8.1f} {latency['max_ms']:>8.1f} " +
+                " ".join(f"{count:>7}" for count in
+                         latency["buckets"].values()))
+    return "\n".join(lines)
+
+
+_recorder: Optional[_Recorder] = None
+# The endpoint template of the SDK request being sent on this thread
+_local = threading.local()
+
+
+@contextmanager
+def span(name: str, category: str, endpoint: Optional[str] = None,
+         **args):
+    """Records the enclosed block as a span when profiling is enabled. Spans
+    with an endpoint are also counted in that endpoint's latency
+    histogram."""
+    if _recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _recorder.record(name, category, start, time.perf_counter(), endpoint,
+                         args)
+
+
+def traced(category: str) -> Callable:
+    """Decorator recording each call of the function as a span."""
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with span(func.__name__, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def normalize_url(method: str, url: str) -> str:
+    """Method and path of a request with object ids replaced by {id}, so
+    requests for different objects count towards one endpoint."""
+    path = "/".join("{id}" if _ID_SEGMENT.match(segment) else segment
+                    for segment in urlsplit(url).path.split("/"))
+    return f"{method.upper()} {path}"
+
+
+def _instrument_api_client() -> None:
+    param_serialize = ApiClient.param_serialize
+    call_api = ApiClient.call_api
+
+    @functools.wraps(param_serialize)
+    def traced_param_serialize(self, method, resource_path, *args, **kwargs):
+        # Generated API methods serialize and then send each request on the
+        # same thread, so the path template is picked up by call_api below
+        _local.endpoint = f"{method} {resource_path}"
+        return param_serialize(self, method, resource_path, *args, **kwargs)
+
+    @functools.wraps(call_api)
+    def traced_call_api(self, method, url, *args, **kwargs):
+        endpoint = getattr(_local, "endpoint", None) or \
+                   normalize_url(method, url)
+        _local.endpoint = None
+        with span(endpoint, "api", endpoint):
+            response = call_api(self, method, url, *args, **kwargs)
+            # Bodies are streamed, so read it here to time the download too.
+            # RESTResponse caches it for the generated code's own read()
+            response.read()
+        return response
+
+    ApiClient.param_serialize = traced_param_serialize
+    ApiClient.call_api = traced_call_api
+
+
+def _instrument_cdfmc_rest_client() -> None:
+    from factories.cdfmc_rest_client_factory import CdFmcRestClient
+    request = CdFmcRestClient.request
+
+    @functools.wraps(request)
+    def traced_request(self, method, url, *args, **kwargs):
+        endpoint = normalize_url(method, url)
+        with span(endpoint, "cdfmc", endpoint):
+            return request(self, method, url, *args, **kwargs)
+
+    CdFmcRestClient.request = traced_request
+
+
+def _instrument_pexpect() -> None:
+    import pexpect
+    spawn_init = pexpect.spawn.__init__
+    close = pexpect.spawn.close
+    expect = pexpect.spawn.expect
+
+    @functools.wraps(spawn_init)
+    def traced_init(self, command, *args, **kwargs):
+        self._profile_started = time.perf_counter()
+        spawn_init(self, command, *args, **kwargs)
+
+    @functools.wraps(close)
+    def traced_close(self, *args, **kwargs):
+        try:
+            return close(self, *args, **kwargs)
+        finally:
+            # close is called again when the spawn is garbage collected
+            started = self.__dict__.pop("_profile_started", None)
+            if started is not None and _recorder is not None:
+                _recorder.record(f"session {self.name}", "ssh", started,
+                                 time.perf_counter())
+
+    @functools.wraps(expect)
+    def traced_expect(self, pattern, *args, **kwargs):
+        with span("expect", "ssh", pattern=repr(pattern)[:200]):
+            return expect(self, pattern, *args, **kwargs)
+
+    pexpect.spawn.__init__ = traced_init
+    pexpect.spawn.close = traced_close
+    pexpect.spawn.expect = traced_expect
+
+
+def _default_name() -> str:
+    # The pid tells collector shards writing to one directory apart
+    return f"profile-{Path(sys.argv[0]).stem}-" \
+           f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+
+def enable(prefix: Optional[str] = None) -> None:
+    """Instruments the SDK ApiClient, the raw cdFMC REST client and pexpect
+    sessions, and writes <prefix>.trace.json and <prefix>.latency.json and
+    prints a summary to stderr when the process exits. Waiter loops and
+    rendering are recorded by the span and traced calls in the code."""
+    global _recorder
+    if _recorder is not None:
+        return
+    _recorder = _Recorder(prefix or _default_name())
+    _instrument_api_client()
+    for instrument in (_instrument_cdfmc_rest_client, _instrument_pexpect):
+        try:
+            instrument()
+        except ImportError:
+            # Not installed where this script runs, e.g. pexpect in the
+            # Telegraf container, so there is nothing of it to profile
+            pass
+        except Exception as e:
+            # Profiling must never stop the script it profiles
+            print(f"Profiling: skipped {instrument.__name__}: {e}",
+                  file=sys.stderr)
+    atexit.register(_recorder.export)
+    if threading.current_thread() is threading.main_thread() and \
+        signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        # Exit through atexit, so a long-running collector stopped by Telegraf
+        # still exports its profile
+        signal.signal(signal.SIGTERM,
+                      lambda signum, frame: sys.exit(128 + signum))
+
+
+def add_profile_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile", nargs="?", const="", metavar="PREFIX",
+        help="Record API calls, SSH sessions, waits and rendering and write a "
+             "Chrome trace and per-endpoint latency histograms to "
+             "PREFIX.trace.json and PREFIX.latency.json on exit. Defaults to "
+             "profile-<script>-<time>-<pid>, in PREFIX if it ends with /; can "
+             f"also be enabled with {PROFILE_ENV}")
+
+
+def enable_if_requested(profile: Optional[str] = None) -> None:
+    """Enables profiling when --profile was passed, its value being the
+    output prefix, or when SCCFM_PROFILE is set."""
+    if profile is None:
+        profile = os.getenv(PROFILE_ENV) or None
+        if profile is None:
+            return
+    if profile.lower() in ("", "1", "true"):
+        enable()
+    elif profile.endswith("/"):
+        enable(profile + _default_name())
+    else:
+        enable(profile)
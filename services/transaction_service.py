@@ -4,12 +4,15 @@ from rich.console import Console
 from scc_firewall_manager_sdk import TransactionsApi, CdoTransaction, ApiClient
 
 from factories import api_client_factory
+from services import profiling_service
 
 
 def wait_for_transaction_to_finish(transaction: CdoTransaction) -> CdoTransaction:
     with api_client_factory.build_api_client() as api_client:
-        wait_for_transaction_to_finish_with_api_client(transaction, api_client)
+        return wait_for_transaction_to_finish_with_api_client(transaction,
+                                                              api_client)
 
+@profiling_service.traced("wait")
 def wait_for_transaction_to_finish_with_api_client(transaction: CdoTransaction, api_client: ApiClient) -> CdoTransaction:
     console = Console()
     transactions_api = TransactionsApi(api_client)
@@ -29,3 +32,20 @@ def wait_for_transaction_to_finish_with_api_client(transaction: CdoTransaction,
             f"Transaction {transaction.transaction_uid} failed with status {transaction.cdo_transaction_status}")
     console.print(f"[bold green]Transaction completed successfully!")
     return transaction
+
+
+@profiling_service.traced("wait")
+def poll_until_transaction_finished(transaction: CdoTransaction,
+                                    api_client: ApiClient,
+                                    poll_interval_seconds: int = 3) -> CdoTransaction:
+    # No console output, so this can be called from several threads at once
+    transactions_api = TransactionsApi(api_client)
+    while transaction.cdo_transaction_status not in ["DONE", "ERROR",
+                                                     "CANCELLED"]:
+        sleep(poll_interval_seconds)
+        transaction = transactions_api.get_transaction(
+            transaction.transaction_uid)
+    if transaction.cdo_transaction_status != 'DONE':
+        raise Exception(
+            f"Transaction {transaction.transaction_uid} failed with status {transaction.cdo_transaction_status}")
+    return transaction
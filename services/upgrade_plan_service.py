@@ -0,0 +1,90 @@
+import json
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timezone
+from typing import List, Dict, Tuple
+
+from services.compatible_version_cache_service import CompatibleVersion, \
+    get_cohort
+from services.upgrade_wave_service import UpgradeWave
+
+
+@dataclass
+class PlannedDevice:
+    uid: str
+    name: str
+    tenant_uid: str
+    tenant: str
+    hardware_model: str
+    software_version: str
+
+
+@dataclass
+class PlannedCohort:
+    hardware_model: str
+    software_version: str
+    device_uids: List[str]
+    compatible_versions: List[str]
+
+
+@dataclass
+class UpgradePlanSettings:
+    wave_strategy: str = "single"
+    parallel_runs: int = 1
+    max_failed_devices: int = 0
+    prestage: bool = False
+
+
+@dataclass
+class UpgradePlan:
+    target_version: str
+    devices: List[PlannedDevice]
+    cohorts: List[PlannedCohort]
+    waves: List[UpgradeWave]
+    settings: UpgradePlanSettings = field(default_factory=UpgradePlanSettings)
+    created_at: str = field(
+        default_factory=lambda: datetime.now(timezone.utc).isoformat())
+
+
+def build_plan(devices: List,
+               versions_by_cohort: Dict[Tuple[str, str], List[CompatibleVersion]],
+               target_version: str, waves: List[UpgradeWave],
+               settings: UpgradePlanSettings) -> UpgradePlan:
+    device_uids_by_cohort: Dict[Tuple[str, str], List[str]] = {}
+    for device in devices:
+        device_uids_by_cohort.setdefault(get_cohort(device), []).append(
+            device.uid)
+
+    return UpgradePlan(
+        target_version=target_version,
+        devices=[PlannedDevice(
+            uid=device.uid, name=device.name,
+            tenant_uid=device.managed_tenant_uid,
+            tenant=device.managed_tenant_display_name or device.managed_tenant_uid,
+            hardware_model=get_cohort(device)[0],
+            software_version=get_cohort(device)[1]) for device in devices],
+        cohorts=[PlannedCohort(
+            hardware_model=cohort[0], software_version=cohort[1],
+            device_uids=device_uids,
+            compatible_versions=[v.software_version for v in
+                                 versions_by_cohort[cohort]])
+            for cohort, device_uids in device_uids_by_cohort.items()],
+        waves=waves,
+        settings=settings)
+
+
+def save_plan(plan: UpgradePlan, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(asdict(plan), f, indent=2)
+
+
+def load_plan(path: str) -> UpgradePlan:
+    with open(path) as f:
+        plan_dict = json.load(f)
+
+    return UpgradePlan(
+        target_version=plan_dict["target_version"],
+        devices=[PlannedDevice(**d) for d in plan_dict["devices"]],
+        cohorts=[PlannedCohort(**c) for c in plan_dict["cohorts"]],
+        waves=[UpgradeWave(**w) for w in plan_dict["waves"]],
+        settings=UpgradePlanSettings(**plan_dict.get("settings", {})),
+        created_at=plan_dict.get("created_at"))
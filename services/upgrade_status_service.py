@@ -0,0 +1,103 @@
+import json
+import threading
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+
+@dataclass
+class DeviceUpgradeState:
+    uid: str
+    name: str
+    tenant: str
+    status: str
+    message: str
+
+
+@dataclass
+class UpgradeStatusTransition:
+    timestamp: str
+    upgrade_run_uid: str
+    device_uid: Optional[str]
+    device_name: Optional[str]
+    tenant: Optional[str]
+    previous_status: Optional[str]
+    status: str
+    message: str
+
+
+class UpgradeEventLog:
+    """Appends upgrade status transitions to a JSONL file, one event per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, transitions: List[UpgradeStatusTransition]) -> None:
+        if not transitions:
+            return
+        lines = "".join(
+            json.dumps(asdict(transition)) + "\n" for transition in transitions)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+
+class UpgradeRunStatusTracker:
+    """Keeps the last known state of every device in an upgrade run and
+    reports only the devices whose state changed between polls."""
+
+    def __init__(self, upgrade_run_uid: str,
+                 event_log: Optional[UpgradeEventLog] = None):
+        self.upgrade_run_uid = upgrade_run_uid
+        self.event_log = event_log
+        self.run_status: Optional[str] = None
+        self.devices: Dict[str, DeviceUpgradeState] = {}
+        self.recently_changed: List[str] = []
+
+    def update(self, upgrade_run) -> List[UpgradeStatusTransition]:
+        timestamp = datetime.now(timezone.utc).isoformat()
+        transitions: List[UpgradeStatusTransition] = []
+
+        if upgrade_run.upgrade_run_status != self.run_status:
+            transitions.append(UpgradeStatusTransition(
+                timestamp=timestamp, upgrade_run_uid=self.upgrade_run_uid,
+                device_uid=None, device_name=None, tenant=None,
+                previous_status=self.run_status,
+                status=upgrade_run.upgrade_run_status,
+                message=upgrade_run.error_msg or "-"))
+            self.run_status = upgrade_run.upgrade_run_status
+
+        for device in upgrade_run.metadata.devices:
+            message = "-"
+            if device.completion_statuses:
+                message = device.completion_statuses[-1].message or "-"
+            previous = self.devices.get(device.uid)
+            if previous and previous.status == device.upgrade_run_status \
+                and previous.message == message:
+                continue
+
+            self.devices[device.uid] = DeviceUpgradeState(
+                uid=device.uid, name=device.name or "-",
+                tenant=device.managed_tenant_display_name or "-",
+                status=device.upgrade_run_status, message=message)
+            transitions.append(UpgradeStatusTransition(
+                timestamp=timestamp, upgrade_run_uid=self.upgrade_run_uid,
+                device_uid=device.uid, device_name=device.name,
+                tenant=device.managed_tenant_display_name,
+                previous_status=previous.status if previous else None,
+                status=device.upgrade_run_status, message=message))
+
+        changed_uids = [t.device_uid for t in transitions if t.device_uid]
+        if changed_uids:
+            self.recently_changed = changed_uids + [
+                uid for uid in self.recently_changed if uid not in changed_uids]
+
+        if self.event_log:
+            self.event_log.write(transitions)
+        return transitions
+
+    def status_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for device in self.devices.values():
+            counts[device.status] = counts.get(device.status, 0) + 1
+        return counts
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from typing import List, Dict
+
+WAVE_STRATEGIES = ["single", "tenant", "count", "canary"]
+
+
+@dataclass
+class UpgradeWave:
+    name: str
+    device_uids: List[str]
+
+
+def _chunk(items: List[str], size: int) -> List[List[str]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _build_waves_by_tenant(devices: List) -> List[UpgradeWave]:
+    uids_by_tenant: Dict[str, List[str]] = {}
+    tenant_names: Dict[str, str] = {}
+    for device in devices:
+        uids_by_tenant.setdefault(device.managed_tenant_uid, []).append(
+            device.uid)
+        tenant_names[device.managed_tenant_uid] = (
+            device.managed_tenant_display_name or device.managed_tenant_uid)
+    return [UpgradeWave(name=f"Tenant {tenant_names[tenant_uid]}",
+                        device_uids=uids)
+            for tenant_uid, uids in uids_by_tenant.items()]
+
+
+def _build_waves_by_count(device_uids: List[str], wave_size: int) -> List[
+    UpgradeWave]:
+    return [UpgradeWave(name=f"Wave {index + 1}", device_uids=chunk)
+            for index, chunk in enumerate(_chunk(device_uids, wave_size))]
+
+
+def build_waves(devices: List, strategy: str = "single",
+                wave_size: int = 50, canary_size: int = 1) -> List[
+    UpgradeWave]:
+    if wave_size < 1:
+        raise ValueError(f"Wave size must be at least 1, got {wave_size}")
+    if canary_size < 0:
+        raise ValueError(
+            f"Canary size must not be negative, got {canary_size}")
+    device_uids = [device.uid for device in devices]
+    if not device_uids:
+        return []
+
+    if strategy == "single":
+        return [UpgradeWave(name="All devices", device_uids=device_uids)]
+    if strategy == "tenant":
+        return _build_waves_by_tenant(devices)
+    if strategy == "count":
+        return _build_waves_by_count(device_uids, wave_size)
+    if strategy == "canary":
+        remaining = _build_waves_by_count(device_uids[canary_size:], wave_size)
+        if canary_size == 0:
+            # An empty run cannot be submitted, so there is no canary wave
+            return remaining
+        canary = UpgradeWave(name="Canary",
+                             device_uids=device_uids[:canary_size])
+        return [canary] + remaining
+    raise ValueError(
+        f"Unknown wave strategy '{strategy}'. Expected one of {WAVE_STRATEGIES}")
+
+
+def split_wave_into_runs(wave: UpgradeWave, parallel_runs: int) -> List[
+    List[str]]:
+    run_count = max(1, min(parallel_runs, len(wave.device_uids)))
+    run_size = -(-len(wave.device_uids) // run_count)
+    return _chunk(wave.device_uids, run_size)
@@ -1,10 +1,147 @@
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import List, Optional, Callable
 
 from webexpythonsdk import WebexAPI
+from webexpythonsdk.exceptions import RateLimitError
 from webexpythonsdk.models.cards import AdaptiveCard
 
+from services import profiling_service
 
-def send_card(card: AdaptiveCard, fallback_msg: str | None) -> None:
-    webex_api = WebexAPI(access_token=os.getenv('WEBEX_BOT_TOKEN'))
-    for room in webex_api.rooms.list():
-        webex_api.messages.create(roomId=room.id, text=fallback_msg, attachments=[card])
\ No newline at end of file
+ROOM_CACHE_FILE = Path(
+    os.getenv("SCCFM_CACHE_DIR", Path.home() / ".cache" / "sccfm")) \
+                  / "webex_rooms.json"
+ROOM_CACHE_TTL_SECONDS = 15 * 60
+MAX_CONCURRENT_POSTS = 4
+MAX_RATE_LIMIT_RETRIES = 3
+
+_webex_api: Optional[WebexAPI] = None
+_rooms_lock = threading.Lock()
+
+
+@dataclass
+class WebexRoom:
+    id: str
+    title: str
+
+
+def _get_webex_api() -> WebexAPI:
+    global _webex_api
+    if _webex_api is None:
+        # 429s are retried per request below, so one rate-limited post does
+        # not hold up the others
+        _webex_api = WebexAPI(access_token=os.getenv('WEBEX_BOT_TOKEN'),
+                              wait_on_rate_limit=False)
+    return _webex_api
+
+
+def _with_rate_limit_retry(request: Callable):
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        try:
+            with profiling_service.span("request", "webex", "webex",
+                                        attempt=attempt):
+                return request()
+        except RateLimitError as e:
+            if attempt == MAX_RATE_LIMIT_RETRIES:
+                raise
+            with profiling_service.span("Retry-After", "wait"):
+                time.sleep(e.retry_after)
+
+
+def _load_cached_rooms(ttl_seconds: int) -> Optional[List[WebexRoom]]:
+    if not ROOM_CACHE_FILE.exists():
+        return None
+    try:
+        with open(ROOM_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cache["cached_at"] > ttl_seconds:
+        return None
+    return [WebexRoom(**room) for room in cache["rooms"]]
+
+
+def _save_cached_rooms(rooms: List[WebexRoom]) -> None:
+    ROOM_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = ROOM_CACHE_FILE.with_suffix(".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump({"cached_at": time.time(),
+                   "rooms": [asdict(room) for room in rooms]}, f)
+    tmp_file.replace(ROOM_CACHE_FILE)
+
+
+def _get_room_filter() -> Optional[List[str]]:
+    # Comma-separated room IDs or titles; unset means every room the bot is in
+    room_filter = os.getenv('WEBEX_ROOMS')
+    if not room_filter:
+        return None
+    return [room.strip() for room in room_filter.split(",") if room.strip()]
+
+
+def get_rooms(room_filter: Optional[List[str]] = None,
+              ttl_seconds: int = ROOM_CACHE_TTL_SECONDS) -> List[WebexRoom]:
+    with _rooms_lock:
+        rooms = _load_cached_rooms(ttl_seconds)
+        if rooms is None:
+            webex_api = _get_webex_api()
+            rooms = [WebexRoom(id=room.id, title=room.title) for room in
+                     _with_rate_limit_retry(lambda: list(webex_api.rooms.list()))]
+            _save_cached_rooms(rooms)
+
+    room_filter = room_filter or _get_room_filter()
+    if room_filter:
+        rooms = [room for room in rooms if
+                 room.id in room_filter or room.title in room_filter]
+    return rooms
+
+
+def _post_card(room: WebexRoom, card: AdaptiveCard,
+               fallback_msg: str | None) -> bool:
+    webex_api = _get_webex_api()
+    try:
+        _with_rate_limit_retry(lambda: webex_api.messages.create(
+            roomId=room.id, text=fallback_msg, attachments=[card]))
+        return True
+    except Exception as e:
+        print(f"Failed to send card to room '{room.title}': {e}")
+        return False
+
+
+def _post_to_rooms(post: Callable[[WebexRoom], bool],
+                   room_filter: Optional[List[str]]) -> bool:
+    rooms = get_rooms(room_filter)
+    if not rooms:
+        print("No Webex rooms to post to")
+        return False
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_POSTS) as executor:
+        return all(list(executor.map(post, rooms)))
+
+
+def send_card(card: AdaptiveCard, fallback_msg: str | None,
+              room_filter: Optional[List[str]] = None) -> bool:
+    """Posts the card to every room; returns whether all posts succeeded."""
+    return _post_to_rooms(lambda room: _post_card(room, card, fallback_msg),
+                          room_filter)
+
+
+def _post_file(room: WebexRoom, file_path: str, text: str | None) -> bool:
+    webex_api = _get_webex_api()
+    try:
+        _with_rate_limit_retry(lambda: webex_api.messages.create(
+            roomId=room.id, text=text, files=[file_path]))
+        return True
+    except Exception as e:
+        print(f"Failed to send file to room '{room.title}': {e}")
+        return False
+
+
+def send_file(file_path: str, text: str | None,
+              room_filter: Optional[List[str]] = None) -> bool:
+    """Posts the file to every room; returns whether all posts succeeded."""
+    return _post_to_rooms(lambda room: _post_file(room, file_path, text),
+                          room_filter)
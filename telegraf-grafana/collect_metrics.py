@@ -3,18 +3,59 @@
 Collects FMC health metrics from multiple tenants and outputs in InfluxDB line protocol format.
 """
 
+import argparse
+import hashlib
 import json
+import os
 import sys
+import threading
 import time
-from typing import List, Dict, Tuple
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, \
+    wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 
 from dataclasses import dataclass
 from pathlib import Path
 
 from scc_firewall_manager_sdk import ApiClient, Configuration, InventoryApi, \
-    FmcHealthMetrics, DeviceHealthApi, Device, MetricsItem
+    FmcHealthMetrics, DeviceHealthApi, Device, MetricsItem, \
+    MSPTenantManagementApi, MspManagedTenantDto
+from scc_firewall_manager_sdk.exceptions import ApiException
 
 TENANTS_FILE = Path("/etc/telegraf/tenants.json")
+# Overrides the regional API host for every tenant, e.g. to scrape the mock server
+BASE_URL_OVERRIDE = os.getenv("SCCFM_BASE_URL")
+# Tenants are split across SHARD_COUNT collectors and this one scrapes
+# SHARD_INDEX
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+# Tenants whose FTD and ASA health are fetched concurrently
+MAX_WORKERS = int(os.getenv("COLLECTOR_MAX_WORKERS", "8"))
+# Relative time ranges accepted by the cdFMC health endpoint, smallest first
+FMC_TIME_RANGES = [("5m", 300), ("15m", 900), ("30m", 1800), ("1h", 3600)]
+ASA_TIME_RANGE = "10m"
+# Longest gap a delta window is stretched to after missed scrapes
+MAX_WINDOW = timedelta(hours=1)
+# Device names are rewritten at least this often, well within the raw bucket's
+# retention
+NAME_REFRESH_SECONDS = 3600
+# Scheduler mode: the longest a failing tenant is backed off, how often the
+# tenants file is re-read and how often collector_scrape points are written
+MAX_BACKOFF_SECONDS = 900
+TENANTS_RELOAD_SECONDS = 60
+STATS_SECONDS = 60
+# Where tenants come from: "file" reads TENANTS_FILE, "msp" lists the managed
+# tenants of the MSP portal whose token is in SCCFM_API_TOKEN and mints a
+# token for each
+TENANTS_SOURCE = os.getenv("TENANTS_SOURCE", "file")
+# MSP source: how often the managed tenants are listed again, and where the
+# minted tokens are kept across restarts
+MSP_REFRESH_SECONDS = int(os.getenv("MSP_TENANTS_REFRESH_SECONDS", "900"))
+MSP_TOKEN_CACHE = Path(os.getenv(
+    "MSP_TOKEN_CACHE", f"/var/lib/collector/tokens-{SHARD_INDEX}.json"))
 
 
 @dataclass(frozen=True)
@@ -22,6 +63,196 @@ class Tenant:
     name: str
     region: str
     api_token: str
+    # Scheduler mode only: seconds between scrapes, and the order tenants are
+    # scraped in when the collector falls behind, highest first
+    interval: int = 60
+    priority: int = 0
+    # MSP source only: the managed tenant's API host, which region alone does
+    # not always determine
+    base_url: Optional[str] = None
+
+
+# Line protocol escaping, matching Telegraf's influx serializer: measurements
+# escape commas and spaces, tag keys, tag values and field keys also escape
+# equals signs, and control characters that would end the line are escaped
+_MEASUREMENT_ESCAPES = str.maketrans({
+    ",": "\\,", " ": "\\ ", "\n": "\\n", "\r": "\\r", "\t": "\\t",
+    "\f": "\\f"})
+_TAG_ESCAPES = str.maketrans({
+    ",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n", "\r": "\\r",
+    "\t": "\\t", "\f": "\\f"})
+
+
+def escape_measurement(value: str) -> str:
+    return value.translate(_MEASUREMENT_ESCAPES)
+
+
+def escape_tag_value(value: str) -> str:
+    """Escape special characters in InfluxDB tag keys and values."""
+    return value.translate(_TAG_ESCAPES)
+
+
+escape_tag_key = escape_tag_value
+escape_field_key = escape_tag_value
+
+
+def escape_string_field(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class TagPrefixCache:
+    """Pre-escaped "measurement,tag=value,... " prefixes per device. Devices
+    are identified by uid only, so renames do not start new series; names
+    are written to DEVICE_INFO_MEASUREMENT instead. In daemon mode the cache
+    lives across scrapes; retain_seen drops devices that were not seen since
+    the previous call."""
+
+    def __init__(self):
+        self._prefixes: Dict[tuple, str] = {}
+        self._seen: set = set()
+
+    def get(self, measurement: str, tenant_name: str, device_uid: str,
+            extra_tags: Tuple[Tuple[str, str], ...] = ()) -> str:
+        key = (measurement, tenant_name, device_uid, extra_tags)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            # Tags with empty values are invalid line protocol
+            prefix = self._prefixes[key] = (
+                f"{escape_measurement(measurement)},"
+                f"tenant={escape_tag_value(tenant_name)},"
+                f"deviceUid={escape_tag_value(device_uid)}" +
+                "".join(f",{escape_tag_key(tag)}={escape_tag_value(value)}"
+                        for tag, value in extra_tags if value) + " ")
+        self._seen.add(key)
+        return prefix
+
+    def retain_seen(self) -> None:
+        self._prefixes = {key: self._prefixes[key] for key in self._seen}
+        self._seen = set()
+
+    def __len__(self) -> int:
+        return len(self._prefixes)
+
+
+tag_prefixes = TagPrefixCache()
+
+
+class SampleWindows:
+    """End time of the newest sample written per tenant and source, so each
+    scrape only asks for, and only writes, samples that are new. Every device
+    of a tenant reports the same sample times. In one-shot exec mode this
+    starts empty and every scrape uses the default window."""
+
+    def __init__(self):
+        self._latest: Dict[Tuple[str, str], datetime] = {}
+
+    def latest(self, source: str, tenant_name: str) -> Optional[datetime]:
+        return self._latest.get((source, tenant_name))
+
+    def advance(self, source: str, tenant_name: str,
+                timestamp: Optional[datetime]) -> None:
+        key = (source, tenant_name)
+        if timestamp is not None and (key not in self._latest or
+                                      timestamp > self._latest[key]):
+            self._latest[key] = timestamp
+
+    def retain(self, tenant_names) -> None:
+        tenant_names = set(tenant_names)
+        self._latest = {key: latest for key, latest in self._latest.items()
+                        if key[1] in tenant_names}
+
+
+sample_windows = SampleWindows()
+
+
+class DeviceNames:
+    """Writes DEVICE_INFO_MEASUREMENT lines, the name lookup dashboards join
+    on deviceUid. A name is written when a device is first seen, when it
+    changes and at least every NAME_REFRESH_SECONDS, so the lookup never ages
+    out of the raw bucket."""
+
+    def __init__(self):
+        self._written: Dict[str, Dict[str, Tuple[str, float]]] = {}
+
+    def lines(self, tenant_name: str, uid_to_name: Dict[str, str],
+              device_type: str, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        written = self._written.setdefault(tenant_name, {})
+        lines = []
+        for device_uid, device_name in uid_to_name.items():
+            previous = written.get(device_uid)
+            if previous is None or previous[0] != device_name or \
+                now - previous[1] >= NAME_REFRESH_SECONDS:
+                written[device_uid] = (device_name, now)
+                lines.append(
+                    f"{DEVICE_INFO_MEASUREMENT},"
+                    f"tenant={escape_tag_value(tenant_name)},"
+                    f"deviceUid={escape_tag_value(device_uid)} "
+                    f"name=\"{escape_string_field(device_name)}\","
+                    f"type=\"{device_type}\" {int(now * 1_000_000_000)}")
+        return lines
+
+    def retain(self, tenant_names) -> None:
+        self._written = {tenant_name: self._written[tenant_name] for
+                         tenant_name in tenant_names if
+                         tenant_name in self._written}
+
+
+device_names = DeviceNames()
+
+
+def fmc_time_range(latest: Optional[datetime], now: datetime) -> str:
+    """The smallest time range covering everything since the latest sample
+    written, or the smallest one on the first scrape."""
+    if latest is not None:
+        gap = (now - latest).total_seconds()
+        for time_range, seconds in FMC_TIME_RANGES:
+            if seconds >= gap:
+                return time_range
+        return FMC_TIME_RANGES[-1][0]
+    return FMC_TIME_RANGES[0][0]
+
+
+def _field_keys(*names: str) -> Tuple[str, ...]:
+    return tuple(f"{escape_field_key(name)}=" for name in names)
+
+
+FMC_MEASUREMENT = "fmc_health_metrics"
+FMC_INTERFACE_MEASUREMENT = "fmc_interface_metrics"
+FMC_VPN_MEASUREMENT = "fmc_vpn_metrics"
+ASA_MEASUREMENT = "asa_health_metrics"
+DEVICE_INFO_MEASUREMENT = "device_info"
+SCRAPE_MEASUREMENT = "collector_scrape"
+_FMC_HEALTH_FIELDS = _field_keys(
+    "cpu_lina_pct", "cpu_snort_pct", "cpu_system_pct", "memory_lina_pct",
+    "memory_snort_pct", "memory_system_pct", "disk_total_pct")
+_FMC_INTERFACE_FIELDS = _field_keys(
+    "input_bytes_avg", "output_bytes_avg", "input_packet_size_avg",
+    "output_packet_size_avg", "input_errors_avg", "output_errors_avg",
+    "drop_packets_avg", "buffer_overruns_avg", "buffer_underruns_avg",
+    "l2_decode_drops_avg", "link_up", "operational_up")
+_FMC_VPN_FIELDS = _field_keys(
+    "ra_vpn_active_sessions_avg", "ra_vpn_inactive_sessions_avg",
+    "ra_vpn_peak_sessions", "s2s_tunnels_up", "s2s_tunnels_down")
+_ASA_FIELDS = _field_keys("cpu_pct", "memory_pct", "disk_pct")
+
+
+@lru_cache(maxsize=4096)
+def _timestamp_ns(timestamp: datetime) -> int:
+    # Every ASA in a tenant reports the same sample timestamps
+    return int(timestamp.timestamp() * 1_000_000_000)
+
+
+def _usage_fields(field_keys: Tuple[str, ...], values) -> str:
+    if None in values:
+        return ",".join(f"{key}{value}" for key, value in
+                        zip(field_keys, values) if value is not None)
+    return ",".join(map(str.__add__, field_keys, map(str, values)))
+
+
+def _api_host(tenant: Tenant) -> str:
+    return BASE_URL_OVERRIDE or tenant.base_url or \
+        f"https://api.{tenant.region}.security.cisco.com/firewall"
 
 
 def fetch_asa_devices(tenant: Tenant) -> List[Device]:
@@ -32,7 +263,7 @@ def _fetch_asa_devices(tenant: Tenant, offset: int, devices: List[Device]) -> \
     List[Device]:
     with ApiClient(
         Configuration(
-            host=f"https://api.{tenant.region}.security.cisco.com/firewall",
+            host=_api_host(tenant),
             access_token=tenant.api_token
         )
     ) as api_client:
@@ -46,12 +277,24 @@ def _fetch_asa_devices(tenant: Tenant, offset: int, devices: List[Device]) -> \
         return devices
 
 
-def fetch_asa_metrics(tenant: Tenant) -> List[MetricsItem]:
-    """Fetch ASA metrics and return (metrics, uid_to_name mapping)."""
+def _iso(timestamp: datetime) -> str:
+    return timestamp.astimezone(timezone.utc).isoformat(
+        timespec="milliseconds").replace("+00:00", "Z")
+
+
+def fetch_asa_metrics(tenant: Tenant,
+                      since: Optional[datetime] = None) -> List[MetricsItem]:
+    """Fetch ASA metrics since the given time, or over the last
+    ASA_TIME_RANGE when there is none."""
+    if since is None:
+        window = {"time_range": ASA_TIME_RANGE}
+    else:
+        end = datetime.now(timezone.utc)
+        window = {"start": _iso(max(since, end - MAX_WINDOW)), "end": _iso(end)}
     all_metrics: List[MetricsItem] = []
     with ApiClient(
         Configuration(
-            host=f"https://api.{tenant.region}.security.cisco.com/firewall",
+            host=_api_host(tenant),
             access_token=tenant.api_token
         )
     ) as api_client:
@@ -59,9 +302,9 @@ def fetch_asa_metrics(tenant: Tenant) -> List[MetricsItem]:
         total = -1
         offset = 0
         limit = 50
-        while total < 0 or limit + offset < total:
+        while total < 0 or offset < total:
             metrics_response = device_health_api.get_asa_health_metrics(
-                time_range="10m", metrics="cpu,mem,disk",
+                **window, metrics="cpu,mem,disk",
                 limit=str(limit), offset=str(offset))
             all_metrics.extend(metrics_response.items)
             total = metrics_response.total
@@ -70,162 +313,662 @@ def fetch_asa_metrics(tenant: Tenant) -> List[MetricsItem]:
 
 
 def asa_metrics_to_line_protocol(tenant_name: str, metrics_item: MetricsItem,
-    uid_to_name: Dict[str, str]) -> List[str]:
-    """Convert ASA MetricsItem to InfluxDB line protocol format."""
-    lines = []
-    device_uid = metrics_item.uid or "unknown"
-    device_name = uid_to_name.get(device_uid, "unknown")
-
-    tags = f"tenant={escape_tag_value(tenant_name)},deviceName={escape_tag_value(device_name)},deviceUid={escape_tag_value(device_uid)}"
-
+    prefixes: TagPrefixCache = tag_prefixes,
+    since: Optional[datetime] = None) -> List[str]:
+    """Convert ASA MetricsItem to InfluxDB line protocol format, skipping
+    samples that are not newer than since."""
     metrics = metrics_item.metrics
     if not metrics:
-        return lines
-
-    # Collect all timestamps from series data
-    timestamps = set()
-    cpu = metrics.get('cpu')
-    mem = metrics.get('mem')
-    disk = metrics.get('disk')
-
-    if cpu and cpu.series:
-        for s in cpu.series:
-            timestamps.add(s.timestamp)
-    if mem and mem.series:
-        for s in mem.series:
-            timestamps.add(s.timestamp)
-    if disk and disk.series:
-        for s in disk.series:
-            timestamps.add(s.timestamp)
-
-    # Build lookup dicts for each metric type
-    cpu_values = {s.timestamp: s.value for s in cpu.series} if cpu and cpu.series else {}
-    mem_values = {s.timestamp: s.value for s in mem.series} if mem and mem.series else {}
-    disk_values = {s.timestamp: s.value for s in disk.series} if disk and disk.series else {}
+        return []
+    prefix = prefixes.get(ASA_MEASUREMENT, tenant_name,
+                          metrics_item.uid or "unknown")
+
+    # Values per timestamp, in cpu, mem, disk field order
+    values_by_timestamp: Dict[datetime, List] = {}
+    for index, metric in enumerate((metrics.get('cpu'), metrics.get('mem'),
+                                    metrics.get('disk'))):
+        if metric and metric.series:
+            for s in metric.series:
+                values = values_by_timestamp.get(s.timestamp)
+                if values is None:
+                    values = values_by_timestamp[s.timestamp] = [None] * 3
+                values[index] = s.value
 
     # Output a line for each timestamp
-    for ts in sorted(timestamps):
-        fields = []
-        if ts in cpu_values:
-            fields.append(f"cpu_pct={cpu_values[ts]}")
-        if ts in mem_values:
-            fields.append(f"memory_pct={mem_values[ts]}")
-        if ts in disk_values:
-            fields.append(f"disk_pct={disk_values[ts]}")
-        if fields:
-            timestamp_ns = int(ts.timestamp() * 1_000_000_000)
-            lines.append(
-                f"asa_health_metrics,{tags} {','.join(fields)} {timestamp_ns}")
+    return [f"{prefix}{_usage_fields(_ASA_FIELDS, values)} {_timestamp_ns(ts)}"
+            for ts, values in sorted(values_by_timestamp.items())
+            if since is None or ts > since]
 
-    return lines
+
+def latest_asa_timestamp(metrics_items: List[MetricsItem]) -> \
+    Optional[datetime]:
+    return max((s.timestamp for item in metrics_items if item.metrics
+                for metric in item.metrics.values() if metric and metric.series
+                for s in metric.series), default=None)
+
+
+def _fetch_cdfmc_uids(inventory_api: InventoryApi) -> List[str]:
+    uids: List[str] = []
+    while True:
+        manager_page = inventory_api.get_device_managers(
+            q="deviceType:CDFMC", offset=str(len(uids)), limit=str(200))
+        uids.extend(manager.uid for manager in manager_page.items)
+        if not manager_page.items or manager_page.count <= len(uids):
+            return uids
 
 
-def fetch_fmc_metrics(tenant: Tenant) -> List[FmcHealthMetrics]:
-    """Fetch health metrics for a single tenant."""
+def fetch_fmc_metrics(tenant: Tenant,
+                      time_range: str = FMC_TIME_RANGES[0][0]) -> \
+    List[FmcHealthMetrics]:
+    """Fetch per-device health for every FTD managed by the tenant's
+    cdFMCs."""
     with ApiClient(
         Configuration(
-            host=f"https://api.{tenant.region}.security.cisco.com/firewall",
+            host=_api_host(tenant),
             access_token=tenant.api_token
         )
     ) as api_client:
         inventory_api = InventoryApi(api_client)
-        fmc_uid = inventory_api.get_device_managers(limit=str(1),
-                                                    q="deviceType:CDFMC").items[
-            0].uid
-        return inventory_api.get_fmc_health(fmc_uid=fmc_uid, time_range="5m")
-
-
-def escape_tag_value(value: str) -> str:
-    """Escape special characters in InfluxDB tag values."""
-    return value.replace(" ", "\\ ").replace(",", "\\,").replace("=", "\\=")
+        fmc_health_metrics: List[FmcHealthMetrics] = []
+        for fmc_uid in _fetch_cdfmc_uids(inventory_api):
+            fmc_health_metrics.extend(inventory_api.get_fmc_health(
+                fmc_uid=fmc_uid, time_range=time_range))
+        return fmc_health_metrics
+
+
+def _interface_fields(interface) -> str:
+    return _usage_fields(_FMC_INTERFACE_FIELDS, (
+        interface.input_bytes_avg, interface.output_bytes_avg,
+        interface.input_packet_size_avg, interface.output_packet_size_avg,
+        interface.input_errors_avg, interface.output_errors_avg,
+        interface.drop_packets_avg, interface.buffer_overruns_avg,
+        interface.buffer_underruns_avg, interface.l2_decode_drops_avg,
+        None if interface.link_status is None else
+        int(interface.link_status == "UP"),
+        None if interface.operational_status is None else
+        int(interface.operational_status == "UP")))
 
 
 def fmc_metrics_to_line_protocol(tenant_name: str,
-    device_health_metric: FmcHealthMetrics) -> List[str]:
-    """Convert FmcHealthMetrics to InfluxDB line protocol format."""
+    device_health_metric: FmcHealthMetrics,
+    prefixes: TagPrefixCache = tag_prefixes) -> List[str]:
+    """Convert FmcHealthMetrics to InfluxDB line protocol format, stamped with
+    the end of the period the API averaged over."""
     lines = []
-    timestamp = int(time.time() * 1_000_000_000)
-
+    end_time = device_health_metric.end_time
+    suffix = f" {_timestamp_ns(end_time)}" if end_time else \
+        f" {int(time.time() * 1_000_000_000)}"
     device_uid = device_health_metric.device_uid or "unknown"
-    device_name = device_health_metric.device_name or "unknown"
 
-    tags = f"tenant={escape_tag_value(tenant_name)},deviceName={escape_tag_value(device_name)},deviceUid={escape_tag_value(device_uid)}"
-
-    # CPU metrics
+    # CPU, memory and disk go in one point
     cpu = device_health_metric.cpu_health_metrics
-    if cpu:
-        fields = []
-        if cpu.lina_usage_avg is not None:
-            fields.append(f"cpu_lina_pct={cpu.lina_usage_avg}")
-        if cpu.snort_usage_avg is not None:
-            fields.append(f"cpu_snort_pct={cpu.snort_usage_avg}")
-        if cpu.system_usage_avg is not None:
-            fields.append(f"cpu_system_pct={cpu.system_usage_avg}")
-        if fields:
-            lines.append(
-                f"fmc_health_metrics,{tags} {','.join(fields)} {timestamp}")
-
-    # Memory metrics
     memory = device_health_metric.memory_health_metrics
-    if memory:
-        fields = []
-        if memory.lina_usage_avg is not None:
-            fields.append(f"memory_lina_pct={memory.lina_usage_avg}")
-        if memory.snort_usage_avg is not None:
-            fields.append(f"memory_snort_pct={memory.snort_usage_avg}")
-        if memory.system_usage_avg is not None:
-            fields.append(f"memory_system_pct={memory.system_usage_avg}")
-        if fields:
-            lines.append(
-                f"fmc_health_metrics,{tags} {','.join(fields)} {timestamp}")
-
-    # Disk metrics
     disk = device_health_metric.disk_health_metrics
-    if disk:
-        fields = []
-        if disk.total_disk_usage_avg is not None:
-            fields.append(f"disk_total_pct={disk.total_disk_usage_avg}")
+    fields = _usage_fields(_FMC_HEALTH_FIELDS, (
+        cpu.lina_usage_avg if cpu else None,
+        cpu.snort_usage_avg if cpu else None,
+        cpu.system_usage_avg if cpu else None,
+        memory.lina_usage_avg if memory else None,
+        memory.snort_usage_avg if memory else None,
+        memory.system_usage_avg if memory else None,
+        disk.total_disk_usage_avg if disk else None))
+    if fields:
+        lines.append(prefixes.get(FMC_MEASUREMENT, tenant_name, device_uid) +
+                     fields + suffix)
+
+    # Throughput, errors and drops per interface
+    for interface in device_health_metric.interface_health_metrics or []:
+        fields = _interface_fields(interface)
         if fields:
-            lines.append(
-                f"fmc_health_metrics,{tags} {','.join(fields)} {timestamp}")
+            lines.append(prefixes.get(
+                FMC_INTERFACE_MEASUREMENT, tenant_name, device_uid,
+                (("interface", interface.interface),)) + fields + suffix)
+
+    # The API has no per-device connection count; RA VPN sessions and S2S
+    # tunnel states are the closest it reports
+    ra_vpn = device_health_metric.ra_vpn_session_health_metrics
+    tunnels = device_health_metric.s2s_vpn_tunnel_health_metrics
+    if ra_vpn or tunnels:
+        states = [tunnel.tunnel_state for tunnel in tunnels or []]
+        fields = _usage_fields(_FMC_VPN_FIELDS, (
+            ra_vpn.active_ravpn_sessions_avg if ra_vpn else None,
+            ra_vpn.inactive_ravpn_sessions_avg if ra_vpn else None,
+            ra_vpn.peak_concur_ravpn_sessions if ra_vpn else None,
+            states.count("TUNNEL_UP") if tunnels else None,
+            states.count("TUNNEL_DOWN") if tunnels else None))
+        if fields:
+            lines.append(prefixes.get(FMC_VPN_MEASUREMENT, tenant_name,
+                                      device_uid) + fields + suffix)
 
     return lines
 
 
-def main():
-    if not TENANTS_FILE.exists():
-        print(f"Tenants file not found: {TENANTS_FILE}", file=sys.stderr)
-        sys.exit(1)
-
+def shard_of(tenant_name: str, shard_count: int) -> int:
+    """Rendezvous hashing: a tenant belongs to the shard with the highest
+    hash of (shard, tenant name), so changing the shard count only moves the
+    tenants of the shards that were added or removed."""
+    return max(range(shard_count), key=lambda shard: hashlib.blake2b(
+        f"{shard}:{tenant_name}".encode(), digest_size=8).digest())
+
+
+def _in_shard(tenant_name: str) -> bool:
+    return SHARD_COUNT == 1 or shard_of(tenant_name, SHARD_COUNT) == SHARD_INDEX
+
+
+def _list_managed_tenants(api_client: ApiClient) -> List[MspManagedTenantDto]:
+    limit = 200
+    offset = 0
+    count = None
+    managed_tenants: List[MspManagedTenantDto] = []
+    msp_tenant_api = MSPTenantManagementApi(api_client)
+    while count is None or len(managed_tenants) < count:
+        tenant_page = msp_tenant_api.get_msp_managed_tenants(
+            limit=str(limit), offset=str(offset))
+        managed_tenants.extend(tenant_page.items)
+        offset += limit
+        count = tenant_page.count
+        if not tenant_page.items:
+            break
+    return managed_tenants
+
+
+class MspTenants:
+    """The tenants for TENANTS_SOURCE=msp: the MSP portal's managed tenants
+    in this collector's shard, listed again at most every
+    MSP_REFRESH_SECONDS. Each tenant's token is minted once by
+    msp_managed_tenant_token_service and kept in MSP_TOKEN_CACHE, as minting
+    a new one revokes the previous. A token the API rejects is dropped and
+    minted again at the next refresh, which invalidate brings forward."""
+
+    def __init__(self, cache_file: Path = MSP_TOKEN_CACHE):
+        self._cache_file = cache_file
+        # Tokens by managed tenant uid
+        self._tokens: Optional[Dict[str, str]] = None
+        self._tenants: List[Tenant] = []
+        self._refresh_at = 0.0
+        # invalidate is called from the scraping thread
+        self._lock = threading.Lock()
+        self._rejected: set = set()
+
+    def tenants(self) -> List[Tenant]:
+        with self._lock:
+            if time.monotonic() < self._refresh_at:
+                return self._tenants
+            # Scheduled before refreshing, so a token invalidated while the
+            # refresh runs brings the next one forward again
+            self._refresh_at = time.monotonic() + MSP_REFRESH_SECONDS
+        try:
+            self._tenants = self._refresh()
+        except Exception:
+            with self._lock:
+                self._refresh_at = 0.0
+            raise
+        return self._tenants
+
+    def invalidate(self, tenant: Tenant) -> None:
+        with self._lock:
+            self._rejected.add(tenant.api_token)
+            self._refresh_at = 0.0
+
+    def _refresh(self) -> List[Tenant]:
+        # Imported here so the file source needs neither the repository's
+        # factories and services on the path nor their dependencies
+        from factories import api_client_factory
+        from services import msp_managed_tenant_token_service
+
+        if self._tokens is None:
+            self._tokens = self._load_cache()
+        with self._lock:
+            rejected, self._rejected = self._rejected, set()
+
+        with api_client_factory.build_api_client() as api_client:
+            managed_tenants = [managed_tenant for managed_tenant in
+                               _list_managed_tenants(api_client) if
+                               _in_shard(managed_tenant.name)]
+            tokens = {managed_tenant.uid: self._tokens[managed_tenant.uid]
+                      for managed_tenant in managed_tenants if
+                      self._tokens.get(managed_tenant.uid) not in
+                      (None, *rejected)}
+
+            def mint(managed_tenant: MspManagedTenantDto) -> Optional[str]:
+                try:
+                    return msp_managed_tenant_token_service.\
+                        get_token_for_managed_tenant(
+                            managed_tenant, api_client, show_progress=False)
+                except Exception as e:
+                    # Left out until the next refresh tries again
+                    print(f"Failed to mint a token for {managed_tenant.name}:"
+                          f" {e}", file=sys.stderr, flush=True)
+                    return None
+
+            missing = [managed_tenant for managed_tenant in managed_tenants
+                       if managed_tenant.uid not in tokens]
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                for managed_tenant, token in zip(missing,
+                                                 executor.map(mint, missing)):
+                    if token:
+                        tokens[managed_tenant.uid] = token
+
+        if tokens != self._tokens:
+            self._tokens = tokens
+            self._save_cache()
+        return [Tenant(name=managed_tenant.name,
+                       region=managed_tenant.region.lower(),
+                       api_token=tokens[managed_tenant.uid],
+                       base_url=api_client_factory.
+                       get_base_url_for_managed_tenant(managed_tenant))
+                for managed_tenant in managed_tenants if
+                managed_tenant.uid in tokens]
+
+    def _load_cache(self) -> Dict[str, str]:
+        try:
+            with open(self._cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self) -> None:
+        temporary = self._cache_file.with_suffix(".tmp")
+        try:
+            self._cache_file.parent.mkdir(parents=True, exist_ok=True)
+            # The tokens are admin credentials for every tenant
+            with open(os.open(temporary, os.O_WRONLY | os.O_CREAT |
+                              os.O_TRUNC, 0o600), "w") as f:
+                json.dump(self._tokens, f)
+            os.replace(temporary, self._cache_file)
+        except OSError as e:
+            # The tokens are still used, but minted again after a restart
+            print(f"Failed to save tokens to {self._cache_file}: {e}",
+                  file=sys.stderr, flush=True)
+
+
+msp_tenants = MspTenants()
+
+
+def load_tenants() -> List[Tenant]:
+    """The tenants in this collector's shard."""
+    if TENANTS_SOURCE == "msp":
+        return msp_tenants.tenants()
     with open(TENANTS_FILE) as f:
         tenants = [Tenant(**t) for t in json.load(f)]
+    return [tenant for tenant in tenants if _in_shard(tenant.name)]
+
+
+def _fetch_asa(tenant: Tenant, since: Optional[datetime]) -> \
+    Tuple[Dict[str, str], List[MetricsItem]]:
+    devices = fetch_asa_devices(tenant)
+    return ({device.uid: device.name for device in devices},
+            fetch_asa_metrics(tenant, since))
+
+
+def _fmc_lines(tenant: Tenant,
+               fmc_health_metrics: List[FmcHealthMetrics]) -> List[str]:
+    lines = []
+    since = sample_windows.latest("fmc", tenant.name)
+    for device_health_metric in fmc_health_metrics:
+        end_time = device_health_metric.end_time
+        # A window shorter than the API's sampling period returns the
+        # previous sample again
+        if since is None or end_time is None or end_time > since:
+            lines.extend(fmc_metrics_to_line_protocol(tenant.name,
+                                                      device_health_metric))
+            sample_windows.advance("fmc", tenant.name, end_time)
+    lines.extend(device_names.lines(tenant.name, {
+        metric.device_uid: metric.device_name for metric in
+        fmc_health_metrics if metric.device_uid and metric.device_name},
+        "FTD"))
+    return lines
+
+
+def _asa_lines(tenant: Tenant, uid_to_name: Dict[str, str],
+               asa_metrics: List[MetricsItem]) -> List[str]:
+    lines = []
+    since = sample_windows.latest("asa", tenant.name)
+    for metrics_item in asa_metrics:
+        lines.extend(asa_metrics_to_line_protocol(tenant.name, metrics_item,
+                                                  since=since))
+    sample_windows.advance("asa", tenant.name,
+                           latest_asa_timestamp(asa_metrics))
+    lines.extend(device_names.lines(tenant.name, uid_to_name, "ASA"))
+    return lines
+
+
+def _span(name: str, category: str, **args):
+    # Replaced by profiling_service.span when run with --profile or
+    # SCCFM_PROFILE
+    return nullcontext()
+
+
+def _fetch(source: str, fetch, tenant: Tenant, *args):
+    with _span(f"fetch {source}", "fetch", tenant=tenant.name):
+        return fetch(tenant, *args)
+
+
+def _submit(executor: ThreadPoolExecutor, tenant: Tenant,
+            now: datetime) -> Dict[Future, Tuple[Tenant, str]]:
+    return {
+        executor.submit(
+            _fetch, "FMC", fetch_fmc_metrics, tenant,
+            fmc_time_range(sample_windows.latest("fmc", tenant.name), now)):
+            (tenant, "FMC"),
+        executor.submit(
+            _fetch, "ASA", _fetch_asa, tenant,
+            sample_windows.latest("asa", tenant.name)):
+            (tenant, "ASA")}
+
+
+def _convert(tenant: Tenant, source: str, result) -> List[str]:
+    with _span(f"convert {source}", "convert", tenant=tenant.name):
+        if source == "FMC":
+            return _fmc_lines(tenant, result)
+        return _asa_lines(tenant, *result)
 
-    all_lines = []
 
-    for tenant in tenants:
-        # Collect FMC-managed FTD metrics
-        fmc_health_metrics = fetch_fmc_metrics(tenant)
-        for device_health_metric in fmc_health_metrics:
-            lines = fmc_metrics_to_line_protocol(tenant.name,
-                                                 device_health_metric)
-            all_lines.extend(lines)
+def _report_failure(tenant: Tenant, source: str, error: Exception) -> None:
+    print(f"Failed to collect {source} metrics for {tenant.name}: {error}",
+          file=sys.stderr, flush=True)
+    if TENANTS_SOURCE == "msp" and isinstance(error, ApiException) and \
+        error.status == 401:
+        msp_tenants.invalidate(tenant)
 
-        # Collect ASA metrics
-        devices = fetch_asa_devices(tenant)
-        uid_to_name = {device.uid: device.name for device in devices}
-        asa_metrics = fetch_asa_metrics(tenant)
-        for metrics_item in asa_metrics:
-            lines = asa_metrics_to_line_protocol(tenant.name, metrics_item,
-                                                 uid_to_name)
-            all_lines.extend(lines)
 
-        # Rate limit: wait between tenant API calls
-        if tenant != tenants[-1]:
-            time.sleep(1)
+def scrape(tenants: List[Tenant]) -> List[str]:
+    """Fetch every tenant's FTD and ASA health concurrently, at most
+    MAX_WORKERS tenants at a time, and convert the responses as they arrive.
+    A tenant that fails is reported on stderr and skipped."""
+    all_lines = []
+    now = datetime.now(timezone.utc)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {}
+        for tenant in tenants:
+            futures.update(_submit(executor, tenant, now))
+
+        # Conversion stays on this thread, so the caches are not shared
+        for future in as_completed(futures):
+            tenant, source = futures[future]
+            try:
+                all_lines.extend(_convert(tenant, source, future.result()))
+            except Exception as e:
+                _report_failure(tenant, source, e)
+
+    return all_lines
+
+
+def _phase(tenant_name: str) -> float:
+    return int.from_bytes(hashlib.blake2b(
+        tenant_name.encode(), digest_size=8).digest(), "big") / 2 ** 64
+
+
+def backoff_seconds(tenant: Tenant, failures: int, error: Exception) -> float:
+    """Doubles with each consecutive failure, starting at the tenant's
+    interval, and honours Retry-After when the API rate limited it."""
+    backoff = min(tenant.interval * 2 ** (failures - 1), MAX_BACKOFF_SECONDS)
+    if isinstance(error, ApiException) and error.status == 429:
+        retry_after = (error.headers or {}).get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            backoff = max(backoff, float(retry_after))
+    return backoff
+
+
+@dataclass
+class _TenantSchedule:
+    tenant: Tenant
+    next_due: float
+    failures: int = 0
+    running: bool = False
+
+
+class TenantScheduler:
+    """Decides when each tenant is scraped, on the time.monotonic() clock.
+    A tenant's first scrape is at a phase within its interval taken from a
+    hash of its name, so scrapes are spread across the interval instead of
+    bursting, and it keeps that phase from then on. Failed scrapes are
+    retried after backoff_seconds."""
+
+    def __init__(self):
+        self._schedules: Dict[str, _TenantSchedule] = {}
+
+    def sync(self, tenants: List[Tenant], now: float) -> None:
+        schedules = {}
+        for tenant in tenants:
+            schedule = self._schedules.get(tenant.name)
+            if schedule is None:
+                schedule = _TenantSchedule(
+                    tenant, now + _phase(tenant.name) * tenant.interval)
+            schedule.tenant = tenant
+            schedules[tenant.name] = schedule
+        self._schedules = schedules
+
+    def due(self, now: float) -> List[Tenant]:
+        """Tenants due now, highest priority and then longest overdue
+        first."""
+        due = sorted((schedule for schedule in self._schedules.values() if
+                      not schedule.running and schedule.next_due <= now),
+                     key=lambda schedule: (-schedule.tenant.priority,
+                                           schedule.next_due))
+        return [schedule.tenant for schedule in due]
+
+    def started(self, tenant: Tenant, now: float) -> float:
+        """Marks the tenant as running and returns how late it started."""
+        schedule = self._schedules[tenant.name]
+        schedule.running = True
+        return now - schedule.next_due
+
+    def finished(self, tenant: Tenant, now: float,
+                 error: Optional[Exception] = None) -> None:
+        schedule = self._schedules.get(tenant.name)
+        if schedule is None:
+            # Removed from the tenants file while it was running
+            return
+        schedule.running = False
+        if error is None:
+            schedule.failures = 0
+            # Skip the scrapes missed when more than an interval behind
+            schedule.next_due = max(schedule.next_due + tenant.interval, now)
+        else:
+            schedule.failures += 1
+            schedule.next_due = now + backoff_seconds(tenant,
+                                                      schedule.failures, error)
+
+    def next_due(self) -> Optional[float]:
+        return min((schedule.next_due for schedule in self._schedules.values()
+                    if not schedule.running), default=None)
+
+    @property
+    def backing_off(self) -> int:
+        return sum(1 for schedule in self._schedules.values() if
+                   schedule.failures)
+
+
+def _write_lines(lines: List[str]) -> None:
+    # Blocks when Telegraf falls behind reading stdout
+    with _span("write", "write", lines=len(lines)):
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+
+def _scrape_stats_line(duration_seconds: float, tenants: int, lines: int,
+                       **fields: float) -> str:
+    # How long this shard takes, to see when it is time to add shards
+    extra = "".join(f",{key}={value}" for key, value in fields.items())
+    return (f"{SCRAPE_MEASUREMENT},shard={SHARD_INDEX} "
+            f"duration_seconds={duration_seconds:.3f},tenants={tenants},"
+            f"lines={lines},shard_count={SHARD_COUNT}{extra} "
+            f"{int(time.time() * 1_000_000_000)}")
+
+
+def _scrape_and_write(tenants: List[Tenant]) -> None:
+    start = time.perf_counter()
+    lines = scrape(tenants)
+    lines.append(_scrape_stats_line(time.perf_counter() - start, len(tenants),
+                                    len(lines)))
+    _write_lines(lines)
+
+
+def _check_config() -> None:
+    if not 0 <= SHARD_INDEX < SHARD_COUNT:
+        print(f"SHARD_INDEX must be between 0 and SHARD_COUNT - 1, got "
+              f"{SHARD_INDEX} with SHARD_COUNT {SHARD_COUNT}", file=sys.stderr)
+        sys.exit(1)
+    if TENANTS_SOURCE not in ("file", "msp"):
+        print(f"TENANTS_SOURCE must be file or msp, got {TENANTS_SOURCE}",
+              file=sys.stderr)
+        sys.exit(1)
+    if TENANTS_SOURCE == "msp" and not os.getenv("SCCFM_API_TOKEN"):
+        print("SCCFM_API_TOKEN must be set to an MSP portal token when "
+              "TENANTS_SOURCE is msp", file=sys.stderr)
+        sys.exit(1)
+
+
+def main():
+    _check_config()
+    if TENANTS_SOURCE == "file" and not TENANTS_FILE.exists():
+        print(f"Tenants file not found: {TENANTS_FILE}", file=sys.stderr)
+        sys.exit(1)
 
-    for line in all_lines:
-        print(line)
+    _scrape_and_write(load_tenants())
+
+
+def run_daemon():
+    """Telegraf execd mode (signal = "STDIN"): scrape whenever Telegraf writes
+    a line to stdin. The process, its tag prefix cache and its sample windows
+    live across scrapes, so each scrape only fetches the delta since the
+    previous one. The tenants file is re-read every time, and the MSP
+    portal's managed tenants listed again when MSP_REFRESH_SECONDS is up."""
+    _check_config()
+    for _ in sys.stdin:
+        try:
+            tenants = load_tenants()
+            _scrape_and_write(tenants)
+            tenant_names = [tenant.name for tenant in tenants]
+            sample_windows.retain(tenant_names)
+            device_names.retain(tenant_names)
+        except Exception as e:
+            # Keep the daemon alive; Telegraf logs stderr
+            print(f"Scrape failed: {e}", file=sys.stderr, flush=True)
+        tag_prefixes.retain_seen()
+
+
+def _reload_tenants(scheduler: TenantScheduler, loading: Future,
+                    now: float) -> None:
+    try:
+        tenants = loading.result()
+    except Exception as e:
+        # Keep the previous tenants
+        print(f"Failed to load tenants: {e}", file=sys.stderr, flush=True)
+        return
+    scheduler.sync(tenants, now)
+    tenant_names = [tenant.name for tenant in tenants]
+    sample_windows.retain(tenant_names)
+    device_names.retain(tenant_names)
+
+
+def run_scheduler():
+    """Telegraf execd mode with signal = "none": the collector schedules its
+    own scrapes with a TenantScheduler and writes each tenant's lines as soon
+    as they are converted. At most MAX_WORKERS tenants are scraped at once.
+    Every STATS_SECONDS it writes a collector_scrape point with the tenants
+    scraped, the longest scrape, the worst start delay and the tenants
+    backing off. Tenants are loaded on a thread of their own, as listing
+    the MSP portal's tenants and minting their tokens can take a while, and
+    scraping carries on meanwhile."""
+    _check_config()
+    scheduler = TenantScheduler()
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    loader = ThreadPoolExecutor(max_workers=1)
+    loading: Optional[Future] = None
+    pending: Dict[Future, Tuple[Tenant, str]] = {}
+    # Per running tenant: futures left, first error and start time
+    running: Dict[str, list] = {}
+    reload_at = stats_at = prune_at = 0.0
+    scraped = lines_written = 0
+    longest = lag = 0.0
+
+    while True:
+        now = time.monotonic()
+        if loading is None and now >= reload_at:
+            loading = loader.submit(load_tenants)
+            reload_at = now + TENANTS_RELOAD_SECONDS
+        if loading is not None and loading.done():
+            _reload_tenants(scheduler, loading, now)
+            loading = None
+        if now >= stats_at:
+            if stats_at:
+                _write_lines([_scrape_stats_line(
+                    longest, scraped, lines_written, lag_seconds=round(lag, 3),
+                    backing_off=scheduler.backing_off)])
+            scraped = lines_written = 0
+            longest = lag = 0.0
+            stats_at = now + STATS_SECONDS
+        if now >= prune_at:
+            tag_prefixes.retain_seen()
+            prune_at = now + NAME_REFRESH_SECONDS
+
+        for tenant in scheduler.due(now):
+            if len(running) >= MAX_WORKERS:
+                break
+            lag = max(lag, scheduler.started(tenant, now))
+            pending.update(_submit(executor, tenant,
+                                   datetime.now(timezone.utc)))
+            running[tenant.name] = [2, None, now]
+
+        # Wake for the next due tenant, the next reload or stats point, or
+        # as soon as a fetch completes. A reload in progress is polled every
+        # second
+        wake_at = min(stats_at if loading else reload_at, stats_at,
+                      scheduler.next_due() or stats_at)
+        timeout = min(max(wake_at - time.monotonic(), 0.05), 1.0)
+        if not pending:
+            time.sleep(timeout)
+            continue
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+        lines = []
+        for future in done:
+            tenant, source = pending.pop(future)
+            state = running[tenant.name]
+            try:
+                lines.extend(_convert(tenant, source, future.result()))
+            except Exception as e:
+                _report_failure(tenant, source, e)
+                state[1] = state[1] or e
+            state[0] -= 1
+            if state[0] == 0:
+                del running[tenant.name]
+                finished_at = time.monotonic()
+                scheduler.finished(tenant, finished_at, state[1])
+                scraped += 1
+                longest = max(longest, finished_at - state[2])
+        if lines:
+            _write_lines(lines)
+            lines_written += len(lines)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--daemon", action="store_true",
+                      help="Run under Telegraf's execd input and scrape on "
+                           "every line received on stdin")
+    mode.add_argument("--scheduler", action="store_true",
+                      help="Run under Telegraf's execd input and scrape each "
+                           "tenant at its own interval")
+    parser.add_argument("--profile", nargs="?", const="", metavar="PREFIX",
+                        help="Write a Chrome trace and per-endpoint latency "
+                             "histograms to PREFIX.trace.json and "
+                             "PREFIX.latency.json on exit; can also be "
+                             "enabled with SCCFM_PROFILE")
+    args = parser.parse_args()
+    if args.profile is not None or os.getenv("SCCFM_PROFILE"):
+        # Imported only when profiling, from the repository's services
+        from services import profiling_service
+        profiling_service.enable_if_requested(args.profile)
+        _span = profiling_service.span
+    if args.scheduler:
+        run_scheduler()
+    elif args.daemon:
+        run_daemon()
+    else:
+        main()
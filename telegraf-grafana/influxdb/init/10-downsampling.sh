@@ -0,0 +1,16 @@
+#!/bin/bash
+# Creates the downsampled buckets and the tasks that fill them. The influxdb
+# image runs this once, after setting up a new instance. For an existing
+# instance, run it in the container with INFLUX_HOST and INFLUX_TOKEN set.
+set -e
+
+influx bucket create --org "${DOCKER_INFLUXDB_INIT_ORG}" \
+    --name "${DOCKER_INFLUXDB_INIT_BUCKET}_5m" \
+    --retention 90d
+influx bucket create --org "${DOCKER_INFLUXDB_INIT_ORG}" \
+    --name "${DOCKER_INFLUXDB_INIT_BUCKET}_1h" \
+    --retention 400d
+
+for task in /etc/influxdb/tasks/*.flux; do
+    influx task create --org "${DOCKER_INFLUXDB_INIT_ORG}" --file "${task}"
+done
@@ -0,0 +1,65 @@
+#!/bin/bash
+# Migrates health metrics written before deviceName and interfaceName were
+# dropped from the tags. Every device's newest name across the buckets is
+# written to the device_info lookup, and each bucket's points are rewritten
+# without those tags, which merges series that were split by renames.
+#
+# Stop Telegraf first, then run inside the influxdb container with
+# INFLUX_HOST, INFLUX_TOKEN and INFLUX_ORG set (see README.md). The
+# downsampling tasks are paused while it runs.
+set -euo pipefail
+
+BUCKET="${DOCKER_INFLUXDB_INIT_BUCKET:-cl_emear_bucket}"
+MEASUREMENTS="fmc_health_metrics fmc_interface_metrics fmc_vpn_metrics asa_health_metrics"
+TASK_IDS=$(influx task list --hide-headers | awk '$2 ~ /^downsample_/ {print $1}')
+
+set_tasks() {
+    for id in ${TASK_IDS}; do
+        influx task update --id "${id}" --status "$1" > /dev/null
+    done
+}
+set_tasks inactive
+trap 'set_tasks active' EXIT
+
+# One query across all buckets, as the points written last would otherwise
+# win, whichever bucket holds a device's newest name
+echo "Writing device names to device_info"
+influx query --raw "
+names = (bucket) => from(bucket: bucket)
+    |> range(start: 0)
+    |> filter(fn: (r) => r._measurement =~ /^(fmc|asa)_/ and exists r.deviceName)
+    |> last()
+    |> keep(columns: [\"_time\", \"tenant\", \"deviceUid\", \"deviceName\"])
+
+union(tables: [names(bucket: \"${BUCKET}\"), names(bucket: \"${BUCKET}_5m\"),
+        names(bucket: \"${BUCKET}_1h\")])
+    |> group(columns: [\"tenant\", \"deviceUid\"])
+    |> sort(columns: [\"_time\"])
+    |> last(column: \"_time\")
+    |> map(fn: (r) => ({_time: now(), _measurement: \"device_info\", tenant: r.tenant,
+        deviceUid: r.deviceUid, _field: \"name\", _value: r.deviceName}))
+    |> to(bucket: \"${BUCKET}\")" > /dev/null
+
+for bucket in "${BUCKET}" "${BUCKET}_5m" "${BUCKET}_1h"; do
+    echo "Migrating ${bucket}"
+    influx bucket create --name "${bucket}_migration" > /dev/null
+    influx query --raw "
+from(bucket: \"${bucket}\")
+    |> range(start: 0)
+    |> filter(fn: (r) => r._measurement =~ /^(fmc|asa)_/)
+    |> drop(fn: (column) => column == \"deviceName\" or column == \"interfaceName\")
+    |> to(bucket: \"${bucket}_migration\")" > /dev/null
+
+    stop=$(date -u +%Y-%m-%dT%H:%M:%SZ)
+    for measurement in ${MEASUREMENTS}; do
+        influx delete --bucket "${bucket}" --start 1970-01-01T00:00:00Z \
+            --stop "${stop}" --predicate "_measurement=\"${measurement}\""
+    done
+
+    influx query --raw "
+from(bucket: \"${bucket}_migration\")
+    |> range(start: 0)
+    |> to(bucket: \"${bucket}\")" > /dev/null
+    influx bucket delete --name "${bucket}_migration" > /dev/null
+done
+echo "Done"
@@ -2,7 +2,9 @@
   {
     "name": "tenant1",
     "region": "int",
-    "api_token": "your-bearer-token-1"
+    "api_token": "your-bearer-token-1",
+    "interval": 60,
+    "priority": 1
   },
   {
     "name": "tenant2",
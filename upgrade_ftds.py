@@ -1,85 +1,164 @@
+import argparse
 import sys
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
 from datetime import datetime
 from time import sleep
-from typing import List
+from typing import List, Optional, Dict, Sequence, Tuple
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
 import questionary
-from rich.console import Console
+from rich.console import Console, Group
 from rich.live import Live
 from rich.table import Table
-from scc_firewall_manager_sdk import MSPDeviceUpgradesApi, \
-    MspCalculateCompatibleUpgradeVersionsInput, CdoTransaction, \
-    CompatibleVersionInfoDto, MSPInventoryApi, MspManagedDevice, \
-    MspUpgradeFtdDevicesInput
+from scc_firewall_manager_sdk import MSPDeviceUpgradesApi, CdoTransaction, \
+    MSPInventoryApi, MspManagedDevice, MspUpgradeFtdDevicesInput, \
+    TransactionsApi
+from scc_firewall_manager_sdk.exceptions import ApiException
 
 from factories import api_client_factory
-from services import transaction_service
-
-
-def _build_upgrade_status_table(upgrade_run) -> Table:
-    status_colors = {
-        'PENDING': 'yellow',
-        'IN_PROGRESS': 'blue',
-        'UPGRADE_STAGED': 'cyan',
-        'UPGRADE_COMPLETED': 'green',
-        'UPGRADE_FAILED': 'red',
-        'UPGRADE_STAGING_FAILED': 'red',
-    }
-    overall_color = status_colors.get(upgrade_run.upgrade_run_status, 'white')
-
-    table = Table(
-        title=f"Upgrade Status: [{overall_color}]{upgrade_run.upgrade_run_status}[/{overall_color}]")
+from services import upgrade_wave_service, compatible_version_cache_service, \
+    upgrade_plan_service, profiling_service
+from services.compatible_version_cache_service import CompatibleVersion
+from services.upgrade_plan_service import UpgradePlanSettings
+from services.upgrade_status_service import UpgradeRunStatusTracker, \
+    UpgradeEventLog, DeviceUpgradeState
+from services.upgrade_wave_service import UpgradeWave
+
+TERMINAL_UPGRADE_STATUSES = [
+    'UPGRADE_STAGED', 'UPGRADE_STAGING_FAILED',
+    'UPGRADE_COMPLETED', 'UPGRADE_FAILED'
+]
+FAILED_UPGRADE_STATUSES = ['UPGRADE_STAGING_FAILED', 'UPGRADE_FAILED']
+# Fetch the full upgrade run at least this often, even if its transaction is unchanged
+FULL_REFRESH_POLLS = 6
+# Consecutive failed polls of a submitted upgrade run (about five minutes) before
+# it is given up on; the run itself carries on regardless
+MAX_POLL_ERRORS = 60
+STATUS_COLORS = {
+    'PENDING': 'yellow',
+    'IN_PROGRESS': 'blue',
+    'UPGRADE_STAGED': 'cyan',
+    'UPGRADE_COMPLETED': 'green',
+    'UPGRADE_FAILED': 'red',
+    'UPGRADE_STAGING_FAILED': 'red',
+    'SUBMISSION_FAILED': 'red',
+    'POLLING_FAILED': 'red',
+}
+
+
+@dataclass
+class UpgradeRunProgress:
+    wave_name: str
+    run_name: str
+    device_uids: List[str]
+    stage_upgrade_only: bool = False
+    upgrade_run_uid: Optional[str] = None
+    status: str = 'SUBMITTING'
+    completed: int = 0
+    failed: int = 0
+    message: str = "-"
+
+
+def _render_device_row(device: DeviceUpgradeState) -> Tuple[str, str, str, str]:
+    device_color = STATUS_COLORS.get(device.status, 'white')
+    return (device.name, device.tenant,
+            f"[{device_color}]{device.status}[/{device_color}]",
+            device.message)
+
+
+def _build_device_table(title: str, rows: List[Tuple[str, str, str, str]]) -> Table:
+    table = Table(title=title)
     table.add_column("Device", style="cyan")
     table.add_column("Tenant", style="magenta")
     table.add_column("Status", style="bold")
     table.add_column("Message")
-
-    for device in upgrade_run.metadata.devices:
-        device_color = status_colors.get(device.upgrade_run_status, 'white')
-        message = "-"
-        if device.completion_statuses:
-            latest = device.completion_statuses[-1]
-            message = latest.message or "-"
-        table.add_row(
-            device.name or "-",
-            device.managed_tenant_display_name or "-",
-            f"[{device_color}]{device.upgrade_run_status}[/{device_color}]",
-            message
-        )
+    for row in rows:
+        table.add_row(*row)
     return table
 
 
-def _wait_for_upgrade_to_complete(transaction: CdoTransaction) -> None:
-    terminal_statuses = [
-        'UPGRADE_STAGED', 'UPGRADE_STAGING_FAILED',
-        'UPGRADE_COMPLETED', 'UPGRADE_FAILED'
-    ]
+@profiling_service.traced("render")
+def _build_upgrade_status_table(tracker: UpgradeRunStatusTracker,
+                                rendered_rows: Dict[str, Tuple[str, str, str, str]],
+                                page_size: int):
+    overall_color = STATUS_COLORS.get(tracker.run_status, 'white')
+    title = f"Upgrade Status: [{overall_color}]{tracker.run_status}[/{overall_color}]"
+    if len(rendered_rows) <= page_size:
+        return _build_device_table(title, list(rendered_rows.values()))
+
+    summary = Table(title=title)
+    summary.add_column("Status", style="bold")
+    summary.add_column("Devices", justify="right")
+    for status, count in sorted(tracker.status_counts().items()):
+        color = STATUS_COLORS.get(status, 'white')
+        summary.add_row(f"[{color}]{status}[/{color}]", str(count))
+
+    # Failed devices are always shown first, followed by the latest changes
+    failed_uids = [uid for uid in tracker.recently_changed if
+                   tracker.devices[uid].status in FAILED_UPGRADE_STATUSES]
+    other_uids = [uid for uid in tracker.recently_changed if
+                  tracker.devices[uid].status not in FAILED_UPGRADE_STATUSES]
+    page_uids = (failed_uids + other_uids)[:page_size]
+    page = _build_device_table(
+        f"Recently changed devices ({len(page_uids)} of {len(rendered_rows)})",
+        [rendered_rows[uid] for uid in page_uids])
+    return Group(summary, page)
+
+
+@profiling_service.traced("wait")
+def _wait_for_upgrade_to_complete(transaction: CdoTransaction,
+                                  page_size: int = 50,
+                                  event_log: Optional[UpgradeEventLog] = None) -> None:
     with api_client_factory.build_api_client() as api_client:
         msp_device_upgrades_api = MSPDeviceUpgradesApi(api_client)
-        upgrade_run = msp_device_upgrades_api.get_msp_device_upgrade_run(
-            transaction.entity_uid)
+        transactions_api = TransactionsApi(api_client)
+        tracker = UpgradeRunStatusTracker(transaction.entity_uid, event_log)
+        tracker.update(msp_device_upgrades_api.get_msp_device_upgrade_run(
+            transaction.entity_uid))
+        rendered_rows = {uid: _render_device_row(device) for uid, device in
+                         tracker.devices.items()}
+        last_transaction_update = transaction.last_updated_time
+        polls_since_fetch = 0
 
-        with Live(_build_upgrade_status_table(upgrade_run),
+        with Live(_build_upgrade_status_table(tracker, rendered_rows, page_size),
                   refresh_per_second=1) as live:
-            while upgrade_run.upgrade_run_status not in terminal_statuses:
+            while tracker.run_status not in TERMINAL_UPGRADE_STATUSES:
                 sleep(5)
-                upgrade_run = msp_device_upgrades_api.get_msp_device_upgrade_run(
-                    transaction.entity_uid)
-                live.update(_build_upgrade_status_table(upgrade_run))
+                polls_since_fetch += 1
+                # Polling the transaction is cheap; only fetch the full upgrade run
+                # when the transaction has moved on, or periodically as a safety net
+                transaction = transactions_api.get_transaction(
+                    transaction.transaction_uid)
+                if transaction.last_updated_time == last_transaction_update \
+                    and polls_since_fetch < FULL_REFRESH_POLLS:
+                    continue
+                last_transaction_update = transaction.last_updated_time
+                polls_since_fetch = 0
+
+                transitions = tracker.update(
+                    msp_device_upgrades_api.get_msp_device_upgrade_run(
+                        transaction.entity_uid))
+                if not transitions:
+                    continue
+                for transition in transitions:
+                    if transition.device_uid:
+                        rendered_rows[transition.device_uid] = _render_device_row(
+                            tracker.devices[transition.device_uid])
+                live.update(
+                    _build_upgrade_status_table(tracker, rendered_rows, page_size))
 
         console = Console()
-        if upgrade_run.upgrade_run_status in ['UPGRADE_COMPLETED',
-                                              'UPGRADE_STAGED']:
+        if tracker.run_status in ['UPGRADE_COMPLETED', 'UPGRADE_STAGED']:
             console.print("[bold green]Upgrade completed successfully!")
         else:
-            console.print(
-                f"[bold red]Upgrade failed: {upgrade_run.upgrade_run_status}")
+            console.print(f"[bold red]Upgrade failed: {tracker.run_status}")
 
 
+@profiling_service.traced("input")
 def _select_ftds(ftd_devices: List[MspManagedDevice]) -> List[str]:
     device_choices = [
         f"{d.name} (version: {d.software_version}, UID: {d.uid}) - Tenant: {d.managed_tenant_display_name}"
@@ -100,6 +179,7 @@ def _get_online_cdfmc_managed_ftd_devices() -> List[MspManagedDevice]:
         msp_inventory_api = MSPInventoryApi(api_client)
         while count is None or len(online_cdfmc_managed_ftd_devices) < count:
             device_page = msp_inventory_api.get_msp_managed_devices(
+                limit=str(limit), offset=str(offset),
                 q="deviceType:CDFMC_MANAGED_FTD AND connectivityState:ONLINE")
             online_cdfmc_managed_ftd_devices.extend(device_page.items)
             offset += limit
@@ -111,45 +191,443 @@ def _get_online_cdfmc_managed_ftd_devices() -> List[MspManagedDevice]:
     return online_cdfmc_managed_ftd_devices
 
 
-def _perform_upgrade(ftd_device_uids: List[str], software_version: str) -> None:
+def _perform_upgrade(ftd_device_uids: List[str], software_version: str,
+                     page_size: int = 50,
+                     event_log: Optional[UpgradeEventLog] = None) -> None:
     with api_client_factory.build_api_client() as api_client:
         device_upgrade_api = MSPDeviceUpgradesApi(api_client)
         transaction = device_upgrade_api.upgrade_msp_managed_ftd_devices(
             MspUpgradeFtdDevicesInput(
                 name=f"Upgrade FTDs on {datetime.now().isoformat()}",
                 deviceUids=ftd_device_uids, softwareVersion=software_version))
-        _wait_for_upgrade_to_complete(transaction)
+        _wait_for_upgrade_to_complete(transaction, page_size=page_size,
+                                      event_log=event_log)
 
 
-def upgrade_ftds() -> None:
-    online_cdfmc_managed_ftd_devices = _get_online_cdfmc_managed_ftd_devices()
-    ftd_uids = _select_ftds(online_cdfmc_managed_ftd_devices)
+@profiling_service.traced("render")
+def _build_orchestration_table(progresses: List[UpgradeRunProgress]) -> Table:
+    table = Table(title="Staged Upgrade Status")
+    table.add_column("Wave", style="magenta")
+    table.add_column("Run", style="cyan")
+    table.add_column("Devices", justify="right")
+    table.add_column("Status", style="bold")
+    table.add_column("Completed", justify="right", style="green")
+    table.add_column("Failed", justify="right", style="red")
+    table.add_column("Message")
 
+    for progress in progresses:
+        color = STATUS_COLORS.get(progress.status, 'white')
+        run_type = " (stage only)" if progress.stage_upgrade_only else ""
+        table.add_row(
+            progress.wave_name,
+            f"{progress.run_name}{run_type}",
+            str(len(progress.device_uids)),
+            f"[{color}]{progress.status}[/{color}]",
+            str(progress.completed),
+            str(progress.failed),
+            progress.message
+        )
+    return table
+
+
+def _update_progress(progress: UpgradeRunProgress,
+                     tracker: UpgradeRunStatusTracker, upgrade_run) -> None:
+    if not tracker.update(upgrade_run):
+        return
+    status_counts = tracker.status_counts()
+    progress.status = tracker.run_status
+    progress.completed = sum([status_counts.get(status, 0) for status in
+                              ['UPGRADE_COMPLETED', 'UPGRADE_STAGED']])
+    progress.failed = sum([status_counts.get(status, 0) for status in
+                           FAILED_UPGRADE_STATUSES])
+    progress.message = upgrade_run.error_msg or "-"
+
+
+def _is_transient_poll_error(e: Exception) -> bool:
+    # Other client errors, such as an expired token, will not go away by
+    # polling again
+    return not (isinstance(e, ApiException) and e.status is not None and
+                400 <= e.status < 500 and e.status != 429)
+
+
+@profiling_service.traced("wait")
+def _run_upgrade(progress: UpgradeRunProgress, software_version: str,
+                 event_log: Optional[UpgradeEventLog] = None) -> None:
     with api_client_factory.build_api_client() as api_client:
         device_upgrades_api = MSPDeviceUpgradesApi(api_client)
-        transaction = device_upgrades_api.calculate_msp_ftd_compatible_upgrade_versions(
-            MspCalculateCompatibleUpgradeVersionsInput(
-                deviceUids=ftd_uids
-            ))
-        transaction = transaction_service.wait_for_transaction_to_finish(transaction)
-
-        compatible_versions: List[
-            CompatibleVersionInfoDto] = device_upgrades_api.get_msp_ftd_compatible_upgrade_versions(
-            transaction.entity_uid).compatible_versions
-
-        version_choices = [
-            f"{v.software_version} *" if v.is_suggested_version else v.software_version
-            for v in compatible_versions
-        ]
-        selected_version = questionary.select(
-            "Select a version to upgrade to:",
-            choices=version_choices
-        ).ask()
-
-        selected_version = selected_version.rstrip(" *")
-        print(f"Upgrading to version {selected_version}")
-        _perform_upgrade(ftd_uids, selected_version)
+        try:
+            transaction = device_upgrades_api.upgrade_msp_managed_ftd_devices(
+                MspUpgradeFtdDevicesInput(
+                    name=f"{progress.run_name} on {datetime.now().isoformat()}",
+                    deviceUids=progress.device_uids,
+                    softwareVersion=software_version,
+                    stageUpgradeOnly=progress.stage_upgrade_only))
+        except Exception as e:
+            progress.status = 'SUBMISSION_FAILED'
+            progress.failed = len(progress.device_uids)
+            progress.message = str(e)
+            return
+
+        # The upgrade is running from here on, so polling errors are retried
+        # rather than reported as a failed submission
+        progress.upgrade_run_uid = transaction.entity_uid
+        tracker = UpgradeRunStatusTracker(transaction.entity_uid, event_log)
+        poll_errors = 0
+        while True:
+            try:
+                upgrade_run = device_upgrades_api.get_msp_device_upgrade_run(
+                    transaction.entity_uid)
+            except Exception as e:
+                poll_errors += 1
+                if poll_errors >= MAX_POLL_ERRORS or \
+                    not _is_transient_poll_error(e):
+                    # Devices not known to have finished count as failed, so
+                    # the health gate holds back the next wave
+                    progress.status = 'POLLING_FAILED'
+                    progress.failed = len(progress.device_uids) - \
+                                      progress.completed
+                    progress.message = f"Lost track of upgrade run " \
+                                       f"{transaction.entity_uid}: {e}"
+                    return
+                progress.message = f"Polling failed ({poll_errors}), " \
+                                   f"retrying: {e}"
+                sleep(5)
+                continue
+
+            if poll_errors:
+                poll_errors = 0
+                progress.message = upgrade_run.error_msg or "-"
+            _update_progress(progress, tracker, upgrade_run)
+            if upgrade_run.upgrade_run_status in TERMINAL_UPGRADE_STATUSES:
+                return
+            sleep(5)
+
+
+def _submit_wave(executor: ThreadPoolExecutor, wave: UpgradeWave,
+                 software_version: str, parallel_runs: int,
+                 progresses: List[UpgradeRunProgress],
+                 stage_upgrade_only: bool = False,
+                 event_log: Optional[UpgradeEventLog] = None) -> List[Future]:
+    futures = []
+    run_uids = upgrade_wave_service.split_wave_into_runs(wave, parallel_runs)
+    for index, device_uids in enumerate(run_uids):
+        progress = UpgradeRunProgress(
+            wave_name=wave.name,
+            run_name=f"Upgrade FTDs {wave.name} run {index + 1}",
+            device_uids=device_uids,
+            stage_upgrade_only=stage_upgrade_only)
+        progresses.append(progress)
+        futures.append(executor.submit(_run_upgrade, progress, software_version,
+                                       event_log))
+    return futures
+
+
+def _get_offline_device_uids(device_uids: List[str]) -> List[str]:
+    online_device_uids = set()
+    with api_client_factory.build_api_client() as api_client:
+        msp_inventory_api = MSPInventoryApi(api_client)
+        for i in range(0, len(device_uids), 50):
+            uid_query = " OR ".join(
+                [f"uid:{uid}" for uid in device_uids[i:i + 50]])
+            device_page = msp_inventory_api.get_msp_managed_devices(
+                limit="50", offset="0",
+                q=f"connectivityState:ONLINE AND ({uid_query})")
+            online_device_uids.update(
+                [device.uid for device in device_page.items])
+    return [uid for uid in device_uids if uid not in online_device_uids]
+
+
+def _wave_passes_health_gate(wave: UpgradeWave,
+                             wave_progresses: List[UpgradeRunProgress],
+                             max_failed_devices: int,
+                             staging_progresses: Sequence[UpgradeRunProgress] = ()) -> bool:
+    console = Console()
+    failed = sum([progress.failed for progress in wave_progresses])
+    # Devices of the next wave whose image failed to stage would fail its
+    # upgrade too
+    failed_staging = sum([progress.failed for progress in staging_progresses])
+    offline_device_uids = _get_offline_device_uids(wave.device_uids)
+    if failed + failed_staging + len(offline_device_uids) > max_failed_devices:
+        console.print(
+            f"[bold red]{wave.name} failed its health gate: {failed} device(s) "
+            f"failed to upgrade, {failed_staging} device(s) of the next wave "
+            f"failed to stage, {len(offline_device_uids)} device(s) offline "
+            f"(at most {max_failed_devices} allowed)")
+        return False
+    console.print(f"[bold green]{wave.name} passed its health gate")
+    return True
+
+
+@profiling_service.traced("wait")
+def _wait_for_futures(futures: List[Future], live: Live,
+                      progresses: List[UpgradeRunProgress]) -> None:
+    while not all(future.done() for future in futures):
+        live.update(_build_orchestration_table(progresses))
+        sleep(1)
+    live.update(_build_orchestration_table(progresses))
+
+
+def _perform_staged_upgrade(waves: List[UpgradeWave], software_version: str,
+                            parallel_runs: int = 1,
+                            max_failed_devices: int = 0,
+                            prestage: bool = False,
+                            event_log: Optional[UpgradeEventLog] = None) -> bool:
+    progresses: List[UpgradeRunProgress] = []
+    max_workers = parallel_runs * 2 if prestage else parallel_runs
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+        Live(_build_orchestration_table(progresses),
+             refresh_per_second=1) as live:
+        for index, wave in enumerate(waves):
+            first_progress = len(progresses)
+            upgrade_futures = _submit_wave(executor, wave, software_version,
+                                           parallel_runs, progresses,
+                                           event_log=event_log)
+            wave_progresses = progresses[first_progress:]
+            first_progress = len(progresses)
+            staging_futures = []
+            if prestage and index + 1 < len(waves):
+                staging_futures = _submit_wave(executor, waves[index + 1],
+                                               software_version, parallel_runs,
+                                               progresses,
+                                               stage_upgrade_only=True,
+                                               event_log=event_log)
+            staging_progresses = progresses[first_progress:]
+
+            # The next wave must not be installed while its image is still
+            # staging, and staging failures count towards the health gate
+            _wait_for_futures(upgrade_futures + staging_futures, live,
+                              progresses)
+            if not _wave_passes_health_gate(wave, wave_progresses,
+                                            max_failed_devices,
+                                            staging_progresses):
+                return False
+    return True
+
+
+def upgrade_ftds(wave_strategy: str = "single", wave_size: int = 50,
+                 canary_size: int = 1, parallel_runs: int = 1,
+                 max_failed_devices: int = 0, prestage: bool = False,
+                 status_page_size: int = 50,
+                 events_file: Optional[str] = None,
+                 versions_cache_ttl_seconds: int = compatible_version_cache_service.DEFAULT_TTL_SECONDS,
+                 refresh_versions_cache: bool = False) -> None:
+    online_cdfmc_managed_ftd_devices = _get_online_cdfmc_managed_ftd_devices()
+    ftd_uids = _select_ftds(online_cdfmc_managed_ftd_devices)
+    selected_devices = [d for d in online_cdfmc_managed_ftd_devices if
+                        d.uid in ftd_uids]
+
+    compatible_versions: List[
+        CompatibleVersion] = compatible_version_cache_service.get_compatible_versions(
+        selected_devices, ttl_seconds=versions_cache_ttl_seconds,
+        refresh=refresh_versions_cache)
+    if not compatible_versions:
+        print("No upgrade version is compatible with all of the selected FTDs.")
+        sys.exit(1)
+
+    version_choices = [
+        f"{v.software_version} *" if v.is_suggested_version else v.software_version
+        for v in compatible_versions
+    ]
+    selected_version = questionary.select(
+        "Select a version to upgrade to:",
+        choices=version_choices
+    ).ask()
+
+    selected_version = selected_version.rstrip(" *")
+    print(f"Upgrading to version {selected_version}")
+    waves = upgrade_wave_service.build_waves(
+        selected_devices, strategy=wave_strategy, wave_size=wave_size,
+        canary_size=canary_size)
+    _execute_upgrade(waves, selected_version, UpgradePlanSettings(
+        wave_strategy=wave_strategy, parallel_runs=parallel_runs,
+        max_failed_devices=max_failed_devices, prestage=prestage),
+                     status_page_size=status_page_size, events_file=events_file)
+
+
+def _execute_upgrade(waves: List[UpgradeWave], software_version: str,
+                     settings: UpgradePlanSettings, status_page_size: int = 50,
+                     events_file: Optional[str] = None) -> None:
+    event_log = UpgradeEventLog(events_file) if events_file else None
+    if len(waves) == 1 and settings.parallel_runs == 1 and not settings.prestage:
+        _perform_upgrade(waves[0].device_uids, software_version,
+                         page_size=status_page_size, event_log=event_log)
+        return
+
+    device_count = sum([len(wave.device_uids) for wave in waves])
+    print(f"Upgrading {device_count} FTD(s) in {len(waves)} wave(s)")
+    if not _perform_staged_upgrade(waves, software_version,
+                                   parallel_runs=settings.parallel_runs,
+                                   max_failed_devices=settings.max_failed_devices,
+                                   prestage=settings.prestage,
+                                   event_log=event_log):
+        sys.exit(1)
+
+
+def _version_sort_key(software_version: str) -> List[int]:
+    return [int(part) for part in software_version.split("-")[0].split(".")
+            if part.isdigit()]
+
+
+def _choose_target_version(compatible_versions: List[CompatibleVersion],
+                           target_version: Optional[str]) -> str:
+    available_versions = [v.software_version for v in compatible_versions]
+    if target_version:
+        if target_version not in available_versions:
+            print(f"Version {target_version} is not compatible with all of the "
+                  f"planned FTDs. Compatible versions: {available_versions}")
+            sys.exit(1)
+        return target_version
+
+    suggested_versions = [v.software_version for v in compatible_versions if
+                          v.is_suggested_version]
+    return max(suggested_versions or available_versions, key=_version_sort_key)
+
+
+def plan_upgrade(plan_file: str, tenant_names: Optional[List[str]] = None,
+                 target_version: Optional[str] = None,
+                 wave_strategy: str = "single", wave_size: int = 50,
+                 canary_size: int = 1, parallel_runs: int = 1,
+                 max_failed_devices: int = 0, prestage: bool = False,
+                 versions_cache_ttl_seconds: int = compatible_version_cache_service.DEFAULT_TTL_SECONDS,
+                 refresh_versions_cache: bool = False) -> None:
+    devices = _get_online_cdfmc_managed_ftd_devices()
+    if tenant_names:
+        devices = [d for d in devices if
+                   d.managed_tenant_name in tenant_names or
+                   d.managed_tenant_display_name in tenant_names]
+    if not devices:
+        print("No online cdFMC-managed FTD devices found in the selected tenants.")
+        sys.exit(1)
+
+    versions_by_cohort = compatible_version_cache_service.get_compatible_versions_by_cohort(
+        devices, ttl_seconds=versions_cache_ttl_seconds,
+        refresh=refresh_versions_cache)
+    compatible_versions = compatible_version_cache_service.intersect_compatible_versions(
+        versions_by_cohort)
+    if not compatible_versions:
+        print("No upgrade version is compatible with all of the planned FTDs.")
+        sys.exit(1)
+
+    settings = UpgradePlanSettings(
+        wave_strategy=wave_strategy, parallel_runs=parallel_runs,
+        max_failed_devices=max_failed_devices, prestage=prestage)
+    plan = upgrade_plan_service.build_plan(
+        devices, versions_by_cohort,
+        _choose_target_version(compatible_versions, target_version),
+        upgrade_wave_service.build_waves(devices, strategy=wave_strategy,
+                                         wave_size=wave_size,
+                                         canary_size=canary_size),
+        settings)
+    upgrade_plan_service.save_plan(plan, plan_file)
+    print(f"Wrote upgrade plan for {len(plan.devices)} FTD(s) in "
+          f"{len(plan.cohorts)} cohort(s) and {len(plan.waves)} wave(s) to "
+          f"version {plan.target_version} to {plan_file}")
+
+
+def apply_upgrade_plan(plan_file: str, status_page_size: int = 50,
+                       events_file: Optional[str] = None) -> None:
+    plan = upgrade_plan_service.load_plan(plan_file)
+
+    # Devices may have gone offline or been upgraded since the plan was written
+    eligible_uids = {d.uid for d in _get_online_cdfmc_managed_ftd_devices() if
+                     d.software_version != plan.target_version}
+    waves = [UpgradeWave(name=wave.name,
+                         device_uids=[uid for uid in wave.device_uids if
+                                      uid in eligible_uids])
+             for wave in plan.waves]
+    skipped = sum([len(wave.device_uids) for wave in plan.waves]) - sum(
+        [len(wave.device_uids) for wave in waves])
+    if skipped:
+        print(f"Skipping {skipped} planned FTD(s) that are offline or already "
+              f"on version {plan.target_version}")
+    waves = [wave for wave in waves if wave.device_uids]
+    if not waves:
+        print("Nothing to upgrade.")
+        return
+
+    print(f"Applying upgrade plan {plan_file} (created {plan.created_at}): "
+          f"upgrading to version {plan.target_version}")
+    _execute_upgrade(waves, plan.target_version, plan.settings,
+                     status_page_size=status_page_size, events_file=events_file)
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def _non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative, got {value}")
+    return number
 
 
 if __name__ == "__main__":
-    upgrade_ftds()
+    parser = argparse.ArgumentParser(description="Upgrade FTD devices")
+    parser.add_argument("--wave-strategy", type=str, default="single",
+                        choices=upgrade_wave_service.WAVE_STRATEGIES,
+                        help="How to split the selected FTDs into upgrade waves")
+    parser.add_argument("--wave-size", type=_positive_int, default=50,
+                        help="Number of FTDs per wave (count and canary strategies)")
+    parser.add_argument("--canary-size", type=_non_negative_int, default=1,
+                        help="Number of FTDs in the canary wave; 0 skips the canary wave")
+    parser.add_argument("--parallel-runs", type=_positive_int, default=1,
+                        help="Number of upgrade runs to execute concurrently in each wave")
+    parser.add_argument("--max-failed-devices", type=_non_negative_int, default=0,
+                        help="Number of failed or offline FTDs a wave may have before the upgrade is halted")
+    parser.add_argument("--prestage", action="store_true",
+                        help="Stage the upgrade on the next wave while the current wave installs")
+    parser.add_argument("--status-page-size", type=_positive_int, default=50,
+                        help="Upgrade runs with more FTDs than this show a summary and the most recently changed FTDs")
+    parser.add_argument("--events-file", type=str,
+                        help="Append every upgrade status transition to this JSONL file")
+    parser.add_argument("--versions-cache-ttl", type=int,
+                        default=compatible_version_cache_service.DEFAULT_TTL_SECONDS,
+                        help="Seconds for which compatible upgrade versions are cached per (model, software version)")
+    parser.add_argument("--refresh-versions-cache", action="store_true",
+                        help="Recalculate compatible upgrade versions for every cohort")
+    parser.add_argument("--plan", type=str, metavar="PLAN_FILE",
+                        help="Write a JSON upgrade plan for all online FTDs without prompting")
+    parser.add_argument("--apply", type=str, metavar="PLAN_FILE",
+                        help="Execute a JSON upgrade plan without prompting")
+    parser.add_argument("--tenant", type=str, action="append",
+                        help="Only plan upgrades for FTDs in this tenant (name or display name). Can be repeated")
+    parser.add_argument("--target-version", type=str,
+                        help="Version to plan the upgrade to. Defaults to the latest suggested compatible version")
+    profiling_service.add_profile_argument(parser)
+    args = parser.parse_args()
+    profiling_service.enable_if_requested(args.profile)
+
+    if args.plan and args.apply:
+        parser.error("--plan and --apply cannot be used together")
+    if (args.tenant or args.target_version) and not args.plan:
+        parser.error("--tenant and --target-version can only be used with --plan")
+
+    if args.plan:
+        plan_upgrade(args.plan, tenant_names=args.tenant,
+                     target_version=args.target_version,
+                     wave_strategy=args.wave_strategy,
+                     wave_size=args.wave_size, canary_size=args.canary_size,
+                     parallel_runs=args.parallel_runs,
+                     max_failed_devices=args.max_failed_devices,
+                     prestage=args.prestage,
+                     versions_cache_ttl_seconds=args.versions_cache_ttl,
+                     refresh_versions_cache=args.refresh_versions_cache)
+    elif args.apply:
+        apply_upgrade_plan(args.apply, status_page_size=args.status_page_size,
+                           events_file=args.events_file)
+    else:
+        upgrade_ftds(wave_strategy=args.wave_strategy,
+                     wave_size=args.wave_size,
+                     canary_size=args.canary_size,
+                     parallel_runs=args.parallel_runs,
+                     max_failed_devices=args.max_failed_devices,
+                     prestage=args.prestage,
+                     status_page_size=args.status_page_size,
+                     events_file=args.events_file,
+                     versions_cache_ttl_seconds=args.versions_cache_ttl,
+                     refresh_versions_cache=args.refresh_versions_cache)